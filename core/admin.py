@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Booking, Guest, Invoice, Room, UserProfile, UserRole
+from .models import Booking, Guest, Invoice, RatePlan, Room, UserProfile, UserRole
+from .roles import get_user_role
 
 class GuestAdmin(admin.ModelAdmin):
     list_display = ('first_name', 'last_name', 'email', 'date_of_birth')
@@ -13,10 +14,11 @@ class BookingAdmin(admin.ModelAdmin):
     list_display = ('guest', 'room', 'check_in_date', 'check_out_date', 'total_price', 'is_active', 'payment_method')
     search_fields = ('guest__first_name', 'guest__last_name', 'room__number')
     list_filter = ('check_in_date', 'check_out_date', 'is_active')
+    list_select_related = ('guest', 'room')
 
     def get_queryset(self, request):
         qs = super().get_queryset(request)
-        if request.user.userprofile.role.name =='Staff':
+        if get_user_role(request.user).name == 'Staff':
             return qs.filter(guest__user=request.user) # Filter bookings for the staff member
         return qs
 
@@ -26,14 +28,20 @@ class BookingAdmin(admin.ModelAdmin):
     
     def has_add_permission(self, request):
         # Allow only managers and admins to add bookings, but only if they are logged in
-        return request.user.is_authenticated and request.user.userprofile.role.name in ['Manager', 'Admin']
+        return request.user.is_authenticated and get_user_role(request.user).name in ['Manager', 'Admin']
     
     def has_delete_permission(self, request, obj=None):
         # Allow only admins to delete bookings, but only if they are logged in
-        return request.user.is_authenticated and request.user.userprofile.role.name == ['Admin']
+        return request.user.is_authenticated and get_user_role(request.user).name == 'Admin'
+
+class RatePlanAdmin(admin.ModelAdmin):
+    list_display = ('name', 'room_type', 'start_date', 'end_date', 'weekdays', 'min_nights', 'min_occupancy',
+                    'multiplier', 'is_active')
+    list_filter = ('room_type', 'is_active')
 
 # Register your models here.
 admin.site.register(Booking, BookingAdmin)
 admin.site.register(Guest, GuestAdmin)
+admin.site.register(RatePlan, RatePlanAdmin)
 admin.site.register(UserRole)
 admin.site.register(UserProfile, UserProfileAdmin)
@@ -0,0 +1,120 @@
+import json
+import zlib
+from datetime import date, timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Q
+from django.db.models.functions import TruncMonth
+from .cache import bump_versions
+from .models import ArchivedStay, Booking, BookingArchive, Invoice, RoomNight
+
+# Stays that can no longer change: checked out or cancelled with the invoice paid, or cancelled before one was raised
+CLOSED_STAYS = Q(status__in=['checked_out', 'cancelled'], invoice__is_paid=True) | \
+    Q(status='cancelled', invoice__isnull=True)
+
+# What is kept of each stay, in this order, under the key names below, followed by the number of nights it held in
+# the availability index (fewer than booked after an early check-out), which rebuild_timeline needs
+STAY_FIELDS = ('id', 'guest_id', 'room_id', 'room__number', 'room__room_type', 'check_in_date', 'check_out_date',
+               'total_price', 'payment_method', 'status', 'invoice__amount', 'invoice__payment_method')
+STAY_KEYS = ('id', 'guest', 'room', 'room_number', 'room_type', 'check_in_date', 'check_out_date', 'total_price',
+             'payment_method', 'status', 'invoice_amount', 'invoice_payment_method', 'nights')
+
+def next_month(month):
+    return (month + timedelta(days=32)).replace(day=1)
+
+def ensure_partition(month):
+    # PostgreSQL only: the archive's partition for the month, created the first time the month is archived. The
+    # bounds are literals, DDL takes no parameters.
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS core_bookingarchive_y{month:%Y}m{month:%m} PARTITION OF core_bookingarchive "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{next_month(month).isoformat()}')"
+        )
+
+##### Writing ###########################################################################
+
+def pack(rows):
+    # Column names once, then a list per stay; dates and decimals as strings
+    return zlib.compress(json.dumps({'fields': STAY_KEYS, 'rows': rows}, default=str).encode(), 9)
+
+def unpack(data):
+    batch = json.loads(zlib.decompress(data))
+    return [dict(zip(batch['fields'], row)) for row in batch['rows']]
+
+def archivable_stays(retention_days=None):
+    if retention_days is None:
+        retention_days = settings.BOOKING_RETENTION_DAYS
+    return Booking.objects.filter(CLOSED_STAYS, check_out_date__lt=date.today() - timedelta(days=retention_days))
+
+def archivable_months(stays):
+    return list(stays.annotate(month=TruncMonth('check_in_date')).order_by('month')
+                .values_list('month', flat=True).distinct())
+
+def delete_stays(ids):
+    # Plain DELETE statements rather than QuerySet.delete(), which would send the delete signals for every stay. The
+    # stays are in the past, so the occupancy timeline, daily revenue, guest stats and event log already hold what
+    # they contributed and must keep it; the timeline and revenue rebuilds read archived stays back from the
+    # archive. Index rows and invoices first, for the foreign keys.
+    quote = connection.ops.quote_name
+    placeholders = ', '.join(['%s'] * len(ids))
+    with connection.cursor() as cursor:
+        for model, column in ((RoomNight, 'booking_id'), (Invoice, 'booking_id'), (Booking, 'id')):
+            cursor.execute(f"DELETE FROM {quote(model._meta.db_table)} WHERE {quote(column)} IN ({placeholders})", ids)
+
+def archive_month(stays, month, batch_size=5000):
+    # Moves the stays that checked in during the month into the archive, batch_size stays per archive row, all in
+    # one transaction. Returns (stays, bytes written).
+    archived = written = 0
+    with transaction.atomic():
+        ensure_partition(month)
+        stays = stays.filter(check_in_date__gte=month, check_in_date__lt=next_month(month)).order_by('pk')
+        while True:
+            rows = list(stays.select_for_update(of=('self',)).values(*STAY_FIELDS)[:batch_size])
+            if not rows:
+                break
+            ids = [row['id'] for row in rows]
+            held = dict(RoomNight.objects.filter(booking_id__in=ids).values_list('booking_id').annotate(Count('id')))
+            data = pack([[*(row[field] for field in STAY_FIELDS), held.get(row['id'], 0)] for row in rows])
+            BookingArchive.objects.create(
+                month=month,
+                bookings=len(rows),
+                revenue=sum((row['invoice__amount'] for row in rows if row['invoice__amount'] is not None),
+                            Decimal('0')),
+                last_check_out=max(row['check_out_date'] for row in rows),
+                data=data,
+            )
+            ArchivedStay.objects.bulk_create([
+                ArchivedStay(guest_id=row['guest_id'], room_type=row['room__room_type'],
+                             check_in_date=row['check_in_date'], check_out_date=row['check_out_date'])
+                for row in rows if row['status'] != 'cancelled'
+            ])
+            delete_stays(ids)
+            archived += len(rows)
+            written += len(data)
+        if archived:
+            transaction.on_commit(lambda: bump_versions(['bookings', 'archive']))
+    return archived, written
+
+##### Reading ###########################################################################
+
+def all_archived_stays(batch_size=100):
+    # Every archived stay, for the rebuilds of the tables derived from bookings
+    for data in BookingArchive.objects.order_by('month', 'pk').values_list('data', flat=True).iterator(batch_size):
+        yield from unpack(data)
+
+def archived_stays(start_date, end_date, room_type=None):
+    # Archived stays overlapping [start_date, end_date], oldest check-in first. Only the archive rows of months that
+    # can hold such a stay are read, which on PostgreSQL prunes to the partitions of those months.
+    batches = BookingArchive.objects.filter(
+        month__lte=end_date, last_check_out__gt=start_date,
+    ).order_by('month', 'pk').values_list('data', flat=True)
+    start, end = start_date.isoformat(), end_date.isoformat()
+    for data in batches.iterator():
+        for stay in unpack(data):
+            # ISO dates compare as strings
+            if stay['check_out_date'] > start and stay['check_in_date'] <= end and \
+                    (room_type is None or stay['room_type'] == room_type):
+                yield stay
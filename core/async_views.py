@@ -0,0 +1,158 @@
+import json
+from datetime import date, datetime
+from functools import wraps
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.http import HttpResponse, JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+import stripe
+from rest_framework import status
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.permissions import AllowAny, IsAuthenticated
+from .authentication import CachedJWTAuthentication
+from .models import Booking, OccupancyDay, Room
+from .occupancy import occupancy_rate
+from .payments import amount_in_cents, get_gateway, payment_intent_key
+from .permissions import IsStaff
+from .roles import resolve_role
+from .search import SEARCH_MAX_NIGHTS, search_response
+from .serializers import BookingSerializer, RoomSerializer
+
+# Async counterparts of the hot read paths in core.views, for deployments served by jolly_hms.asgi.
+# DRF views are synchronous, so these are plain Django coroutine views: authentication and permission checks
+# run here, database access goes through the async ORM, and calls to Stripe are awaited. The room search is the
+# exception, it reuses the sync search_response in one sync_to_async call (see search_available_rooms).
+
+jwt_authentication = CachedJWTAuthentication()
+
+def error_response(detail, status_code):
+    # Same body as core.exceptions.custom_exception_handler produces
+    return JsonResponse({'detail': str(detail), 'status_code': status_code}, status=status_code)
+
+async def authenticate(request):
+    header = jwt_authentication.get_header(request)
+    raw_token = header and jwt_authentication.get_raw_token(header)
+    if not raw_token:
+        return AnonymousUser(), None
+
+    # Verified once per AUTH_TOKEN_CACHE_TIMEOUT, with a cache round trip for the blocklist, then served from
+    # memory; the user comes from the claims, so no queries either way
+    token = await sync_to_async(jwt_authentication.get_validated_token)(raw_token)
+    user = jwt_authentication.get_user(token)
+
+    if 'role' not in token:
+        # Tokens minted before roles were carried in them: resolve it now so the permission check stays sync-safe
+        user._resolved_role = await sync_to_async(resolve_role)(user.pk)
+    return user, token
+
+def async_api_view(method, permission_class=IsAuthenticated):
+    def decorator(view):
+        @wraps(view)
+        async def wrapped(request, *args, **kwargs):
+            if request.method != method:
+                return error_response(f'Method "{request.method}" not allowed.', status.HTTP_405_METHOD_NOT_ALLOWED)
+
+            try:
+                request.user, request.auth = await authenticate(request)
+            except AuthenticationFailed as exc: # InvalidToken included
+                detail = exc.detail.get('detail', exc.detail) if isinstance(exc.detail, dict) else exc.detail
+                return error_response(detail, status.HTTP_401_UNAUTHORIZED)
+
+            if not permission_class().has_permission(request, None):
+                if not request.user.is_authenticated:
+                    return error_response('Authentication credentials were not provided.',
+                                          status.HTTP_401_UNAUTHORIZED)
+                return error_response('You do not have permission to perform this action.',
+                                      status.HTTP_403_FORBIDDEN)
+
+            return await view(request, *args, **kwargs)
+        return csrf_exempt(wrapped) # Bearer tokens, not cookies, like DRF's own views
+    return decorator
+
+# Search Available Rooms Function
+@async_api_view('GET', AllowAny) # Open to anonymous clients, like the sync view
+async def search_available_rooms(request):
+    check_in_date = request.GET.get('check_in_date')
+    check_out_date = request.GET.get('check_out_date')
+    room_type = request.GET.get('room_type')
+
+    # Basic validation
+    if not check_in_date or not check_out_date:
+        return JsonResponse({"error": "Please provide check-in and check-out dates."},
+                            status=status.HTTP_400_BAD_REQUEST)
+    try:
+        check_in_date = date.fromisoformat(check_in_date)
+        check_out_date = date.fromisoformat(check_out_date)
+    except ValueError:
+        return JsonResponse({"error": "Invalid date format. Please use YYYY-MM-DD format."},
+                            status=status.HTTP_400_BAD_REQUEST)
+    if check_in_date >= check_out_date:
+        return JsonResponse({"error": "Check-out date must be after check-in date."},
+                            status=status.HTTP_400_BAD_REQUEST)
+    if (check_out_date - check_in_date).days > SEARCH_MAX_NIGHTS:
+        return JsonResponse({"error": f"A search can cover at most {SEARCH_MAX_NIGHTS} nights."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+    # Not async underneath: the response cache, the availability index scan and the rate calendar are the sync
+    # view's, run in one worker thread. That keeps both views serving the same cached JSON bytes.
+    body = await sync_to_async(search_response)(check_in_date, check_out_date, room_type)
+    return HttpResponse(body, content_type='application/json')
+
+# Occupancy Rate Report Function
+@async_api_view('GET', IsStaff)
+async def occupancy_rate_report(request):
+    try:
+        report_date = datetime.strptime(request.GET.get('date'), '%Y-%m-%d').date()
+    except (ValueError, TypeError):
+        return JsonResponse({'error': 'Invalid date format. Use YYYY-MM-DD.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    total_rooms = await Room.objects.acount()
+    occupied_rooms = await OccupancyDay.objects.filter(date=report_date).values_list('rooms_sold', flat=True).afirst()
+    return JsonResponse({'date': report_date, 'occupancy_rate': occupancy_rate(occupied_rooms or 0, total_rooms)})
+
+# Room Detail Function
+@async_api_view('GET', IsStaff)
+async def room_detail(request, pk):
+    try:
+        room = await Room.objects.aget(pk=pk)
+    except Room.DoesNotExist:
+        return error_response('No Room matches the given query.', status.HTTP_404_NOT_FOUND)
+    return JsonResponse(RoomSerializer(room).data)
+
+# Booking Detail Function
+@async_api_view('GET')
+async def booking_detail(request, pk):
+    try:
+        booking = await Booking.objects.aget(pk=pk)
+    except Booking.DoesNotExist:
+        return error_response('No Booking matches the given query.', status.HTTP_404_NOT_FOUND)
+    return JsonResponse(BookingSerializer(booking).data)
+
+##### Create Payment Intent  #####
+@async_api_view('POST')
+async def create_payment_intent(request):
+    # Same contract as core.views.create_payment_intent, but the event loop keeps serving while Stripe answers
+    try:
+        data = json.loads(request.body or b'{}')
+        if 'booking' in data:
+            booking = await Booking.objects.aget(pk=data['booking'])
+            amount = amount_in_cents(booking.total_price)
+            idempotency_key = payment_intent_key(booking, amount)
+            metadata = {'booking_id': booking.pk}
+        else:
+            amount = int(data['amount'])
+            idempotency_key = request.headers.get('Idempotency-Key')
+            metadata = None
+    except Booking.DoesNotExist:
+        return JsonResponse({'error': 'Booking not found'}, status=status.HTTP_404_NOT_FOUND)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        payment_intent = await get_gateway().create_payment_intent_async(amount, idempotency_key, metadata)
+    except stripe.APIConnectionError as e:
+        return JsonResponse({'error': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    except stripe.StripeError as e:
+        return JsonResponse({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    return JsonResponse({'clientSecret': payment_intent['client_secret']})
@@ -0,0 +1,108 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.hashers import check_password, make_password
+from django.core.cache import cache
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from .cache import LRUCache
+
+# Tokens whose signature has been verified, keyed by the encoded token, so a client sending the same token again
+# costs a dictionary lookup. The timeout bounds how long a revocation takes to reach other worker processes.
+token_cache = LRUCache(settings.AUTH_TOKEN_CACHE_SIZE, ttl=settings.AUTH_TOKEN_CACHE_TIMEOUT)
+
+# Blocklist in the shared cache: one entry per revoked token id, and per user a cut-off time before which every
+# token of theirs is revoked. Entries expire with the tokens they revoke, so the list holds live tokens only.
+def revoked_token_key(jti):
+    return f'revoked:{jti}'
+
+def revoked_user_key(user_id):
+    return f'revoked-user:{user_id}'
+
+def revoke_token(token):
+    remaining = token['exp'] - int(time.time())
+    if remaining > 0:
+        cache.set(revoked_token_key(token[api_settings.JTI_CLAIM]), True, remaining)
+    token_cache.delete(token.token)
+
+def revoke_user_tokens(user_id):
+    # Every token issued to the user before this second; refresh tokens live longest. Issue times (iat) are whole
+    # seconds, so tokens from the second of the revocation stay valid: a sign-in right after it must work.
+    cache.set(revoked_user_key(user_id), int(time.time()), int(api_settings.REFRESH_TOKEN_LIFETIME.total_seconds()))
+    token_cache.clear() # Entries are keyed by token, not by user
+
+def is_revoked(token):
+    keys = [
+        revoked_token_key(token.get(api_settings.JTI_CLAIM)),
+        revoked_user_key(token.get(api_settings.USER_ID_CLAIM)),
+    ]
+    found = cache.get_many(keys)
+    return keys[0] in found or found.get(keys[1], -1) > token.get('iat', 0)
+
+class CachedJWTAuthentication(JWTStatelessUserAuthentication):
+    # JWT authentication without queries: the user is a TokenUser built from the claims (user id, username and
+    # role, see RoleTokenObtainPairSerializer), and verified tokens are remembered for AUTH_TOKEN_CACHE_TIMEOUT
+    # seconds. Checking the blocklist costs one round trip to the shared cache, on verification only.
+    def get_validated_token(self, raw_token):
+        token = token_cache.get(raw_token)
+        if token is not None and token['exp'] > time.time():
+            return token
+
+        token = super().get_validated_token(raw_token)
+        if is_revoked(token):
+            raise InvalidToken('Token has been revoked')
+        token_cache.set(raw_token, token)
+        return token
+
+class HashingBusy(Exception):
+    # The pool's queue is full. A plain exception: the backend runs outside DRF too (admin and dashboard sign-in,
+    # management commands), so the DRF sign-in and registration views turn it into a 503 themselves.
+    wait = 1 # Seconds, sent as Retry-After
+
+class HashingPool:
+    # Password hashing is deliberately slow and CPU-bound. Run on a few threads of its own, at most workers hashes
+    # use the CPU at once however many sign-ins arrive, and the request threads waiting on them leave it to the
+    # I/O-bound requests. hashlib releases the GIL while hashing, so the workers do run in parallel.
+    def __init__(self, workers, queue):
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix='hashing')
+        self.slots = threading.BoundedSemaphore(workers + queue)
+
+    def run(self, fn, *args):
+        # Sign-ins beyond the queue are turned away at once instead of tying up a request thread
+        if not self.slots.acquire(blocking=False):
+            raise HashingBusy()
+        try:
+            return self.executor.submit(fn, *args).result()
+        finally:
+            self.slots.release()
+
+hashing_pool = HashingPool(settings.PASSWORD_HASHING_WORKERS, settings.PASSWORD_HASHING_QUEUE)
+
+class PooledHashingBackend(ModelBackend):
+    # ModelBackend.authenticate with the hashing done by hashing_pool; the user is still read, and an outdated
+    # hash upgraded, in the request thread and on its database connection
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        UserModel = get_user_model()
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+
+        try:
+            user = UserModel._default_manager.get_by_natural_key(username)
+        except UserModel.DoesNotExist:
+            hashing_pool.run(make_password, password) # As long as a wrong password takes, like ModelBackend
+            return None
+
+        outdated = []
+        if hashing_pool.run(check_password, password, user.password, outdated.append) and \
+                self.user_can_authenticate(user):
+            if outdated: # Hashed with older settings or another hasher
+                user.password = hashing_pool.run(make_password, password)
+                user.save(update_fields=['password'])
+            return user
+        return None
@@ -0,0 +1,103 @@
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import ROUND_DOWN, Decimal
+from django.db import transaction
+from .models import Room, RoomNight
+
+# Booking statuses that keep a room occupied for every night of the stay
+HELD_STATUSES = ('reserved', 'checked_in')
+
+CENT = Decimal('0.01')
+
+def stay_nights(check_in_date, check_out_date):
+    # A stay occupies every night from check-in up to, but not including, the check-out day
+    return [check_in_date + timedelta(days=offset) for offset in range((check_out_date - check_in_date).days)]
+
+def nightly_amounts(amount, check_in_date, check_out_date):
+    # Spread an amount evenly over the nights of a stay; the last night takes the rounding so the parts add up exactly
+    nights = stay_nights(check_in_date, check_out_date)
+    if not nights:
+        return []
+
+    share = (amount / len(nights)).quantize(CENT, rounding=ROUND_DOWN)
+    amounts = [share] * len(nights)
+    amounts[-1] = amount - share * (len(nights) - 1)
+    return list(zip(nights, amounts))
+
+def booking_night_rows(booking):
+    # (room id, night, nightly amount) for every night of the booked stay
+    return {
+        (booking.room_id, night, amount)
+        for night, amount in nightly_amounts(booking.total_price, booking.check_in_date, booking.check_out_date)
+    }
+
+def nights_to_hold(booking, held):
+    if booking.status in HELD_STATUSES:
+        return booking_night_rows(booking)
+    if booking.status == 'checked_out':
+        # Nights already slept stay on record, anything from the check-out day on is given back
+        today = date.today()
+        return {row for row in held if row[1] < today}
+    return set() # Cancelled bookings hold nothing
+
+# Bring the availability index in line with a booking's current state.
+# Returns the booking's (room id, night, amount) rows before and after, for derived tables to diff.
+def sync_booking_nights(booking):
+    with transaction.atomic():
+        held = set(RoomNight.objects.filter(booking=booking).values_list('room_id', 'night', 'amount'))
+        wanted = nights_to_hold(booking, held)
+
+        released = held - wanted
+        released_by_room = defaultdict(list)
+        for room_id, night, _ in released:
+            released_by_room[room_id].append(night)
+        for room_id, nights in released_by_room.items():
+            RoomNight.objects.filter(booking=booking, room_id=room_id, night__in=nights).delete()
+
+        added = wanted - held
+        # Raises IntegrityError if another booking already holds one of these nights
+        RoomNight.objects.bulk_create([
+            RoomNight(room_id=room_id, booking=booking, night=night, amount=amount)
+            for room_id, night, amount in sorted(added)
+        ])
+
+    return held, wanted
+
+# Index a batch of freshly inserted bookings (bulk_create skips the post_save receiver).
+# Returns (before, after) row sets per booking, like sync_booking_nights.
+def hold_booking_nights(bookings):
+    changes = [(set(), booking_night_rows(booking)) for booking in bookings]
+    RoomNight.objects.bulk_create([
+        RoomNight(room_id=room_id, booking=booking, night=night, amount=amount)
+        for booking, (_, after) in zip(bookings, changes)
+        for room_id, night, amount in sorted(after)
+    ])
+    return changes
+
+def lock_rooms(room_ids):
+    # Row locks on the rooms being booked serialise writers per room only; always taken in id order to avoid deadlocks
+    return list(Room.objects.select_for_update().filter(pk__in=room_ids).order_by('pk').values_list('pk', flat=True))
+
+def room_is_free(room, check_in_date, check_out_date, booking=None):
+    # Nights already held by booking (one being changed) do not count against it
+    nights = RoomNight.objects.filter(
+        room=room,
+        night__gte=check_in_date,
+        night__lt=check_out_date,
+    )
+    if booking is not None:
+        nights = nights.exclude(booking=booking)
+    return not nights.exists()
+
+def booked_rooms(check_in_date, check_out_date):
+    # A single range scan over the (night, room) index finds every room taken on any night of the stay
+    return RoomNight.objects.filter(
+        night__gte=check_in_date,
+        night__lt=check_out_date,
+    ).values_list('room_id', flat=True)
+
+def available_rooms(check_in_date, check_out_date, room_type=None):
+    rooms = Room.objects.exclude(pk__in=booked_rooms(check_in_date, check_out_date))
+    if room_type:
+        rooms = rooms.filter(room_type=room_type)
+    return rooms
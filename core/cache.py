@@ -0,0 +1,127 @@
+import threading
+import time
+from collections import OrderedDict
+from django.core.cache import cache
+
+class LRUCache:
+    # Bounded, thread-safe, process-local cache; the least recently used entry is evicted first
+    # and entries older than ttl seconds (if given) are treated as missing
+    def __init__(self, maxsize, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (self.ttl is not None and entry[0] < time.monotonic()):
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        return cache_stats(self.hits, self.misses) | {
+            'evictions': self.evictions,
+            'size': len(self),
+            'maxsize': self.maxsize,
+        }
+
+# Versioned namespaces: cached entries embed the namespace version in their key, and bumping
+# the version on a write makes every older entry unreachable without having to find and delete it
+def get_version(namespace):
+    return cache.get_or_set(f'{namespace}:version', new_version, None)
+
+def bump_version(namespace):
+    key = f'{namespace}:version'
+    cache.add(key, new_version(), None)
+    try:
+        cache.incr(key)
+    except ValueError: # Evicted between add() and incr()
+        cache.set(key, new_version(), None)
+
+def new_version():
+    # The version key can be evicted like any other. Starting again from the clock in microseconds, rather than
+    # from 1, keeps it clear of every version used before, so entries stored under those stay unreachable.
+    return time.time_ns() // 1000
+
+def get_versions(namespaces):
+    # {namespace: version} for many namespaces in one round trip to the cache
+    keys = {f'{namespace}:version': namespace for namespace in namespaces}
+    versions = {keys[key]: version for key, version in cache.get_many(keys).items()}
+    for key, namespace in keys.items():
+        if namespace not in versions:
+            versions[namespace] = get_version(namespace)
+    return versions
+
+def bump_versions(namespaces):
+    for namespace in namespaces:
+        bump_version(namespace)
+
+MISSING = object()
+
+class TieredCache:
+    # Read-through cache for one namespace: a process-local LRU in front of Django's cache, which all worker
+    # processes share. Keys embed the namespace version, so invalidate() reaches every process.
+    def __init__(self, namespace, maxsize, timeout=None):
+        self.namespace = namespace
+        self.local = LRUCache(maxsize)
+        self.timeout = timeout
+        self.shared_hits = 0
+        self.shared_misses = 0
+
+    def version(self):
+        return get_version(self.namespace)
+
+    def get_or_load(self, key, load):
+        versioned_key = f'{self.namespace}:{self.version()}:{key}'
+        value = self.local.get(versioned_key, MISSING)
+        if value is MISSING:
+            value = cache.get(versioned_key, MISSING)
+            if value is MISSING:
+                self.shared_misses += 1
+                value = load()
+                cache.set(versioned_key, value, self.timeout)
+            else:
+                self.shared_hits += 1
+            self.local.set(versioned_key, value)
+        return value
+
+    def invalidate(self):
+        bump_version(self.namespace)
+        self.local.clear() # Unreachable now anyway, free the memory
+
+    def stats(self):
+        return {
+            'local': self.local.stats(),
+            'shared': cache_stats(self.shared_hits, self.shared_misses),
+        }
+
+def cache_stats(hits, misses):
+    lookups = hits + misses
+    return {'hits': hits, 'misses': misses, 'hit_rate': hits / lookups if lookups else None}
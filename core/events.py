@@ -0,0 +1,182 @@
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .models import BookingEvent, ConsumerOffset, Guest, GuestStats
+
+##### Writing ###########################################################################
+
+# Booking fields whose changes are recorded. is_active follows the status, the payment method is not tracked.
+TRACKED_FIELDS = ('guest_id', 'room_id', 'check_in_date', 'check_out_date', 'total_price', 'status')
+# Moves to these statuses are recorded as their own kind; any other change is recorded as 'updated'
+STATUS_KINDS = ('checked_in', 'checked_out', 'cancelled')
+
+def json_value(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+def event_data(kind, booking, **data):
+    # Enough for consumers to work from the event alone, since the booking may have changed or gone by then
+    data['guest'] = booking.guest_id
+    if kind in ('created', 'updated'):
+        data.update(
+            room=booking.room_id,
+            check_in=booking.check_in_date.isoformat(),
+            check_out=booking.check_out_date.isoformat(),
+            total_price=str(booking.total_price),
+        )
+    return data
+
+def record(kind, booking, **data):
+    # Call inside the transaction that makes the change, like core.outbox.enqueue, so the event is in the log if
+    # and only if the change committed
+    return BookingEvent.objects.create(booking_id=booking.pk, kind=kind, data=event_data(kind, booking, **data))
+
+def record_changes(booking, stored):
+    # Called by core.signals for every saved booking, with its tracked fields as stored before the save (None
+    # when it is new), so API, admin and shell changes all reach the log
+    if stored is None:
+        return [record('created', booking)]
+    events = []
+    if booking.status != stored['status'] and booking.status in STATUS_KINDS:
+        data = {}
+        if booking.status == 'checked_out': # Nights actually stayed, for an early check-out too
+            data['nights'] = (min(date.today(), booking.check_out_date) - booking.check_in_date).days
+        events.append(record(booking.status, booking, **data))
+        stored = {**stored, 'status': booking.status}
+    previous = {field.removesuffix('_id'): json_value(stored[field])
+                for field in TRACKED_FIELDS if getattr(booking, field) != stored[field]}
+    if previous:
+        events.append(record('updated', booking, status=booking.status, previous=previous))
+    return events
+
+def record_many(kind, bookings):
+    return BookingEvent.objects.bulk_create([
+        BookingEvent(booking_id=booking.pk, kind=kind, data=event_data(kind, booking)) for booking in bookings
+    ])
+
+##### Consuming #########################################################################
+
+# Consumer name -> instance
+CONSUMERS = {}
+
+def consumer(cls):
+    CONSUMERS[cls.name] = cls()
+    return cls
+
+class Consumer(ABC):
+    # Maintains a derived table from the event log. apply() gets the events after the consumer's offset, in log
+    # order, and runs in the transaction that moves the offset past them, so each event is applied exactly once.
+    # reset() empties the table so the log can be replayed from the start. Guest stats are the only consumer; the
+    # occupancy timeline and daily revenue are still kept inline by core.signals (core.occupancy, core.revenue).
+    name = None
+
+    @abstractmethod
+    def apply(self, events):
+        ...
+
+    @abstractmethod
+    def reset(self):
+        ...
+
+# Read from the log: a named tuple per event rather than a model instance, replays go through millions of them
+EVENT_FIELDS = ('id', 'booking_id', 'kind', 'data', 'created_at')
+
+def settled_events(position, batch_size):
+    # Ids are handed out when an event is written but become visible when its transaction commits, so a later id
+    # can be seen before an earlier one. Reading stops at the first event younger than the settle time, by which
+    # every transaction writing an earlier id has committed or rolled back.
+    settled = timezone.now() - timedelta(seconds=settings.BOOKING_EVENT_SETTLE_SECONDS)
+    events = list(BookingEvent.objects.filter(pk__gt=position).order_by('pk').values_list(
+        *EVENT_FIELDS, named=True,
+    )[:batch_size])
+    for index, event in enumerate(events):
+        if event.created_at >= settled:
+            return events[:index]
+    return events
+
+def consume(name, batch_size=5000):
+    # Applies the next batch; returns how many events that was. The offset row lock keeps two workers from
+    # running the same consumer at once.
+    with transaction.atomic():
+        offset, _ = ConsumerOffset.objects.select_for_update().get_or_create(name=name)
+        events = settled_events(offset.position, batch_size)
+        if events:
+            CONSUMERS[name].apply(events)
+            offset.position = events[-1].id
+            offset.save(update_fields=['position', 'updated_at'])
+    return len(events)
+
+def catch_up(name, batch_size=5000):
+    applied = 0
+    while count := consume(name, batch_size):
+        applied += count
+    return applied
+
+def replay(name, batch_size=5000):
+    # Rebuild from the start of the log. Readers see the table fill up again batch by batch.
+    with transaction.atomic():
+        offset, _ = ConsumerOffset.objects.select_for_update().get_or_create(name=name)
+        CONSUMERS[name].reset()
+        offset.position = 0
+        offset.save(update_fields=['position', 'updated_at'])
+    return catch_up(name, batch_size)
+
+##### Consumers #########################################################################
+
+@consumer
+class GuestStatsConsumer(Consumer):
+    # Lifetime figures count what happened: deleted bookings and statuses set back by hand stay in them, as archived
+    # stays do. A booking moved to another guest takes its booking count along, what it already added up (a
+    # cancellation, a stay, invoices) stays with the first guest.
+    name = 'guest_stats'
+    COUNTERS = ('bookings', 'cancellations', 'stays', 'nights', 'billed', 'paid')
+
+    def apply(self, events):
+        # Add up the batch per guest first, then write each guest's row once
+        deltas = defaultdict(lambda: {'bookings': 0, 'cancellations': 0, 'stays': 0, 'nights': 0,
+                                      'billed': Decimal('0'), 'paid': Decimal('0'), 'last_stay': None})
+        for event in events:
+            delta = deltas[event.data['guest']]
+            if event.kind == 'created':
+                delta['bookings'] += 1
+            elif event.kind == 'cancelled':
+                delta['cancellations'] += 1
+            elif event.kind == 'checked_out':
+                delta['stays'] += 1
+                delta['nights'] += event.data['nights']
+                delta['last_stay'] = event.created_at.date() # Events come in order
+            elif event.kind == 'invoiced':
+                delta['billed'] += Decimal(event.data['amount'])
+            elif event.kind == 'paid':
+                delta['paid'] += Decimal(event.data['amount'])
+            elif event.kind == 'updated' and 'guest' in event.data['previous']:
+                delta['bookings'] += 1
+                deltas[event.data['previous']['guest']]['bookings'] -= 1
+
+        # Only this consumer writes the table, and never twice at once (see consume), so the new totals can be
+        # computed here and written with one upsert per thousand guests
+        rows = GuestStats.objects.in_bulk(list(deltas))
+        missing = set(deltas) - set(rows)
+        # Guests deleted since their events were written have no row to keep
+        for guest_id in Guest.objects.filter(pk__in=missing).values_list('pk', flat=True):
+            rows[guest_id] = GuestStats(guest_id=guest_id)
+
+        for guest_id, row in rows.items():
+            delta = deltas[guest_id]
+            for field in self.COUNTERS:
+                setattr(row, field, getattr(row, field) + delta[field])
+            if delta['last_stay']:
+                row.last_stay = delta['last_stay']
+
+        GuestStats.objects.bulk_create(rows.values(), batch_size=1000, update_conflicts=True,
+                                       unique_fields=['guest'], update_fields=[*self.COUNTERS, 'last_stay'])
+
+    def reset(self):
+        GuestStats.objects.all().delete()
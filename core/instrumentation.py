@@ -0,0 +1,299 @@
+import cProfile
+import contextvars
+import json
+import logging
+import os
+import pstats
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import Http404, HttpResponse
+from django.utils.crypto import constant_time_compare
+from rest_framework import serializers
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds, in seconds, of the request duration histogram buckets
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Per-view counters exported besides the request count and duration: metric name, ViewMetrics attribute, help
+COUNTERS = [
+    ('db_queries_total', 'queries', "Database queries run."),
+    ('db_query_seconds_total', 'sql_seconds', "Time spent in database queries."),
+    ('serializer_seconds_total', 'serializer_seconds', "Time spent serializing response data."),
+    ('duplicate_queries_total', 'duplicate_queries', "Queries repeating the shape of an earlier one in the same request."),
+    ('profiles_total', 'profiles', "Slow requests captured with cProfile."),
+]
+
+# Statistics of the request being handled on this thread (or task)
+current_request = contextvars.ContextVar('instrumented_request', default=None)
+
+class RequestStats:
+    # Counters for one request; installed as an execute wrapper on every database connection
+    def __init__(self):
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.signatures = Counter()
+        self.serializer_seconds = 0.0
+        self.serializer_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_seconds += time.perf_counter() - started
+            self.queries += 1
+            # The ORM sends parameters separately, so the SQL text already is the query's shape
+            self.signatures[sql] += 1
+
+    def duplicates(self):
+        # Queries that repeated an earlier one with the same shape
+        return sum(count - 1 for count in self.signatures.values())
+
+    def repeated(self, threshold):
+        # Shapes run at least threshold times: usually a loop issuing one query per object (N+1)
+        return [(sql, count) for sql, count in self.signatures.most_common() if count >= threshold]
+
+class ViewMetrics:
+    def __init__(self):
+        self.requests = Counter() # (method, status) -> count
+        self.buckets = [0] * len(DURATION_BUCKETS)
+        self.seconds = 0.0
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.serializer_seconds = 0.0
+        self.duplicate_queries = 0
+        self.profiles = 0
+
+class Metrics:
+    # Aggregates per view (URL route) for the process; each worker process keeps its own
+    def __init__(self):
+        self.views = defaultdict(ViewMetrics)
+        self._lock = threading.Lock()
+
+    def record(self, view, method, status_code, seconds, stats, profiled):
+        with self._lock:
+            metrics = self.views[view]
+            metrics.requests[method, status_code] += 1
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if seconds <= bound:
+                    metrics.buckets[i] += 1
+            metrics.seconds += seconds
+            metrics.queries += stats.queries
+            metrics.sql_seconds += stats.sql_seconds
+            metrics.serializer_seconds += stats.serializer_seconds
+            metrics.duplicate_queries += stats.duplicates()
+            metrics.profiles += profiled
+
+    def clear(self):
+        with self._lock:
+            self.views.clear()
+
+    def render(self):
+        # Prometheus text exposition format, version 0.0.4
+        with self._lock:
+            views = [(escape_label(view), metrics) for view, metrics in sorted(self.views.items())]
+            lines = [
+                '# HELP jollyhms_requests_total Requests handled.',
+                '# TYPE jollyhms_requests_total counter',
+            ]
+            for view, metrics in views:
+                for (method, status_code), count in sorted(metrics.requests.items()):
+                    lines.append(f'jollyhms_requests_total{{view="{view}",method="{method}",status="{status_code}"}} {count}')
+
+            lines += [
+                '# HELP jollyhms_request_duration_seconds Time spent handling requests.',
+                '# TYPE jollyhms_request_duration_seconds histogram',
+            ]
+            for view, metrics in views:
+                total = sum(metrics.requests.values())
+                for bound, count in zip(DURATION_BUCKETS, metrics.buckets):
+                    lines.append(f'jollyhms_request_duration_seconds_bucket{{view="{view}",le="{bound}"}} {count}')
+                lines.append(f'jollyhms_request_duration_seconds_bucket{{view="{view}",le="+Inf"}} {total}')
+                lines.append(f'jollyhms_request_duration_seconds_sum{{view="{view}"}} {metrics.seconds}')
+                lines.append(f'jollyhms_request_duration_seconds_count{{view="{view}"}} {total}')
+
+            for name, attribute, description in COUNTERS:
+                lines += [f'# HELP jollyhms_{name} {description}', f'# TYPE jollyhms_{name} counter']
+                lines += [f'jollyhms_{name}{{view="{view}"}} {getattr(metrics, attribute)}' for view, metrics in views]
+        return '\n'.join(lines) + '\n'
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+metrics = Metrics()
+
+##### Serializer timing ##################################################################
+def timed_data(data_property):
+    # Wraps a serializer's .data so the outermost call's time is added to the current request; nested
+    # serializers run inside it and are not counted twice
+    def data(self):
+        stats = current_request.get()
+        if stats is None or stats.serializer_depth:
+            return data_property.fget(self)
+        stats.serializer_depth += 1
+        started = time.perf_counter()
+        try:
+            return data_property.fget(self)
+        finally:
+            stats.serializer_seconds += time.perf_counter() - started
+            stats.serializer_depth -= 1
+    data.instrumented = True
+    return property(data)
+
+def instrument_serializers():
+    # Serializer and ListSerializer each override .data, so both are wrapped
+    for serializer_class in (serializers.Serializer, serializers.ListSerializer):
+        if not getattr(serializer_class.data.fget, 'instrumented', False):
+            serializer_class.data = timed_data(serializer_class.data)
+
+##### Middleware #########################################################################
+def watch_queries(stats):
+    # Same as entering connection.execute_wrapper() for each connection, without the context manager overhead
+    wrapped = connections.all()
+    for connection in wrapped:
+        connection.execute_wrappers.append(stats)
+    return wrapped
+
+def unwatch_queries(wrapped, stats):
+    for connection in wrapped:
+        connection.execute_wrappers.remove(stats)
+
+class InstrumentationMiddleware:
+    # Opt-in (INSTRUMENTATION_ENABLED). Per request it records the duration, query count, SQL time, repeated
+    # query shapes and serializer time, logs them as one JSON line and adds them to the /api/metrics/ counters.
+    # A random INSTRUMENTATION_PROFILE_RATE share of requests also runs under cProfile, and the profile is kept
+    # when the request turns out slower than INSTRUMENTATION_SLOW_MS. Sync and async capable, so async views
+    # under ASGI are not pushed onto a thread.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.INSTRUMENTATION_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        self.slow_seconds = settings.INSTRUMENTATION_SLOW_MS / 1000
+        self.profile_rate = settings.INSTRUMENTATION_PROFILE_RATE
+        self.profile_dir = settings.INSTRUMENTATION_PROFILE_DIR
+        self.duplicate_threshold = settings.INSTRUMENTATION_DUPLICATE_THRESHOLD
+        # Only one profiler can be active in a process at a time
+        self.profiler_lock = threading.Lock()
+        instrument_serializers()
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = current_request.set(stats)
+        profiler = self.start_profiler()
+        wrapped = watch_queries(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            seconds = time.perf_counter() - started
+            unwatch_queries(wrapped, stats)
+            self.stop_profiler(profiler)
+            current_request.reset(token)
+        return self.finish(request, response, seconds, stats, profiler)
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = current_request.set(stats)
+        profiler = self.start_profiler()
+        # The async ORM runs its queries in the request's thread-sensitive worker thread, and connections are per
+        # thread, so the wrappers go onto that thread's connections
+        wrapped = await sync_to_async(watch_queries)(stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            seconds = time.perf_counter() - started
+            await sync_to_async(unwatch_queries)(wrapped, stats)
+            self.stop_profiler(profiler)
+            current_request.reset(token)
+        return self.finish(request, response, seconds, stats, profiler)
+
+    def start_profiler(self):
+        if self.profile_rate and random.random() < self.profile_rate and self.profiler_lock.acquire(blocking=False):
+            profiler = cProfile.Profile()
+            profiler.enable()
+            return profiler
+        return None
+
+    def stop_profiler(self, profiler):
+        if profiler:
+            profiler.disable()
+            self.profiler_lock.release()
+
+    def finish(self, request, response, seconds, stats, profiler):
+        view = request.resolver_match.route if request.resolver_match else '<unresolved>'
+        slow = seconds >= self.slow_seconds
+        profile = self.save_profile(profiler, view) if profiler and slow else None
+        metrics.record(view, request.method, response.status_code, seconds, stats, profile is not None)
+        self.log(request, response, view, seconds, stats, slow, profile)
+        return response
+
+    def log(self, request, response, view, seconds, stats, slow, profile):
+        repeated = stats.repeated(self.duplicate_threshold)
+        level = logging.WARNING if slow or repeated else logging.INFO
+        if not logger.isEnabledFor(level):
+            return
+        record = {
+            'event': 'request',
+            'method': request.method,
+            'path': request.path,
+            'view': view,
+            'status': response.status_code,
+            'duration_ms': round(seconds * 1000, 2),
+            'queries': stats.queries,
+            'sql_ms': round(stats.sql_seconds * 1000, 2),
+            'serializer_ms': round(stats.serializer_seconds * 1000, 2),
+            'duplicate_queries': stats.duplicates(),
+        }
+        if repeated:
+            record['repeated_queries'] = [{'sql': sql[:300], 'count': count} for sql, count in repeated]
+        if profile:
+            record['profile'] = profile
+        logger.log(level, json.dumps(record))
+
+    def save_profile(self, profiler, view):
+        # Top functions by cumulative time go into the log line; the full profile is written to
+        # INSTRUMENTATION_PROFILE_DIR (if set) for `python -m pstats` or snakeviz
+        stats = pstats.Stats(profiler)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE)
+        top = [
+            {'function': pstats.func_std_string(function), 'calls': calls, 'cumulative_ms': round(cumulative * 1000, 2)}
+            for function, (_, calls, _, cumulative, _) in sorted(
+                stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:15]
+        ]
+        profile = {'top': top}
+        if self.profile_dir:
+            slug = ''.join(c if c.isalnum() else '_' for c in view).strip('_') or 'root'
+            path = os.path.join(self.profile_dir, f'{time.strftime("%Y%m%d-%H%M%S")}-{os.getpid()}-{slug}.prof')
+            try:
+                os.makedirs(self.profile_dir, exist_ok=True)
+                stats.dump_stats(path)
+                profile['path'] = path
+            except OSError as error:
+                logger.error("Could not write profile %s: %s", path, error)
+        return profile
+
+##### Metrics endpoint ###################################################################
+def metrics_view(request):
+    # Scraped by Prometheus, which sends no JWT; INSTRUMENTATION_METRICS_TOKEN, when set, must come as a bearer token
+    if not settings.INSTRUMENTATION_ENABLED:
+        raise Http404
+    token = settings.INSTRUMENTATION_METRICS_TOKEN
+    if token and not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponse(status=401)
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
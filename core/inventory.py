@@ -0,0 +1,43 @@
+from collections.abc import Mapping
+from django.conf import settings
+from .cache import TieredCache
+from .models import Room
+
+# Room inventory (numbers, types, prices, availability flags) changes rarely but is read on every room listing,
+# search and booking price calculation. core.signals invalidates it whenever a room is saved or deleted.
+room_cache = TieredCache('rooms', settings.ROOM_CACHE_SIZE, timeout=settings.ROOM_CACHE_TIMEOUT)
+
+ROOM_FIELDS = [field.attname for field in Room._meta.concrete_fields]
+
+def room_rows():
+    # {room id: tuple of ROOM_FIELDS values} for every room, in id order
+    return room_cache.get_or_load('rows', lambda: {
+        row[0]: row for row in Room.objects.order_by('pk').values_list(*ROOM_FIELDS)
+    })
+
+def room_from_row(row):
+    # A fresh instance each time, marked as loaded from the database, so callers may change and save it
+    return Room.from_db('default', ROOM_FIELDS, row)
+
+def all_rooms():
+    return [room_from_row(row) for row in room_rows().values()]
+
+class RoomLookup(Mapping):
+    # Room instances by id, built from the cached inventory; usable as context['preloaded'][Room] in serializers
+    def __init__(self):
+        self.rows = room_rows()
+
+    def __getitem__(self, pk):
+        if pk in self.rows:
+            return room_from_row(self.rows[pk])
+        # Not in the snapshot (e.g. added by bulk_create, which sends no signals): ask the database
+        try:
+            return Room.objects.get(pk=pk)
+        except Room.DoesNotExist:
+            raise KeyError(pk)
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __len__(self):
+        return len(self.rows)
@@ -0,0 +1,80 @@
+import asyncio
+import threading
+import time
+from datetime import date
+from django.conf import settings
+from django.db import transaction
+from .cache import TieredCache
+from .inventory import room_rows
+from .models import OccupancyDay
+from .occupancy import occupancy_rate
+
+# Figures of the live staff dashboard (dashboard.views), computed once per change instead of once per viewer and
+# refresh. Writes that move them publish after commit: the snapshot gets a new version, seen by every process
+# through the shared cache, and the dashboards streaming from this process are woken at once.
+live_cache = TieredCache('dashboard', 4, timeout=settings.DASHBOARD_SNAPSHOT_TIMEOUT)
+
+def dashboard_snapshot(day):
+    # Same sources as the occupancy reports in core, so the numbers agree
+    arrivals, departures, rooms_sold = OccupancyDay.objects.filter(date=day).values_list(
+        'arrivals', 'departures', 'rooms_sold',
+    ).first() or (0, 0, 0)
+    total_rooms = len(room_rows())
+    return {
+        'date': day.isoformat(),
+        'arrivals_today': arrivals,
+        'departures_today': departures,
+        'rooms_sold': rooms_sold,
+        'total_rooms': total_rooms,
+        'occupancy_rate': occupancy_rate(rooms_sold, total_rooms),
+    }
+
+class LiveFeed:
+    # Per process: the latest snapshot and its version, checked against the shared cache at most once per
+    # interval however many dashboards are connected, and the streams waiting for the next change
+    def __init__(self, interval):
+        self.interval = interval
+        self.state = None
+        self.checked = 0.0
+        self.waiters = set()
+        self._lock = threading.Lock()
+
+    def current(self):
+        # (version, snapshot); the version changes whenever the snapshot may have, including at midnight
+        with self._lock:
+            if self.state is None or time.monotonic() - self.checked >= self.interval:
+                today = date.today()
+                version = f'{live_cache.version()}-{today.isoformat()}'
+                if self.state is None or self.state[0] != version:
+                    self.state = version, live_cache.get_or_load(today.isoformat(), lambda: dashboard_snapshot(today))
+                self.checked = time.monotonic()
+            return self.state
+
+    def publish(self):
+        live_cache.invalidate()
+        with self._lock:
+            self.checked = 0.0 # The next current() reads the new version
+            waiters, self.waiters = self.waiters, set()
+        for loop, event in waiters:
+            loop.call_soon_threadsafe(event.set)
+
+    async def wait(self, timeout):
+        # Returns when this process publishes a change, or after timeout; changes made by other processes are
+        # picked up by the current() call that follows
+        entry = asyncio.get_running_loop(), asyncio.Event()
+        with self._lock:
+            self.waiters.add(entry)
+        try:
+            await asyncio.wait_for(entry[1].wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._lock:
+                self.waiters.discard(entry)
+
+live_feed = LiveFeed(settings.DASHBOARD_FEED_INTERVAL)
+
+def publish_changes(changes):
+    # changes: (before, after) availability index rows per booking, as returned by core.availability
+    if any(before != after for before, after in changes):
+        transaction.on_commit(live_feed.publish)
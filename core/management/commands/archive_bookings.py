@@ -0,0 +1,32 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from core.archive import archivable_months, archivable_stays, archive_month
+
+class Command(BaseCommand):
+    help = ("Move closed, paid stays that checked out more than --retention-days ago into the compressed booking "
+            "archive, one transaction per check-in month")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retention-days', type=int, default=settings.BOOKING_RETENTION_DAYS)
+        parser.add_argument('--batch-size', type=int, default=5000, help="Stays per archive row")
+        parser.add_argument('--dry-run', action='store_true', help="Report what would be archived and stop")
+
+    def handle(self, *args, **options):
+        stays = archivable_stays(options['retention_days'])
+        months = archivable_months(stays)
+        if options['dry_run']:
+            self.stdout.write(f"{stays.count()} stays in {len(months)} months would be archived.")
+            return
+
+        started = time.perf_counter()
+        archived = written = 0
+        for month in months:
+            count, size = archive_month(stays, month, options['batch_size'])
+            archived += count
+            written += size
+            self.stdout.write(f"{month:%Y-%m}  {count:7d} stays  {size / 1024:9.1f} KiB")
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {archived} stays from {len(months)} months into {written / 1024:.1f} KiB "
+            f"in {time.perf_counter() - started:.1f}s."
+        ))
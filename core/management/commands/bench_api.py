@@ -0,0 +1,273 @@
+import json
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+from django import get_version
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from core.availability import booked_rooms
+from core.models import Booking, Guest, OutboxJob, Room, UserProfile, UserRole
+from core.serializers import RoleTokenObtainPairSerializer
+
+class Command(BaseCommand):
+    help = "Benchmark the core API against the current database (see generate_hotel) and write JSON results"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50, help="Timed requests per scenario")
+        parser.add_argument('--warmup', type=int, default=5, help="Untimed requests per scenario")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--only', nargs='+', help="Scenario names to run")
+        parser.add_argument('--output', help="Write the results here as JSON")
+        parser.add_argument('--compare', help="Earlier results to compare with")
+        parser.add_argument('--threshold', type=float, default=10,
+                            help="Percent slower p50 counted as a regression when comparing")
+
+    def handle(self, *args, **options):
+        scenarios = self.scenarios()
+        names = options['only'] or list(scenarios)
+        unknown = set(names) - set(scenarios)
+        if unknown:
+            raise CommandError(f"Unknown scenario(s): {', '.join(sorted(unknown))}. Choose from {', '.join(scenarios)}.")
+        if not Room.objects.exists() or not Guest.objects.exists():
+            raise CommandError("No hotel to benchmark; run generate_hotel first.")
+
+        results = {'meta': self.metadata(options), 'scenarios': {}}
+        # Writes made by the scenarios are rolled back, so every run starts from the same data
+        with transaction.atomic():
+            self.today = date.today()
+            self.guest_ids = list(Guest.objects.values_list('pk', flat=True))
+            self.room_ids = list(Room.objects.values_list('pk', flat=True))
+            self.history_start = Booking.objects.order_by('check_in_date').values_list('check_in_date', flat=True)[0]
+            clients = self.make_clients()
+
+            for name in names:
+                role_name, prepare = scenarios[name]
+                rng = random.Random(f"{options['seed']}:{name}")
+                results['scenarios'][name] = self.run_scenario(clients[role_name], prepare, rng, options)
+                self.print_result(name, results['scenarios'][name])
+
+            transaction.set_rollback(True)
+        results['meta']['max_rss_kib'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+        if options['compare']:
+            self.compare(options['compare'], results, options['threshold'])
+
+    def scenarios(self):
+        # Name -> (role making the requests, function returning method, url, data and an optional cleanup)
+        return {
+            'search_rooms': ('Staff', self.search_rooms),
+            'booking_create': ('Staff', self.booking_create),
+            'check_in': ('Staff', self.check_in),
+            'check_out': ('Staff', self.check_out),
+            'calculate_revenue': ('Staff', self.calculate_revenue),
+            'guest_demographics': ('Staff', self.guest_demographics),
+            'occupancy_rate': ('Staff', self.occupancy_rate),
+            'occupancy_timeline': ('Staff', self.occupancy_timeline),
+            'list_guests': ('Guest', lambda rng: ('get', '/api/guests/', None, None)),
+            'list_rooms': ('Staff', lambda rng: ('get', '/api/rooms/', None, None)),
+            'list_bookings': ('Staff', lambda rng: ('get', '/api/bookings/', None, None)),
+            'list_invoices': ('Guest', lambda rng: ('get', '/api/invoices/', None, None)),
+        }
+
+    def run_scenario(self, client, prepare, rng, options):
+        latencies = []
+        queries = []
+        errors = 0
+        for iteration in range(options['warmup'] + options['iterations']):
+            method, url, data, cleanup = prepare(rng)
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = getattr(client, method)(url, data, format='json')
+                elapsed = time.perf_counter() - started
+            if cleanup:
+                cleanup()
+            if iteration < options['warmup']:
+                continue
+            latencies.append(elapsed * 1000)
+            queries.append(len(captured))
+            errors += response.status_code >= 400
+
+        # Memory is measured on one extra request, since tracing allocations slows everything down
+        method, url, data, cleanup = prepare(rng)
+        tracemalloc.start()
+        getattr(client, method)(url, data, format='json')
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        if cleanup:
+            cleanup()
+
+        latencies.sort()
+        return {
+            'requests': len(latencies),
+            'errors': errors,
+            'latency_ms': {
+                'mean': statistics.fmean(latencies),
+                'p50': percentile(latencies, 50),
+                'p90': percentile(latencies, 90),
+                'p99': percentile(latencies, 99),
+                'max': latencies[-1],
+            },
+            'queries': {
+                'mean': statistics.fmean(queries),
+                'max': max(queries),
+            },
+            'peak_memory_kib': peak // 1024,
+        }
+
+    ##### Scenarios ##########################################################
+    def random_stay(self, rng, first_day, last_day, max_nights=7):
+        check_in_date = first_day + timedelta(days=rng.randrange((last_day - first_day).days))
+        return check_in_date, check_in_date + timedelta(days=rng.randint(1, max_nights))
+
+    def free_room_today(self, rng):
+        booked = set(booked_rooms(self.today, self.today + timedelta(days=2)).distinct())
+        free = [room_id for room_id in self.room_ids if room_id not in booked]
+        if not free:
+            raise CommandError("No room is free today and tomorrow; generate a hotel with lower --occupancy.")
+        return rng.choice(free)
+
+    def search_rooms(self, rng):
+        check_in_date, check_out_date = self.random_stay(rng, self.today, self.today + timedelta(days=90))
+        return 'get', f'/api/search-rooms/?check_in_date={check_in_date}&check_out_date={check_out_date}', None, None
+
+    def booking_create(self, rng):
+        # Far enough ahead that most rooms are still free
+        check_in_date, check_out_date = self.random_stay(rng, self.today + timedelta(days=200),
+                                                         self.today + timedelta(days=400))
+        data = {
+            'guest': rng.choice(self.guest_ids),
+            'room': rng.choice(self.room_ids),
+            'check_in_date': check_in_date.isoformat(),
+            'check_out_date': check_out_date.isoformat(),
+            'payment_method': 'credit_card',
+        }
+        # Remove the booking again so the hotel does not fill up over the iterations
+        cleanup = lambda: [booking.delete() for booking in Booking.objects.filter(
+            room_id=data['room'], check_in_date=check_in_date, check_out_date=check_out_date)]
+        return 'post', '/api/bookings/', data, cleanup
+
+    def stay_from_today(self, rng, booking_status):
+        booking = Booking.objects.create(
+            guest_id=rng.choice(self.guest_ids),
+            room_id=self.free_room_today(rng),
+            check_in_date=self.today,
+            check_out_date=self.today + timedelta(days=2),
+            total_price=Decimal('200.00'),
+            payment_method='cash',
+            status=booking_status,
+        )
+        def cleanup():
+            OutboxJob.objects.filter(idempotency_key=f'invoice:{booking.pk}').delete()
+            Booking.objects.get(pk=booking.pk).delete()
+        return booking, cleanup
+
+    def check_in(self, rng):
+        booking, cleanup = self.stay_from_today(rng, 'reserved')
+        return 'post', f'/api/bookings/{booking.pk}/check_in/', None, cleanup
+
+    def check_out(self, rng):
+        booking, cleanup = self.stay_from_today(rng, 'checked_in')
+        return 'post', f'/api/bookings/{booking.pk}/check_out/', None, cleanup
+
+    def calculate_revenue(self, rng):
+        start_date, _ = self.random_stay(rng, self.history_start, self.today)
+        end_date = start_date + timedelta(days=90)
+        return 'get', f'/api/calculate-revenue/?start_date={start_date}&end_date={end_date}&group_by=week', None, None
+
+    def guest_demographics(self, rng):
+        start_date, _ = self.random_stay(rng, self.history_start, self.today)
+        end_date = start_date + timedelta(days=365)
+        return 'get', f'/api/guest-demographics-report/?start_date={start_date}&end_date={end_date}', None, None
+
+    def occupancy_rate(self, rng):
+        report_date, _ = self.random_stay(rng, self.history_start, self.today + timedelta(days=90))
+        return 'get', f'/api/occupancy-rate-report/?date={report_date}', None, None
+
+    def occupancy_timeline(self, rng):
+        start_date, _ = self.random_stay(rng, self.history_start, self.today + timedelta(days=90))
+        end_date = start_date + timedelta(days=30)
+        return 'get', f'/api/occupancy-timeline/?start_date={start_date}&end_date={end_date}', None, None
+
+    ##### Reporting ##########################################################
+    def make_clients(self):
+        clients = {}
+        for role_name in ('Guest', 'Staff'):
+            role, _ = UserRole.objects.get_or_create(name=role_name)
+            user = User.objects.create(username=f'bench-api-{role_name.lower()}')
+            UserProfile.objects.create(user=user, role=role)
+
+            client = APIClient(SERVER_NAME='localhost') # Passes ALLOWED_HOSTS outside the test runner
+            client.credentials(HTTP_AUTHORIZATION=f'Bearer {RoleTokenObtainPairSerializer.get_token(user).access_token}')
+            clients[role_name] = client
+        return clients
+
+    def metadata(self, options):
+        try:
+            commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                                    capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        return {
+            'commit': commit,
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'django': get_version(),
+            'database': connection.vendor,
+            'rooms': Room.objects.count(),
+            'guests': Guest.objects.count(),
+            'bookings': Booking.objects.count(),
+            'iterations': options['iterations'],
+            'seed': options['seed'],
+        }
+
+    def print_result(self, name, result):
+        latency = result['latency_ms']
+        self.stdout.write(
+            f"{name:<20} p50 {latency['p50']:8.2f} ms  p90 {latency['p90']:8.2f}  p99 {latency['p99']:8.2f}  "
+            f"queries {result['queries']['mean']:5.1f}  peak {result['peak_memory_kib']:6d} KiB  "
+            f"errors {result['errors']}"
+        )
+
+    def compare(self, path, results, threshold):
+        with open(path) as baseline_file:
+            baseline = json.load(baseline_file)
+        self.stdout.write(f"\nAgainst {path} (commit {baseline['meta'].get('commit')}):")
+
+        regressions = []
+        for name, result in results['scenarios'].items():
+            before = baseline['scenarios'].get(name)
+            if before is None:
+                continue
+            p50_change = change(before['latency_ms']['p50'], result['latency_ms']['p50'])
+            p99_change = change(before['latency_ms']['p99'], result['latency_ms']['p99'])
+            query_change = result['queries']['mean'] - before['queries']['mean']
+            line = f"{name:<20} p50 {p50_change:+7.1f}%  p99 {p99_change:+7.1f}%  queries {query_change:+5.1f}"
+            if p50_change > threshold or query_change > 0:
+                regressions.append(name)
+                self.stdout.write(self.style.ERROR(line))
+            else:
+                self.stdout.write(line)
+
+        if regressions:
+            raise CommandError(f"Regressed: {', '.join(regressions)}")
+
+def percentile(ordered, percent):
+    # Nearest-rank percentile of an already sorted list
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+def change(before, after):
+    return (after - before) / before * 100 if before else 0.0
@@ -0,0 +1,74 @@
+import statistics
+import time
+from datetime import date, timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Sum
+from core.archive import archivable_months, archivable_stays, archive_month
+from core.models import Booking, BookingArchive, Invoice, RoomNight
+from core.reports import build_guest_demographics
+
+class Command(BaseCommand):
+    help = ("Time queries over current bookings before and after moving the closed stays past the retention window "
+            "into the archive, and the archive read path. Everything is rolled back afterwards.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retention-days', type=int, default=365)
+        parser.add_argument('--repeat', type=int, default=5, help="Runs per query; the median is reported")
+
+    def handle(self, *args, **options):
+        guest_ids = list(Booking.objects.order_by('-check_in_date').values_list('guest_id', flat=True)[:200])
+        if not guest_ids:
+            raise CommandError("No bookings to archive; run generate_hotel first.")
+        today = date.today()
+        queries = [
+            ('open bookings', lambda: Booking.objects.exclude(status__in=['checked_out', 'cancelled']).count()),
+            ('unpaid invoices', lambda: Invoice.objects.filter(is_paid=False).aggregate(Sum('amount'))),
+            ('guest histories', lambda: [list(Booking.objects.filter(guest_id=guest_id)) for guest_id in guest_ids]),
+            ('demographics 90d', lambda: build_guest_demographics(today - timedelta(days=90), today)),
+        ]
+
+        with transaction.atomic():
+            before = self.run(queries, options['repeat'])
+            counts = self.counts()
+
+            stays = archivable_stays(options['retention_days'])
+            started = time.perf_counter()
+            archived = written = 0
+            for month in archivable_months(stays):
+                count, size = archive_month(stays, month)
+                archived += count
+                written += size
+            elapsed = time.perf_counter() - started
+            after = self.run(queries, options['repeat'])
+
+            self.stdout.write(f"Archived {archived} stays in {elapsed:.1f}s into {BookingArchive.objects.count()} "
+                              f"rows, {written / 2**20:.1f} MiB compressed")
+            for table, count in counts.items():
+                self.stdout.write(f"{table:<9} {count:9d} -> {self.counts()[table]:9d} rows")
+            for name, timing in before.items():
+                self.stdout.write(f"{name:<17} {timing:8.1f} ms -> {after[name]:8.1f} ms")
+
+            # A historical report through the archive: a year of stays, two years back
+            start_date = today - timedelta(days=options['retention_days'] + 365)
+            end_date = start_date + timedelta(days=364)
+            timing = self.time(lambda: build_guest_demographics(start_date, end_date, include_archive=True),
+                               options['repeat'])
+            self.stdout.write(f"{'archived year':<17} {timing:8.1f} ms")
+
+            transaction.set_rollback(True)
+
+    def counts(self):
+        return {'bookings': Booking.objects.count(), 'invoices': Invoice.objects.count(),
+                'nights': RoomNight.objects.count()}
+
+    def run(self, queries, repeat):
+        return {name: self.time(query, repeat) for name, query in queries}
+
+    def time(self, query, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            query()
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
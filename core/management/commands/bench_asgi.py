@@ -0,0 +1,126 @@
+import asyncio
+import threading
+import time
+from datetime import date, timedelta
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+from core.models import Room, UserProfile, UserRole
+from core.payments import get_gateway
+from core.serializers import RoleTokenObtainPairSerializer
+from .fake_stripe import FakeStripe
+
+class Command(BaseCommand):
+    help = "Load-test the sync views through the WSGI handler against core.async_views through the ASGI handler"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8,
+                            help="Request threads of the WSGI worker; the ASGI worker serves everything on one loop")
+        parser.add_argument('--clients', type=int, default=64, help="Concurrent clients, each sending back to back")
+        parser.add_argument('--requests', type=int, default=1000, help="Requests per endpoint and deployment")
+        parser.add_argument('--rooms', type=int, default=50)
+        parser.add_argument('--stripe-latency', type=float, default=0.1, help="Fake Stripe service time in seconds")
+
+    def handle(self, *args, **options):
+        role, _ = UserRole.objects.get_or_create(name='Staff')
+        user, _ = User.objects.get_or_create(username='bench-staff')
+        UserProfile.objects.update_or_create(user=user, defaults={'role': role})
+        token = RoleTokenObtainPairSerializer.get_token(user).access_token
+        headers = {'Authorization': f'Bearer {token}'}
+
+        rooms = [
+            Room.objects.get_or_create(number=f'L{n:04d}', defaults={'room_type': 'Q', 'price': 100})[0]
+            for n in range(options['rooms'])
+        ]
+        today = date.today()
+        # Path below /api/ (sync) and /api/async/, method, and JSON body
+        endpoints = [
+            (f'search-rooms/?check_in_date={today}&check_out_date={today + timedelta(days=3)}', 'get', None),
+            (f'occupancy-rate-report/?date={today}', 'get', None),
+            (f'rooms/{rooms[0].pk}/', 'get', None),
+            ('create-payment-intent/', 'post', {'amount': 1000}),
+        ]
+
+        server = FakeStripe(('127.0.0.1', 0), options['stripe_latency']).start()
+        # Both test clients send Host: testserver, which only the test runner allows by itself
+        with override_settings(STRIPE_API_BASE=server.url, STRIPE_SECRET_KEY='sk_test_bench',
+                               ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            get_gateway.cache_clear()
+            self.stdout.write(f"{'endpoint':<32}{'deployment':<12}{'req/s':>9}{'p50 ms':>9}{'p99 ms':>9}{'errors':>8}")
+            for path, method, body in endpoints:
+                for label, run in (('wsgi', self.run_wsgi), ('asgi', self.run_asgi)):
+                    latencies, errors, wall_time = run(f'/api/{path}' if label == 'wsgi' else f'/api/async/{path}',
+                                                       method, body, headers, options)
+                    self.report(path.split('?')[0], label, latencies, errors, wall_time)
+        get_gateway.cache_clear()
+        server.shutdown()
+
+    def run_wsgi(self, url, method, body, headers, options):
+        # Every client thread needs a free worker thread for the whole request, like a threaded WSGI server
+        worker_slots = threading.Semaphore(options['workers'])
+        latencies = []
+        errors = 0
+        lock = threading.Lock()
+
+        def client_loop(count):
+            nonlocal errors
+            client = Client()
+            try:
+                for _ in range(count):
+                    started = time.perf_counter()
+                    with worker_slots:
+                        response = self.send(client, url, method, body, headers)
+                    elapsed = time.perf_counter() - started
+                    with lock:
+                        latencies.append(elapsed)
+                        errors += response.status_code >= 400
+            finally:
+                connection.close()
+
+        clients = [threading.Thread(target=client_loop, args=(count,)) for count in self.split(options)]
+        started = time.perf_counter()
+        for thread in clients:
+            thread.start()
+        for thread in clients:
+            thread.join()
+        return latencies, errors, time.perf_counter() - started
+
+    def run_asgi(self, url, method, body, headers, options):
+        latencies = []
+        errors = 0
+
+        async def client_loop(count):
+            nonlocal errors
+            client = AsyncClient()
+            for _ in range(count):
+                started = time.perf_counter()
+                response = await self.send(client, url, method, body, headers)
+                latencies.append(time.perf_counter() - started)
+                errors += response.status_code >= 400
+
+        async def main():
+            await asyncio.gather(*(client_loop(count) for count in self.split(options)))
+
+        started = time.perf_counter()
+        asyncio.run(main())
+        return latencies, errors, time.perf_counter() - started
+
+    def send(self, client, url, method, body, headers):
+        if method == 'post':
+            return client.post(url, body, content_type='application/json', headers=headers)
+        return client.get(url, headers=headers)
+
+    def split(self, options):
+        share, extra = divmod(options['requests'], options['clients'])
+        return [share + (n < extra) for n in range(options['clients'])]
+
+    def report(self, endpoint, label, latencies, errors, wall_time):
+        latencies.sort()
+        total = len(latencies)
+        self.stdout.write(
+            f"{endpoint:<32}{label:<12}{total / wall_time:>9.1f}{latencies[total // 2] * 1000:>9.1f}"
+            f"{latencies[int(total * 0.99)] * 1000:>9.1f}{errors:>8}"
+        )
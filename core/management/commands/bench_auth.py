@@ -0,0 +1,52 @@
+import statistics
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from core.authentication import CachedJWTAuthentication, token_cache
+from core.roles import request_role_name
+from core.serializers import RoleTokenObtainPairSerializer
+
+class Command(BaseCommand):
+    help = ("Authentication cost per request: simplejwt's JWTAuthentication, as before, against "
+            "CachedJWTAuthentication, each with the role check the permission classes make")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=5000)
+        parser.add_argument('--users', type=int, default=50, help="Distinct tokens the requests cycle through")
+
+    def handle(self, *args, **options):
+        users = list(User.objects.filter(is_active=True, userprofile__isnull=False)[:options['users']])
+        if not users:
+            raise CommandError("No users with a role; run generate_hotel first.")
+
+        factory = APIRequestFactory()
+        tokens = [RoleTokenObtainPairSerializer.get_token(user).access_token for user in users]
+        requests = [factory.get('/api/rooms/', HTTP_AUTHORIZATION=f'Bearer {token}') for token in tokens]
+        token_cache.clear()
+
+        for name, backend in (('JWTAuthentication', JWTAuthentication()),
+                              ('CachedJWTAuthentication', CachedJWTAuthentication())):
+            queries, timings = self.replay(backend, requests, options['requests'])
+            self.stdout.write(f"{name:<24} {statistics.mean(timings):7.1f} us/request  "
+                              f"p99 {statistics.quantiles(timings, n=100)[98]:7.1f} us  "
+                              f"{queries / len(timings):5.2f} queries/request")
+
+    def replay(self, backend, requests, count):
+        queries, timings = 0, []
+
+        def counter(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(counter):
+            for i in range(count):
+                request = requests[i % len(requests)]
+                started = time.perf_counter()
+                request.user, request.auth = backend.authenticate(request)
+                request_role_name(request)
+                timings.append((time.perf_counter() - started) * 1e6)
+        return queries, timings
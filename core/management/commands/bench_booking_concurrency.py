@@ -0,0 +1,106 @@
+import random
+import threading
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import setup_databases, teardown_databases
+from rest_framework.test import APIClient
+from core.models import Booking, Guest, Room
+
+class Command(BaseCommand):
+    help = "Hammer POST /api/bookings/ from many threads and verify no room is ever double-booked"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--requests', type=int, default=50, help="Booking attempts per thread")
+        parser.add_argument('--rooms', type=int, default=20)
+        parser.add_argument('--days', type=int, default=30, help="Window of future check-in dates to pick from")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        # Bookings commit from many threads, so the run cannot be rolled back like the other benches; it runs in a
+        # throwaway test database instead, where its rooms cannot clash with real ones
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            self.bench(options)
+        finally:
+            teardown_databases(old_config, verbosity=0)
+
+    def bench(self, options):
+        random.seed(options['seed'])
+        user, _ = User.objects.get_or_create(username='bench-booker')
+        guest, _ = Guest.objects.get_or_create(email='bench-booker@example.com', defaults={
+            'first_name': 'Bench', 'last_name': 'Booker', 'phone_number': '0', 'date_of_birth': date(1980, 1, 1),
+        })
+        rooms = [
+            Room.objects.get_or_create(number=f'B{n:04d}', defaults={'room_type': 'Q', 'price': 100})[0]
+            for n in range(options['rooms'])
+        ]
+
+        results = defaultdict(int)
+        latencies = []
+        lock = threading.Lock()
+
+        def worker(seed):
+            rng = random.Random(seed)
+            client = APIClient(SERVER_NAME='localhost') # Passes ALLOWED_HOSTS outside the test runner
+            client.force_authenticate(user)
+            try:
+                for _ in range(options['requests']):
+                    check_in_date = date.today() + timedelta(days=rng.randrange(options['days']))
+                    payload = {
+                        'guest': guest.pk,
+                        'room': rng.choice(rooms).pk,
+                        'check_in_date': check_in_date.isoformat(),
+                        'check_out_date': (check_in_date + timedelta(days=rng.randint(1, 4))).isoformat(),
+                        'payment_method': 'cash',
+                    }
+                    started = time.perf_counter()
+                    response = client.post('/api/bookings/', payload, format='json')
+                    elapsed = time.perf_counter() - started
+                    with lock:
+                        results[response.status_code] += 1
+                        latencies.append(elapsed)
+            finally:
+                connection.close() # Every thread gets its own connection
+
+        threads = [threading.Thread(target=worker, args=(options['seed'] + n,)) for n in range(options['threads'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall_time = time.perf_counter() - started
+
+        double_bookings = self.count_double_bookings(rooms)
+
+        latencies.sort()
+        total = len(latencies)
+        self.stdout.write(f"Attempts:        {total} from {options['threads']} threads over {len(rooms)} rooms")
+        self.stdout.write(f"Created:         {results[201]}, rejected: {results[400]}, other: {total - results[201] - results[400]}")
+        self.stdout.write(f"Throughput:      {total / wall_time:.1f} req/s ({results[201] / wall_time:.1f} bookings/s)")
+        self.stdout.write(f"Latency p50/p99: {latencies[total // 2] * 1000:.1f} ms / {latencies[int(total * 0.99)] * 1000:.1f} ms")
+
+        if double_bookings:
+            self.stdout.write(self.style.ERROR(f"Double bookings: {double_bookings}"))
+        else:
+            self.stdout.write(self.style.SUCCESS("Double bookings: 0"))
+
+    def count_double_bookings(self, rooms):
+        # Sorted by check-in, any overlap shows up between neighbouring stays of the same room
+        stays = defaultdict(list)
+        for room_id, check_in_date, check_out_date in Booking.objects.filter(
+            room__in=rooms, is_active=True,
+        ).values_list('room_id', 'check_in_date', 'check_out_date'):
+            stays[room_id].append((check_in_date, check_out_date))
+
+        overlaps = 0
+        for room_stays in stays.values():
+            room_stays.sort()
+            for (_, previous_out), (next_in, _) in zip(room_stays, room_stays[1:]):
+                if next_in < previous_out:
+                    overlaps += 1
+        return overlaps
@@ -0,0 +1,63 @@
+import gzip
+import statistics
+import time
+import tracemalloc
+from datetime import date, timedelta
+from django.core.management.base import BaseCommand, CommandError
+from core.inventory import all_rooms
+from core.models import RoomNight
+from core.renderers import encode_json
+from core.room_calendar import room_calendar
+from core.search import search_results
+
+class Command(BaseCommand):
+    help = ("Size, time and peak memory of the availability calendar against a dense room x night matrix and a "
+            "search per night")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=365)
+        parser.add_argument('--repeat', type=int, default=5, help="Runs per method; the median is reported")
+        parser.add_argument('--skip-search', action='store_true', help="Leave out the search per night, the slowest")
+
+    def handle(self, *args, **options):
+        rooms = all_rooms()
+        if not rooms:
+            raise CommandError("No hotel to draw; run generate_hotel first.")
+        start_date = date.today()
+        end_date = start_date + timedelta(days=options['days'] - 1)
+
+        methods = [
+            ('runs', lambda: encode_json(room_calendar(start_date, end_date))),
+            ('matrix', lambda: encode_json(self.matrix(start_date, end_date, rooms))),
+        ]
+        if not options['skip_search']:
+            methods.append(('search/night', lambda: encode_json([
+                search_results(night, night + timedelta(days=1))
+                for night in (start_date + timedelta(days=offset) for offset in range(options['days']))
+            ])))
+
+        self.stdout.write(f"{len(rooms)} rooms x {options['days']} nights, median of {options['repeat']}")
+        for name, build in methods:
+            timings = []
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                body = build()
+                timings.append((time.perf_counter() - started) * 1000)
+
+            tracemalloc.start()
+            build()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            self.stdout.write(f"{name:<13} {statistics.median(timings):8.1f} ms  {len(body) / 1024:8.1f} KiB  "
+                              f"gzip {len(gzip.compress(body)) / 1024:7.1f} KiB  peak {peak / 2**20:6.1f} MiB")
+
+    def matrix(self, start_date, end_date, rooms):
+        # The straightforward grid: a booking id, or 0, for every room and night, from the availability index
+        nights = (end_date - start_date).days + 1
+        cells = {room.pk: [0] * nights for room in rooms}
+        for room_id, night, booking_id in RoomNight.objects.filter(
+            night__gte=start_date, night__lte=end_date,
+        ).values_list('room_id', 'night', 'booking_id').iterator(chunk_size=5000):
+            cells[room_id][(night - start_date).days] = booking_id
+        return {'start_date': start_date, 'end_date': end_date, 'rooms': cells}
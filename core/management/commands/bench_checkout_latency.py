@@ -0,0 +1,90 @@
+import threading
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings, setup_databases, teardown_databases
+from rest_framework.test import APIClient
+from core.models import Booking, Guest, Invoice, Room
+from core.outbox import run_pending
+
+class Command(BaseCommand):
+    help = "Measure check-out latency under concurrent load, with invoicing in the outbox and inline"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--checkouts', type=int, default=400, help="Check-outs per run")
+
+    def handle(self, *args, **options):
+        # Check-outs commit from many threads, so the run cannot be rolled back like the other benches; it runs in
+        # a throwaway test database instead, where its rooms cannot clash with real ones
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            self.bench(options)
+        finally:
+            teardown_databases(old_config, verbosity=0)
+
+    def bench(self, options):
+        user, _ = User.objects.get_or_create(username='bench-checkout')
+        guest, _ = Guest.objects.get_or_create(email='bench-checkout@example.com', defaults={
+            'first_name': 'Bench', 'last_name': 'Checkout', 'phone_number': '0', 'date_of_birth': date(1980, 1, 1),
+        })
+
+        for label, inline in (('outbox', False), ('inline', True)):
+            rooms = self.make_checked_in_stays(guest, options['checkouts'], label)
+            with override_settings(OUTBOX_INLINE=inline):
+                latencies, wall_time = self.run(user, rooms, options['threads'])
+
+            drain_started = time.perf_counter()
+            while run_pending():
+                pass
+            drain_time = time.perf_counter() - drain_started
+
+            latencies.sort()
+            total = len(latencies)
+            invoices = Invoice.objects.filter(booking__room__in=rooms).count()
+            self.stdout.write(
+                f"{label:<7} p50 {latencies[total // 2] * 1000:7.1f} ms   p99 {latencies[int(total * 0.99)] * 1000:7.1f} ms   "
+                f"{total / wall_time:7.1f} check-outs/s   worker drain {drain_time:.2f} s   invoices {invoices}/{total}"
+            )
+
+    def make_checked_in_stays(self, guest, count, label):
+        today = date.today()
+        rooms = Room.objects.bulk_create([
+            Room(number=f'{label[0].upper()}{n:04d}', room_type='Q', price=Decimal('100.00'), is_available=False)
+            for n in range(count)
+        ])
+        for room in rooms: # Saved one by one so each stay is indexed like a real one
+            Booking.objects.create(
+                guest=guest, room=room, check_in_date=today, check_out_date=today + timedelta(days=2),
+                total_price=Decimal('200.00'), payment_method='cash', status='checked_in',
+            )
+        return rooms
+
+    def run(self, user, rooms, threads):
+        booking_ids = list(Booking.objects.filter(room__in=rooms).values_list('pk', flat=True))
+        latencies = []
+        lock = threading.Lock()
+
+        def worker(ids):
+            client = APIClient(SERVER_NAME='localhost') # Passes ALLOWED_HOSTS outside the test runner
+            client.force_authenticate(user)
+            try:
+                for booking_id in ids:
+                    started = time.perf_counter()
+                    client.post(f'/api/bookings/{booking_id}/check_out/')
+                    elapsed = time.perf_counter() - started
+                    with lock:
+                        latencies.append(elapsed)
+            finally:
+                connection.close() # Every thread gets its own connection
+
+        workers = [threading.Thread(target=worker, args=(booking_ids[n::threads],)) for n in range(threads)]
+        started = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        return latencies, time.perf_counter() - started
@@ -0,0 +1,74 @@
+import random
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from core.availability import booked_rooms
+from core.inventory import all_rooms
+from core.live import live_feed
+from core.models import Booking, Guest, OccupancyDay, Room
+from core.occupancy import occupancy_rate
+
+class Command(BaseCommand):
+    help = ("Database queries behind a wall of auto-refreshing dashboards: figures recomputed on every page load, "
+            "as before the live feed, against the live feed")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--viewers', type=int, default=12)
+        parser.add_argument('--refreshes', type=int, default=360, help="Refreshes per viewer, an hour at 10 seconds")
+        parser.add_argument('--changes', type=int, default=30, help="Bookings made over the run")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if not Guest.objects.exists() or not all_rooms():
+            raise CommandError("No hotel to watch; run generate_hotel first.")
+
+        for name, read in (('page loads', self.recompute), ('live feed', lambda: live_feed.current()[1])):
+            queries, elapsed = self.replay(read, options)
+            self.stdout.write(f"{name:<11} {queries:6d} queries  {elapsed:8.1f} ms reading  "
+                              f"({options['viewers']} viewers x {options['refreshes']} refreshes, "
+                              f"{options['changes']} changes)")
+
+    def recompute(self):
+        # What dashboard.views.overview did on every load
+        today = OccupancyDay.objects.filter(date=date.today()).first() or OccupancyDay(date=date.today())
+        total_rooms = Room.objects.count()
+        return today.arrivals, today.departures, occupancy_rate(today.rooms_sold, total_rooms)
+
+    def replay(self, read, options):
+        # Bookings arriving today are made between refreshes and deleted again at the end. The feed's interval
+        # is measured in seconds, far longer than a refresh here, so only published changes show up in it.
+        rng = random.Random(options['seed'])
+        guest_ids = list(Guest.objects.values_list('pk', flat=True)[:1000])
+        change_at = set(rng.sample(range(options['refreshes']), min(options['changes'], options['refreshes'])))
+        today = date.today()
+        created = []
+        queries, elapsed = 0, 0.0
+
+        def counter(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        try:
+            for refresh in range(options['refreshes']):
+                if refresh in change_at:
+                    booked = set(booked_rooms(today, today + timedelta(days=1)))
+                    free = [room for room in all_rooms() if room.pk not in booked]
+                    if free:
+                        created.append(Booking.objects.create(
+                            guest_id=rng.choice(guest_ids), room=rng.choice(free), check_in_date=today,
+                            check_out_date=today + timedelta(days=1), total_price=Decimal('100.00'),
+                            payment_method='cash',
+                        ))
+
+                started = time.perf_counter()
+                with connection.execute_wrapper(counter):
+                    for _ in range(options['viewers']):
+                        read()
+                elapsed += (time.perf_counter() - started) * 1000
+        finally:
+            for booking in created:
+                booking.delete()
+        return queries, elapsed
@@ -0,0 +1,63 @@
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from core.events import CONSUMERS, replay
+from core.models import Booking, BookingEvent
+
+# A whole stay, as the synthetic events repeat it
+LIFECYCLE = ('created', 'checked_in', 'checked_out', 'invoiced', 'paid')
+
+class Command(BaseCommand):
+    help = ("Replay throughput of the booking event log consumers from scratch. The log is topped up with synthetic "
+            "stays to --events; everything is rolled back afterwards.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--events', type=int, default=1_000_000)
+        parser.add_argument('--batch-size', type=int, nargs='+', default=[1000, 5000, 20000])
+        parser.add_argument('--consumer', choices=list(CONSUMERS), default='guest_stats')
+
+    def handle(self, *args, **options):
+        bookings = list(Booking.objects.values_list('pk', 'guest_id', 'check_in_date', 'check_out_date',
+                                                    'total_price')[:10000])
+        if not bookings:
+            raise CommandError("No bookings to make events for; run generate_hotel first.")
+
+        with transaction.atomic():
+            started = time.perf_counter()
+            added = self.top_up(bookings, options['events'] - BookingEvent.objects.count())
+            total = BookingEvent.objects.count()
+            self.stdout.write(f"{total} events in the log ({added} synthetic, written in "
+                              f"{time.perf_counter() - started:.1f}s)")
+
+            for batch_size in options['batch_size']:
+                started = time.perf_counter()
+                applied = replay(options['consumer'], batch_size)
+                elapsed = time.perf_counter() - started
+                self.stdout.write(f"{options['consumer']} batch {batch_size:6d}  {elapsed:7.1f}s  "
+                                  f"{applied / elapsed:9.0f} events/s")
+
+            transaction.set_rollback(True)
+
+    def top_up(self, bookings, count, chunk=50000):
+        # Settled already, so the consumers read all of it
+        created_at = timezone.now() - timedelta(days=1)
+        added = 0
+        while added < count:
+            events = []
+            for n in range(added, min(count, added + chunk)):
+                booking_id, guest_id, check_in, check_out, total_price = bookings[n // len(LIFECYCLE) % len(bookings)]
+                kind = LIFECYCLE[n % len(LIFECYCLE)]
+                data = {'guest': guest_id}
+                if kind == 'created':
+                    data.update(check_in=check_in.isoformat(), check_out=check_out.isoformat(),
+                                total_price=str(total_price))
+                elif kind == 'checked_out':
+                    data['nights'] = (check_out - check_in).days
+                elif kind in ('invoiced', 'paid'):
+                    data['amount'] = str(total_price)
+                events.append(BookingEvent(booking_id=booking_id, kind=kind, data=data, created_at=created_at))
+            BookingEvent.objects.bulk_create(events, batch_size=5000)
+            added += len(events)
+        return added
@@ -0,0 +1,86 @@
+import statistics
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from core.management.commands.bench_api import change
+from core.models import Booking, UserProfile, UserRole
+from core.renderers import FastJSONRenderer
+from core.serializers import RoleTokenObtainPairSerializer, values_row_builder
+from core.views import BookingViewSet, GuestViewSet, InvoiceViewSet, regular_path
+
+class Command(BaseCommand):
+    help = "Compare the serializer path and the values() fast path for list responses, at the serializer and over HTTP"
+
+    # (name, ViewSet, list URL, role allowed to list it)
+    endpoints = [
+        ('bookings', BookingViewSet, '/api/bookings/', 'Staff'),
+        ('guests', GuestViewSet, '/api/guests/', 'Guest'),
+        ('invoices', InvoiceViewSet, '/api/invoices/', 'Guest'),
+    ]
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=5, help="Runs per path; the median is reported")
+        parser.add_argument('--page-size', type=int, default=1000, help="Page size of the HTTP runs")
+
+    def handle(self, *args, **options):
+        if Booking.objects.count() < options['rows']:
+            raise CommandError(f"Fewer than {options['rows']} bookings; run generate_hotel first.")
+
+        self.stdout.write(f"{options['rows']} rows, query + build + encode, median of {options['repeat']}")
+        for name, viewset, _, _ in self.endpoints:
+            queryset = viewset.queryset.order_by('pk')[:options['rows']]
+            columns, build = values_row_builder(viewset.serializer_class())
+            regular = self.median(options['repeat'], lambda: JSONRenderer().render(
+                viewset.serializer_class(list(queryset), many=True).data))
+            fast = self.median(options['repeat'], lambda: FastJSONRenderer().render(
+                build(queryset.values(*columns))))
+            self.report(name, regular, fast)
+
+        self.stdout.write(f"\nHTTP, {options['rows']} rows in pages of {options['page_size']}, median of {options['repeat']}")
+        users = []
+        try:
+            clients = {}
+            for role_name in {role_name for _, _, _, role_name in self.endpoints}:
+                user = User.objects.create(username=f'bench-fast-serializers-{role_name.lower()}')
+                users.append(user)
+                UserProfile.objects.create(user=user, role=UserRole.objects.get_or_create(name=role_name)[0])
+                client = APIClient(SERVER_NAME='localhost') # Passes ALLOWED_HOSTS outside the test runner
+                client.credentials(HTTP_AUTHORIZATION=f'Bearer {RoleTokenObtainPairSerializer.get_token(user).access_token}')
+                clients[role_name] = client
+
+            for name, viewset, url, role_name in self.endpoints:
+                walk = lambda: self.walk(clients[role_name], url, options['rows'], options['page_size'])
+                with regular_path(viewset):
+                    regular = self.median(options['repeat'], walk)
+                fast = self.median(options['repeat'], walk)
+                self.report(name, regular, fast)
+        finally:
+            for user in users:
+                user.delete()
+
+    def walk(self, client, url, rows, page_size):
+        # Follows the next links until `rows` rows have been served
+        params = {'page_size': page_size}
+        served = 0
+        while url and served < rows:
+            response = client.get(url, params)
+            if response.status_code != 200:
+                raise CommandError(f"{url} answered {response.status_code}")
+            body = response.json()
+            served += len(body['results'])
+            url, params = body['next'], {}
+
+    def median(self, repeat, run):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            run()
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
+
+    def report(self, name, regular, fast):
+        self.stdout.write(f"{name:<9} serializer {regular:8.1f} ms  fast {fast:8.1f} ms  "
+                          f"{change(regular, fast):+.1f}% ({regular / fast:.1f}x)")
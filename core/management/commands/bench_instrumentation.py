@@ -0,0 +1,83 @@
+import logging
+import statistics
+import time
+from datetime import date, timedelta
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import override_settings
+from rest_framework.test import APIClient
+from core.instrumentation import metrics
+from core.management.commands.bench_api import change
+from core.models import Room, UserProfile, UserRole
+from core.serializers import RoleTokenObtainPairSerializer
+
+class Command(BaseCommand):
+    help = "Measure the latency InstrumentationMiddleware adds to typical API requests"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help="Requests per URL and client")
+        parser.add_argument('--profile-rate', type=float, default=0.01)
+
+    def handle(self, *args, **options):
+        if not Room.objects.exists():
+            raise CommandError("No rooms to request; run generate_hotel first.")
+        check_in_date = date.today() + timedelta(days=30)
+        urls = [
+            '/api/rooms/',
+            '/api/bookings/',
+            f'/api/search-rooms/?check_in_date={check_in_date}&check_out_date={check_in_date + timedelta(days=3)}',
+            f'/api/occupancy-rate-report/?date={date.today()}',
+        ]
+
+        # Log lines would dominate the measurement on a terminal; building them is still paid for
+        logger = logging.getLogger('core.instrumentation')
+        handlers, logger.handlers = logger.handlers, [logging.NullHandler()]
+        try:
+            with transaction.atomic():
+                token = self.staff_token()
+                clients = {enabled: self.make_client(token, enabled, options['profile_rate'])
+                           for enabled in (False, True)}
+                self.stdout.write(f"{'':<24}{'plain':>10}{'instrumented':>14}{'overhead':>10}")
+                totals = {False: 0.0, True: 0.0}
+                for url in urls:
+                    timings = {False: [], True: []}
+                    # Alternate the two clients request by request, swapping which goes first, so drift in the
+                    # machine's speed and any advantage of going second hit both alike
+                    for i in range(options['requests']):
+                        for enabled in ((False, True) if i % 2 else (True, False)):
+                            timings[enabled].append(self.timed_get(clients[enabled], url))
+                    plain, instrumented = statistics.median(timings[False]), statistics.median(timings[True])
+                    totals[False] += plain
+                    totals[True] += instrumented
+                    self.stdout.write(f"{url.split('?')[0]:<24}{plain * 1000:8.3f}ms{instrumented * 1000:12.3f}ms"
+                                      f"{change(plain, instrumented):+9.2f}%")
+                self.stdout.write(f"{'all':<24}{totals[False] * 1000:8.3f}ms{totals[True] * 1000:12.3f}ms"
+                                  f"{change(totals[False], totals[True]):+9.2f}%")
+                transaction.set_rollback(True)
+        finally:
+            logger.handlers = handlers
+            metrics.clear()
+
+    def staff_token(self):
+        role, _ = UserRole.objects.get_or_create(name='Staff')
+        user = User.objects.create(username='bench-instrumentation')
+        UserProfile.objects.create(user=user, role=role)
+        return RoleTokenObtainPairSerializer.get_token(user).access_token
+
+    def make_client(self, token, enabled, profile_rate):
+        client = APIClient(SERVER_NAME='localhost') # Passes ALLOWED_HOSTS outside the test runner
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        # The middleware reads its settings when the client loads the middleware chain, on the first request
+        with override_settings(INSTRUMENTATION_ENABLED=enabled, INSTRUMENTATION_PROFILE_RATE=profile_rate,
+                               INSTRUMENTATION_PROFILE_DIR=None):
+            client.get('/api/rooms/')
+        return client
+
+    def timed_get(self, client, url):
+        started = time.perf_counter()
+        response = client.get(url)
+        elapsed = time.perf_counter() - started
+        if response.status_code != 200:
+            raise CommandError(f"{url} answered {response.status_code}")
+        return elapsed
@@ -0,0 +1,71 @@
+import os
+import statistics
+import threading
+import time
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from core.authentication import PooledHashingBackend
+from core.models import Room
+
+class Command(BaseCommand):
+    help = ("Logins per second per core under a burst, with password hashing in the request threads (Django's "
+            "ModelBackend, as before) and in the hashing pool, and the latency of a cheap request served meanwhile")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=16, help="Threads logging in at once")
+        parser.add_argument('--seconds', type=float, default=10)
+
+    def handle(self, *args, **options):
+        room_id = Room.objects.values_list('pk', flat=True).first()
+        if room_id is None:
+            raise CommandError("No rooms to read; run generate_hotel first.")
+        cores = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count()
+
+        user = User.objects.create(username='bench-login', password=make_password('bench-login'))
+        try:
+            for name, backend in (('in request', ModelBackend()), ('pool', PooledHashingBackend())):
+                logins, elapsed, latencies = self.burst(backend, room_id, options)
+                rate = logins / elapsed
+                self.stdout.write(f"{name:<11} {rate:6.2f} logins/s  {rate / cores:6.2f} per core  "
+                                  f"cheap request p50 {statistics.median(latencies):7.1f} ms  "
+                                  f"p99 {statistics.quantiles(latencies, n=100)[98]:7.1f} ms  "
+                                  f"({options['clients']} clients, {cores} core(s))")
+        finally:
+            user.delete()
+
+    def burst(self, backend, room_id, options):
+        deadline = time.monotonic() + options['seconds']
+        logins = [0] * options['clients']
+        latencies = []
+
+        def client(i):
+            try:
+                while time.monotonic() < deadline:
+                    if backend.authenticate(None, username='bench-login', password='bench-login') is not None:
+                        logins[i] += 1
+            finally:
+                connection.close()
+
+        def probe():
+            # An I/O-bound request: one indexed read, every 10 ms
+            try:
+                while time.monotonic() < deadline:
+                    started = time.perf_counter()
+                    Room.objects.filter(pk=room_id).exists()
+                    latencies.append((time.perf_counter() - started) * 1000)
+                    time.sleep(0.01)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=client, args=(i,)) for i in range(options['clients'])]
+        threads.append(threading.Thread(target=probe))
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # Until the last login in flight at the deadline is done
+        return sum(logins), time.monotonic() - started, latencies
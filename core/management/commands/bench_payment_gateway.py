@@ -0,0 +1,108 @@
+import asyncio
+import threading
+import time
+import stripe
+from django.core.management.base import BaseCommand
+from core.payments import StripeGateway
+from .fake_stripe import FakeStripe
+
+class Command(BaseCommand):
+    help = "Compare the old per-call Stripe usage with core.payments.StripeGateway against a local fake Stripe"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--requests', type=int, default=500, help="Payment intents per run")
+        parser.add_argument('--latency', type=float, default=0.02, help="Fake Stripe service time in seconds")
+        parser.add_argument('--fail-rate', type=float, default=0.05, help="Share of fake Stripe responses lost")
+
+    def handle(self, *args, **options):
+        api_key = 'sk_test_bench'
+        self.stdout.write(f"{'run':<10}{'p50 ms':>9}{'p99 ms':>9}{'req/s':>9}{'errors':>8}{'intents':>9}{'conns':>7}")
+
+        # The old view: module-level SDK config, no timeouts or retries, and the client resends on error,
+        # so a response lost after the intent was created becomes a second intent
+        def legacy(server):
+            stripe.api_key, stripe.api_base, stripe.max_network_retries = api_key, server.url, 0
+            def call(n):
+                for _ in range(2):
+                    try:
+                        return stripe.PaymentIntent.create(
+                            amount=1000, currency='usd', automatic_payment_methods={'enabled': True},
+                        )
+                    except stripe.StripeError as error:
+                        last_error = error
+                raise last_error
+            return call
+
+        def gateway(server):
+            gateway = StripeGateway(api_key, api_base=server.url, pool_size=options['threads'])
+            return lambda n: gateway.create_payment_intent(1000, f'payment-intent:{n}:1000')
+
+        for label, make_call in (('legacy', legacy), ('gateway', gateway)):
+            server = FakeStripe(('127.0.0.1', 0), options['latency'], options['fail_rate']).start()
+            call = make_call(server)
+            latencies, errors, wall_time = self.run_threads(call, options['requests'], options['threads'])
+            self.report(label, latencies, errors, wall_time, server)
+            server.shutdown()
+
+        server = FakeStripe(('127.0.0.1', 0), options['latency'], options['fail_rate']).start()
+        gateway = StripeGateway(api_key, api_base=server.url, pool_size=options['threads'])
+        latencies, errors, wall_time = asyncio.run(self.run_async(gateway, options['requests'], options['threads']))
+        self.report('async', latencies, errors, wall_time, server)
+        server.shutdown()
+
+    def run_threads(self, call, requests, threads):
+        latencies = []
+        errors = 0
+        lock = threading.Lock()
+
+        def worker(numbers):
+            nonlocal errors
+            for n in numbers:
+                started = time.perf_counter()
+                try:
+                    call(n)
+                except stripe.StripeError:
+                    with lock:
+                        errors += 1
+                    continue
+                elapsed = time.perf_counter() - started
+                with lock:
+                    latencies.append(elapsed)
+
+        workers = [threading.Thread(target=worker, args=(range(n, requests, threads),)) for n in range(threads)]
+        started = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        return latencies, errors, time.perf_counter() - started
+
+    async def run_async(self, gateway, requests, concurrency):
+        latencies = []
+        errors = 0
+        limit = asyncio.Semaphore(concurrency)
+
+        async def one(n):
+            nonlocal errors
+            async with limit:
+                started = time.perf_counter()
+                try:
+                    await gateway.create_payment_intent_async(1000, f'payment-intent:{n}:1000')
+                except stripe.StripeError:
+                    errors += 1
+                    return
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(n) for n in range(requests)))
+        return latencies, errors, time.perf_counter() - started
+
+    def report(self, label, latencies, errors, wall_time, server):
+        latencies.sort()
+        total = len(latencies)
+        p50 = latencies[total // 2] * 1000 if total else 0
+        p99 = latencies[int(total * 0.99)] * 1000 if total else 0
+        self.stdout.write(
+            f"{label:<10}{p50:>9.1f}{p99:>9.1f}{total / wall_time:>9.1f}{errors:>8}{server.created:>9}{server.connections:>7}"
+        )
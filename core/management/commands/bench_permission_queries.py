@@ -0,0 +1,54 @@
+from datetime import date, timedelta
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+from core.models import UserProfile, UserRole
+from core.roles import role_cache
+from core.serializers import RoleTokenObtainPairSerializer
+
+class Command(BaseCommand):
+    help = "Count the queries each API endpoint spends on authentication and role checks"
+
+    def handle(self, *args, **options):
+        today = date.today()
+        # Endpoint and the role allowed to call it
+        endpoints = [
+            ('/api/guests/', 'Guest'),
+            ('/api/invoices/', 'Guest'),
+            ('/api/rooms/', 'Staff'),
+            ('/api/bookings/', 'Staff'),
+            ('/api/guest-demographics-report/', 'Staff'),
+            (f'/api/occupancy-rate-report/?date={today}', 'Staff'),
+            (f'/api/search-rooms/?check_in_date={today}&check_out_date={today + timedelta(days=1)}', 'Staff'),
+        ]
+
+        users = {}
+        for role_name in ('Guest', 'Staff'):
+            role, _ = UserRole.objects.get_or_create(name=role_name)
+            user, _ = User.objects.get_or_create(username=f'bench-{role_name.lower()}')
+            UserProfile.objects.update_or_create(user=user, defaults={'role': role})
+            users[role_name] = user
+
+        self.stdout.write(f"{'endpoint':<70} {'plain token':>12} {'cached role':>12} {'role claim':>11}")
+        for url, role_name in endpoints:
+            user = users[role_name]
+            plain_token = RefreshToken.for_user(user).access_token
+            role_token = RoleTokenObtainPairSerializer.get_token(user).access_token
+
+            role_cache.clear()
+            plain = self.count_queries(url, plain_token) # Role looked up in the database
+            cached = self.count_queries(url, plain_token) # Role served by the process-local cache
+            claim = self.count_queries(url, role_token) # Role read from the token
+            self.stdout.write(f"{url:<70} {plain:>12} {cached:>12} {claim:>11}")
+
+    def count_queries(self, url, token):
+        client = APIClient(SERVER_NAME='localhost') # Passes ALLOWED_HOSTS outside the test runner
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url)
+        if response.status_code != 200:
+            self.stderr.write(f"{url} answered {response.status_code}")
+        return len(queries)
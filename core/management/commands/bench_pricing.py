@@ -0,0 +1,92 @@
+import random
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from core.availability import CENT, stay_nights
+from core.inventory import all_rooms, room_cache
+from core.models import OccupancyDay, RatePlan, Room
+from core.occupancy import occupancy_rate
+from core.pricing import Pricer, rate_cache, rule_matches
+
+class Command(BaseCommand):
+    help = "Time pricing one stay for every room with core.pricing against a per-night, per-room evaluation"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rooms', type=int, default=500)
+        parser.add_argument('--nights', type=int, default=14)
+        parser.add_argument('--repeat', type=int, default=20, help="Warm runs to average")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        check_in_date = date.today() + timedelta(days=30)
+        check_out_date = check_in_date + timedelta(days=options['nights'])
+
+        # Sample data lives in a transaction that is rolled back
+        with transaction.atomic():
+            room_types = [room_type for room_type, _ in Room.ROOM_TYPES]
+            Room.objects.bulk_create([
+                Room(number=f'P{n:04d}', room_type=rng.choice(room_types), price=Decimal(rng.randrange(80, 400)))
+                for n in range(options['rooms'])
+            ])
+            RatePlan.objects.bulk_create([
+                RatePlan(name='Summer', start_date=check_in_date, end_date=check_in_date + timedelta(days=60),
+                         multiplier=Decimal('1.250')),
+                RatePlan(name='Weekend', weekdays='45', multiplier=Decimal('1.150')),
+                RatePlan(name='Suite weekend', room_type='KS', weekdays='5', multiplier=Decimal('1.100')),
+                RatePlan(name='Week or longer', min_nights=7, multiplier=Decimal('0.900')),
+                RatePlan(name='Busy night', min_occupancy=Decimal('80'), multiplier=Decimal('1.300')),
+            ])
+            total_rooms = Room.objects.count()
+            OccupancyDay.objects.bulk_create([
+                OccupancyDay(date=night, rooms_sold=rng.randrange(total_rooms))
+                for night in stay_nights(check_in_date, check_out_date)
+            ], ignore_conflicts=True)
+            room_cache.invalidate() # bulk_create sends no signals
+            rate_cache.invalidate()
+            rooms = all_rooms()
+
+            started = time.perf_counter()
+            expected = self.price_per_night(rooms, check_in_date, check_out_date)
+            naive_time = time.perf_counter() - started
+
+            started = time.perf_counter()
+            prices = Pricer(check_in_date, check_out_date).stay_prices(rooms, check_in_date, check_out_date)
+            cold_time = time.perf_counter() - started
+
+            started = time.perf_counter()
+            for _ in range(options['repeat']):
+                Pricer(check_in_date, check_out_date).stay_prices(rooms, check_in_date, check_out_date)
+            warm_time = (time.perf_counter() - started) / options['repeat']
+
+            transaction.set_rollback(True)
+        room_cache.invalidate()
+        rate_cache.invalidate()
+
+        if prices != expected:
+            raise CommandError("Pricing engine and per-night evaluation disagree.")
+        self.stdout.write(f"{len(rooms)} rooms x {options['nights']} nights")
+        self.stdout.write(f"per night, per room          {naive_time * 1000:9.1f} ms")
+        self.stdout.write(f"engine, calendars cold       {cold_time * 1000:9.1f} ms")
+        self.stdout.write(f"engine, calendars warm       {warm_time * 1000:9.1f} ms")
+
+    def price_per_night(self, rooms, check_in_date, check_out_date):
+        # The straightforward way: look every night up and test every rule for every room
+        nights = stay_nights(check_in_date, check_out_date)
+        prices = {}
+        for room in rooms:
+            total = Decimal('0')
+            for night in nights:
+                rooms_sold = OccupancyDay.objects.filter(date=night).values_list('rooms_sold', flat=True).first() or 0
+                occupancy = occupancy_rate(rooms_sold, len(rooms))
+                factor = Decimal('1')
+                for rule in RatePlan.objects.filter(is_active=True).order_by('pk'):
+                    if (len(nights) >= rule.min_nights
+                            and (rule.min_occupancy is None or occupancy >= rule.min_occupancy)
+                            and rule_matches(rule, room.room_type, night)):
+                        factor *= rule.multiplier
+                total += factor
+            prices[room.pk] = (room.price * total).quantize(CENT)
+        return prices
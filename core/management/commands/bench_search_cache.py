@@ -0,0 +1,107 @@
+import random
+import statistics
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.test import APIClient
+from core.availability import booked_rooms
+from core.inventory import all_rooms
+from core.management.commands.bench_api import change, percentile
+from core.models import Booking, Guest, UserProfile, UserRole
+from core.search import search_cache
+from core.serializers import RoleTokenObtainPairSerializer
+
+class Command(BaseCommand):
+    help = "Replay a room search workload with popular date windows and some bookings, with and without the search cache"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument('--weekends', type=int, default=12, help="Upcoming weekends searched for")
+        parser.add_argument('--booking-every', type=int, default=50, help="Searches between two bookings")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if not Guest.objects.exists() or not all_rooms():
+            raise CommandError("No hotel to search; run generate_hotel first.")
+
+        # Not in a transaction: the cache is invalidated when a booking commits, which is part of what is measured.
+        # Everything created here is deleted again at the end.
+        user = User.objects.create(username='bench-search-cache')
+        created = []
+        try:
+            UserProfile.objects.create(user=user, role=UserRole.objects.get_or_create(name='Staff')[0])
+            client = APIClient(SERVER_NAME='localhost') # Passes ALLOWED_HOSTS outside the test runner
+            client.credentials(HTTP_AUTHORIZATION=f'Bearer {RoleTokenObtainPairSerializer.get_token(user).access_token}')
+
+            workload = self.workload(options)
+            results = {}
+            for name, cached in (('uncached', False), ('cached', True)):
+                search_cache.invalidate()
+                search_cache.local.hits = search_cache.local.misses = 0
+                try:
+                    results[name] = self.replay(client, workload, cached, options['booking_every'], created,
+                                                random.Random(options['seed']))
+                finally:
+                    # Both runs start from the same hotel
+                    for booking in created:
+                        booking.delete()
+                    created.clear()
+                results[name]['hit_rate'] = search_cache.local.stats()['hit_rate'] if cached else 0.0
+        finally:
+            user.delete()
+
+        for name, result in results.items():
+            latency = result['latency_ms']
+            self.stdout.write(f"{name:<9} p50 {percentile(latency, 50):7.2f} ms  p90 {percentile(latency, 90):7.2f}  "
+                              f"mean {statistics.fmean(latency):7.2f}  hit rate {result['hit_rate']:.1%}  "
+                              f"bookings {result['bookings']}")
+        before, after = statistics.fmean(results['uncached']['latency_ms']), statistics.fmean(results['cached']['latency_ms'])
+        self.stdout.write(f"mean latency {change(before, after):+.1f}%")
+
+    def workload(self, options):
+        # Weekends (Friday to Sunday) and a few week-long stays, nearer ones far more popular, a third by room type
+        rng = random.Random(options['seed'])
+        today = date.today()
+        friday = today + timedelta(days=(4 - today.weekday()) % 7 or 7)
+        windows = [(friday + timedelta(weeks=week), friday + timedelta(weeks=week, days=2))
+                   for week in range(options['weekends'])]
+        windows += [(check_in_date, check_in_date + timedelta(days=7)) for check_in_date, _ in windows[:4]]
+        weights = [1 / (rank + 1) for rank in range(len(windows))]
+        room_types = sorted({room.room_type for room in all_rooms()})
+        return [
+            (*rng.choices(windows, weights)[0], rng.choice(room_types) if rng.random() < 1 / 3 else None)
+            for _ in range(options['requests'])
+        ]
+
+    def replay(self, client, workload, cached, booking_every, created, rng):
+        latencies = []
+        bookings = 0
+        guest_ids = list(Guest.objects.values_list('pk', flat=True)[:1000])
+        rooms = all_rooms()
+        for i, (check_in_date, check_out_date, room_type) in enumerate(workload):
+            if i and i % booking_every == 0:
+                # A booking for one of the searched windows: it invalidates only the searches sharing a night with it
+                booked = set(booked_rooms(check_in_date, check_out_date))
+                free = [room for room in rooms if room.pk not in booked]
+                if free:
+                    created.append(Booking.objects.create(
+                        guest_id=rng.choice(guest_ids), room=rng.choice(free), check_in_date=check_in_date,
+                        check_out_date=check_out_date, total_price=Decimal('100.00'), payment_method='cash',
+                    ))
+                    bookings += 1
+            if not cached:
+                search_cache.invalidate()
+
+            url = f'/api/search-rooms/?check_in_date={check_in_date}&check_out_date={check_out_date}'
+            if room_type:
+                url += f'&room_type={room_type}'
+            started = time.perf_counter()
+            response = client.get(url)
+            latencies.append((time.perf_counter() - started) * 1000)
+            if response.status_code != 200:
+                raise CommandError(f"{url} answered {response.status_code}")
+
+        latencies.sort()
+        return {'latency_ms': latencies, 'bookings': bookings}
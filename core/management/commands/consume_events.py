@@ -0,0 +1,42 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from core.events import CONSUMERS, consume, replay
+
+class Command(BaseCommand):
+    help = "Keep the guest stats derived from the booking event log up to date"
+
+    def add_arguments(self, parser):
+        parser.add_argument('consumers', nargs='*', help=f"Consumers to run (default: all of {', '.join(CONSUMERS)})")
+        parser.add_argument('--once', action='store_true', help="Apply what is in the log and exit")
+        parser.add_argument('--replay', action='store_true', help="Rebuild from the start of the log, then exit")
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--sleep', type=float, default=1.0, help="Seconds to wait when the log is drained")
+
+    def handle(self, *args, **options):
+        names = options['consumers'] or list(CONSUMERS)
+        unknown = set(names) - set(CONSUMERS)
+        if unknown:
+            raise CommandError(f"Unknown consumers: {', '.join(sorted(unknown))}.")
+
+        if options['replay']:
+            for name in names:
+                started = time.perf_counter()
+                applied = replay(name, options['batch_size'])
+                self.stdout.write(self.style.SUCCESS(
+                    f"Replayed {applied} events into {name} in {time.perf_counter() - started:.1f}s."
+                ))
+            return
+
+        applied = 0
+        while True:
+            close_old_connections() # Long-running worker: drop connections the database may have timed out
+            count = sum(consume(name, options['batch_size']) for name in names)
+            applied += count
+            if count:
+                continue
+            if options['once']:
+                break
+            time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(f"Applied {applied} events."))
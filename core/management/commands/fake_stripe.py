@@ -0,0 +1,97 @@
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+from django.core.management.base import BaseCommand
+
+class FakeStripe(ThreadingHTTPServer):
+    # Just enough of POST /v1/payment_intents to benchmark the gateway locally: a fixed service time, replays of
+    # idempotency keys, and optionally 500s sent after the intent was created, like a response lost on the way back
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.0, fail_rate=0.0):
+        super().__init__(address, FakeStripeHandler)
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.lock = threading.Lock()
+        self.intents = {} # Idempotency key -> response body
+        self.created = 0
+        self.requests = 0
+        self.connections = 0
+
+    @property
+    def url(self):
+        return f'http://{self.server_address[0]}:{self.server_address[1]}'
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def create_intent(self, params, idempotency_key):
+        with self.lock:
+            self.requests += 1
+            if idempotency_key and idempotency_key in self.intents:
+                return self.intents[idempotency_key], True
+            self.created += 1
+            intent_id = f'pi_fake_{self.created}'
+            body = json.dumps({
+                'id': intent_id,
+                'object': 'payment_intent',
+                'amount': int(params.get('amount', ['0'])[0]),
+                'currency': params.get('currency', ['usd'])[0],
+                'client_secret': f'{intent_id}_secret',
+                'status': 'requires_payment_method',
+            }).encode()
+            if idempotency_key:
+                self.intents[idempotency_key] = body
+            return body, False
+
+class FakeStripeHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1' # Keep-alive, so connection reuse shows up in the counters
+
+    def handle(self):
+        with self.server.lock:
+            self.server.connections += 1
+        super().handle()
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        params = parse_qs(self.rfile.read(length).decode())
+        time.sleep(self.server.latency)
+
+        if self.path != '/v1/payment_intents':
+            return self.reply(404, b'{"error": {"message": "Unknown path"}}')
+        body, replayed = self.server.create_intent(params, self.headers.get('Idempotency-Key'))
+        if random.random() < self.server.fail_rate:
+            return self.reply(500, b'{"error": {"type": "api_error", "message": "Simulated failure"}}')
+        self.reply(200, body, {'Idempotent-Replayed': 'true'} if replayed else {})
+
+    def reply(self, status, body, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class Command(BaseCommand):
+    help = "Run a local fake Stripe API; point STRIPE_API_BASE at it"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--port', type=int, default=12111)
+        parser.add_argument('--latency', type=float, default=0.05, help="Seconds spent on every request")
+        parser.add_argument('--fail-rate', type=float, default=0.0, help="Share of responses replaced by a 500")
+
+    def handle(self, *args, **options):
+        server = FakeStripe(('127.0.0.1', options['port']), options['latency'], options['fail_rate'])
+        self.stdout.write(f"Fake Stripe listening on {server.url}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
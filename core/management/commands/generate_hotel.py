@@ -0,0 +1,216 @@
+import random
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.utils import timezone
+from core.cache import bump_version
+from core.events import event_data
+from core.inventory import room_cache
+from core.models import ArchivedStay, Booking, BookingArchive, BookingEvent, ConsumerOffset, DailyRevenue, Guest, \
+    GuestStats, Invoice, OccupancyDay, OutboxJob, Room, RoomNight, country_from_address
+
+# Share of the rooms and base nightly price per room type
+ROOM_MIX = {
+    'Q': (30, 110),
+    'K': (25, 130),
+    'QD': (20, 150),
+    'KD': (15, 170),
+    'QS': (6, 280),
+    'KS': (4, 320),
+}
+ROOMS_PER_FLOOR = 40
+STAY_LENGTHS = {1: 20, 2: 25, 3: 20, 4: 12, 5: 8, 6: 5, 7: 5, 10: 3, 14: 2} # Nights and their weight
+
+FIRST_NAMES = ['James', 'Mary', 'John', 'Patricia', 'Robert', 'Jennifer', 'Michael', 'Linda', 'David', 'Elizabeth',
+               'William', 'Barbara', 'Richard', 'Susan', 'Joseph', 'Jessica', 'Thomas', 'Sarah', 'Carlos', 'Yuki',
+               'Ahmed', 'Priya', 'Wei', 'Olga', 'Lucas', 'Sofia', 'Noah', 'Emma', 'Mateo', 'Aisha']
+LAST_NAMES = ['Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis', 'Rodriguez', 'Martinez',
+              'Hernandez', 'Lopez', 'Wilson', 'Anderson', 'Thomas', 'Taylor', 'Moore', 'Jackson', 'Martin', 'Lee',
+              'Tanaka', 'Khan', 'Patel', 'Wang', 'Ivanova', 'Silva', 'Rossi', 'Muller', 'Dubois', 'Kowalski']
+STREETS = ['Main St', 'Oak Ave', 'Maple Rd', 'Cedar Ln', 'Park Blvd', 'High St', 'Lake Dr', 'Hill Rd']
+CITIES = { # Country -> (weight, cities)
+    'USA': (55, ['Springfield', 'Austin', 'Denver', 'Boston', 'Seattle', 'Miami']),
+    'Canada': (10, ['Toronto', 'Vancouver', 'Montreal']),
+    'UK': (8, ['London', 'Manchester', 'Leeds']),
+    'Germany': (6, ['Berlin', 'Munich', 'Hamburg']),
+    'Mexico': (6, ['Mexico City', 'Guadalajara']),
+    'Japan': (5, ['Tokyo', 'Osaka']),
+    'France': (5, ['Paris', 'Lyon']),
+    'India': (5, ['Mumbai', 'Delhi']),
+}
+
+class Command(BaseCommand):
+    help = "Fill the database with a synthetic hotel: rooms, guests, and years of bookings and invoices"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rooms', type=int, default=200)
+        parser.add_argument('--guests', type=int, default=20000)
+        parser.add_argument('--years', type=float, default=3, help="Booking history before today")
+        parser.add_argument('--future-days', type=int, default=180, help="Reservations after today")
+        parser.add_argument('--occupancy', type=float, default=0.75, help="Target share of room nights sold")
+        parser.add_argument('--cancel-rate', type=float, default=0.05)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--clear', action='store_true', help="Remove the existing hotel data first")
+
+    def handle(self, *args, **options):
+        if not 0 < options['occupancy'] < 1:
+            raise CommandError("--occupancy must be between 0 and 1.")
+        if options['rooms'] > ROOMS_PER_FLOOR * 999:
+            raise CommandError(f"At most {ROOMS_PER_FLOOR * 999} rooms fit the room number format.")
+
+        rng = random.Random(options['seed'])
+        batch_size = options['batch_size']
+
+        with transaction.atomic():
+            if options['clear']:
+                self.clear()
+            elif Room.objects.exists():
+                raise CommandError("The database already has rooms; run with --clear to replace them.")
+
+            rooms = Room.objects.bulk_create(self.make_rooms(rng, options['rooms']), batch_size=batch_size)
+            guests = Guest.objects.bulk_create(self.make_guests(rng, options['guests']), batch_size=batch_size)
+            bookings = Booking.objects.bulk_create(self.make_bookings(rng, rooms, guests, options),
+                                                   batch_size=batch_size)
+            invoices = Invoice.objects.bulk_create(self.make_invoices(rng, bookings), batch_size=batch_size)
+            events = BookingEvent.objects.bulk_create(self.make_events(rng, bookings, invoices),
+                                                      batch_size=batch_size)
+
+            # In house rooms are marked occupied, like check-in does
+            Room.objects.filter(bookings__status='checked_in').update(is_available=False)
+
+        # bulk_create skips the signals that maintain the derived tables and caches
+        call_command('backfill_room_nights', batch_size=batch_size, stdout=self.stdout)
+        call_command('rebuild_revenue_rollup', batch_size=batch_size, stdout=self.stdout)
+        call_command('consume_events', replay=True, batch_size=batch_size, stdout=self.stdout)
+        room_cache.invalidate()
+        bump_version('guests')
+        bump_version('bookings')
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated {len(rooms)} rooms, {len(guests)} guests, {len(bookings)} bookings, {len(invoices)} invoices "
+            f"and {len(events)} booking events."
+        ))
+
+    def clear(self):
+        # Truncate rather than delete row by row: the per-object delete signals would take hours on a large hotel
+        models = [RoomNight, OccupancyDay, DailyRevenue, OutboxJob, BookingEvent, ConsumerOffset, GuestStats,
+                  BookingArchive, ArchivedStay, Invoice, Booking, Guest, Room]
+        statements = connection.ops.sql_flush(no_style(), [model._meta.db_table for model in models],
+                                              reset_sequences=True)
+        connection.ops.execute_sql_flush(statements)
+
+    def make_rooms(self, rng, count):
+        room_types = rng.choices(list(ROOM_MIX), weights=[share for share, _ in ROOM_MIX.values()], k=count)
+        return [
+            Room(
+                number=f'{n // ROOMS_PER_FLOOR + 1}{n % ROOMS_PER_FLOOR + 1:02d}',
+                room_type=room_type,
+                price=(Decimal(ROOM_MIX[room_type][1]) * Decimal(rng.uniform(0.9, 1.1))).quantize(Decimal('1')),
+            )
+            for n, room_type in enumerate(room_types)
+        ]
+
+    def make_guests(self, rng, count):
+        countries = list(CITIES)
+        weights = [weight for weight, _ in CITIES.values()]
+        today = date.today()
+        guests = []
+        for n in range(count):
+            first_name, last_name = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+            country = rng.choices(countries, weights=weights)[0]
+            address = f'{rng.randint(1, 9999)} {rng.choice(STREETS)}, {rng.choice(CITIES[country][1])}, {country}'
+            guests.append(Guest(
+                first_name=first_name,
+                last_name=last_name,
+                email=f'{first_name}.{last_name}.{n}@example.com'.lower(),
+                phone_number=f'555{rng.randrange(10 ** 7):07d}',
+                address=address,
+                country=country_from_address(address), # Set by save(), which bulk_create skips
+                date_of_birth=today - timedelta(days=rng.randint(18 * 365 + 5, 85 * 365)),
+            ))
+        return guests
+
+    def make_bookings(self, rng, rooms, guests, options):
+        today = date.today()
+        start = today - timedelta(days=int(options['years'] * 365))
+        end = today + timedelta(days=options['future_days'])
+        lengths = list(STAY_LENGTHS)
+        weights = list(STAY_LENGTHS.values())
+        mean_stay = sum(nights * weight for nights, weight in STAY_LENGTHS.items()) / sum(weights)
+        # Empty nights between stays, on average, for the target occupancy
+        mean_gap = mean_stay * (1 - options['occupancy']) / options['occupancy']
+
+        bookings = []
+        for room in rooms:
+            check_in_date = start + timedelta(days=round(rng.expovariate(1 / mean_gap)))
+            while check_in_date < end:
+                check_out_date = check_in_date + timedelta(days=rng.choices(lengths, weights=weights)[0])
+                if rng.random() < options['cancel_rate']:
+                    booking_status = 'cancelled'
+                elif check_out_date <= today:
+                    booking_status = 'checked_out'
+                elif check_in_date <= today:
+                    booking_status = 'checked_in'
+                else:
+                    booking_status = 'reserved'
+
+                bookings.append(Booking(
+                    guest=rng.choice(guests),
+                    room=room,
+                    check_in_date=check_in_date,
+                    check_out_date=check_out_date,
+                    total_price=room.price * (check_out_date - check_in_date).days,
+                    is_active=booking_status in ('reserved', 'checked_in'),
+                    payment_method=rng.choice(['credit_card', 'credit_card', 'cash']),
+                    status=booking_status,
+                ))
+                # A cancelled stay leaves its nights free for the next booking
+                next_free = check_in_date + timedelta(days=1) if booking_status == 'cancelled' else check_out_date
+                check_in_date = next_free + timedelta(days=round(rng.expovariate(1 / mean_gap)))
+        return bookings
+
+    def make_invoices(self, rng, bookings):
+        return [
+            Invoice(
+                booking=booking,
+                amount=booking.total_price,
+                payment_method=booking.payment_method,
+                is_paid=rng.random() < 0.97,
+            )
+            for booking in bookings if booking.status == 'checked_out'
+        ]
+
+    def make_events(self, rng, bookings, invoices):
+        # The history that led to each booking's state, in the order it happened: booked up to 90 days ahead,
+        # checked in at 15:00, out at 11:00 and invoiced and paid right after, or now for what happened earlier today
+        now = timezone.now()
+        at = lambda day, hour, minute=0: min(datetime.combine(day, time(hour, minute), tzinfo=dt_timezone.utc), now)
+        invoices = {invoice.booking_id: invoice for invoice in invoices}
+
+        history = []
+        for booking in bookings:
+            created_at = min(at(booking.check_in_date, 12) - timedelta(minutes=rng.randint(60, 90 * 24 * 60)),
+                             now - timedelta(minutes=rng.randint(1, 24 * 60)))
+            steps = [(created_at, 'created', {})]
+            if booking.status == 'cancelled':
+                steps.append((created_at + (at(booking.check_in_date, 12) - created_at) / 2, 'cancelled', {}))
+            if booking.status in ('checked_in', 'checked_out'):
+                steps.append((at(booking.check_in_date, 15), 'checked_in', {}))
+            if booking.status == 'checked_out':
+                steps.append((at(booking.check_out_date, 11), 'checked_out',
+                              {'nights': (booking.check_out_date - booking.check_in_date).days}))
+                invoice = invoices[booking.pk]
+                steps.append((at(booking.check_out_date, 11, 5), 'invoiced', {'amount': str(invoice.amount)}))
+                if invoice.is_paid:
+                    steps.append((at(booking.check_out_date, 11, 10), 'paid', {'amount': str(invoice.amount)}))
+
+            history.extend(
+                BookingEvent(booking_id=booking.pk, kind=kind, data=event_data(kind, booking, **data), created_at=when)
+                for when, kind, data in steps
+            )
+        history.sort(key=lambda event: event.created_at)
+        return history
@@ -0,0 +1,26 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from core.outbox import run_pending
+
+class Command(BaseCommand):
+    help = "Drain the background job outbox (invoices on check-out and friends)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Drain what is pending and exit")
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--sleep', type=float, default=1.0, help="Seconds to wait when the outbox is empty")
+
+    def handle(self, *args, **options):
+        processed = 0
+        while True:
+            close_old_connections() # Long-running worker: drop connections the database may have timed out
+            count = run_pending(options['batch_size'])
+            processed += count
+            if count:
+                continue
+            if options['once']:
+                break
+            time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(f"Processed {processed} jobs."))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from core.revenue import rebuild_rollup
+
+class Command(BaseCommand):
+    help = "Rebuild the daily revenue rollup from all paid invoices"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        rows = rebuild_rollup(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rows} daily revenue rows."))
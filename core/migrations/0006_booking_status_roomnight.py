@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:26
+
+import django.db.models.deletion
+from datetime import date
+from django.db import migrations, models
+
+
+def set_booking_status(apps, schema_editor):
+    # Before statuses existed, check-in was the only thing that deactivated a booking.
+    # Stays still running today are checked in (and hold their room again), older ones are done.
+    Booking = apps.get_model('core', 'Booking')
+    today = date.today()
+    inactive = Booking.objects.filter(is_active=False)
+    inactive.filter(check_in_date__lte=today, check_out_date__gt=today).update(
+        status='checked_in', is_active=True)
+    inactive.update(status='checked_out')
+
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_userrole_permissions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='status',
+            field=models.CharField(choices=[('reserved', 'Reserved'), ('checked_in', 'Checked In'), ('checked_out', 'Checked Out'), ('cancelled', 'Cancelled')], default='reserved', max_length=12),
+        ),
+        migrations.CreateModel(
+            name='RoomNight',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('night', models.DateField()),
+                ('booking', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='nights', to='core.booking')),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='booked_nights', to='core.room')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['night', 'room'], name='roomnight_night_room_idx')],
+                'constraints': [models.UniqueConstraint(fields=('room', 'night'), name='unique_room_night')],
+            },
+        ),
+        migrations.RunPython(set_booking_status, migrations.RunPython.noop),
+    ]
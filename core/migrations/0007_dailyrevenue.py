@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_booking_status_roomnight'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyRevenue',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('room_type', models.CharField(choices=[('Q', 'Single Queen'), ('K', 'Single King'), ('QD', 'Double Queen'), ('KD', 'Double King'), ('QS', 'Queen Suite'), ('KS', 'King Suite')], max_length=2)),
+                ('payment_method', models.CharField(choices=[('credit_card', 'Credit Card'), ('cash', 'Cash')], max_length=20)),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('date', 'room_type', 'payment_method'), name='unique_daily_revenue')],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:29
+
+from django.db import migrations, models
+
+
+def fill_country(apps, schema_editor):
+    Guest = apps.get_model('core', 'Guest')
+    guests = []
+    for guest in Guest.objects.exclude(address='').only('id', 'address').iterator(chunk_size=2000):
+        guest.country = guest.address.split(',')[-1].strip()
+        guests.append(guest)
+        if len(guests) >= 2000:
+            Guest.objects.bulk_update(guests, ['country'])
+            guests = []
+    Guest.objects.bulk_update(guests, ['country'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_dailyrevenue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='guest',
+            name='country',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=100),
+        ),
+        migrations.RunPython(fill_country, migrations.RunPython.noop),
+    ]
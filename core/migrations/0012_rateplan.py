@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_outboxjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RatePlan',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('room_type', models.CharField(blank=True, choices=[('Q', 'Single Queen'), ('K', 'Single King'), ('QD', 'Double Queen'), ('KD', 'Double King'), ('QS', 'Queen Suite'), ('KS', 'King Suite')], max_length=2)),
+                ('start_date', models.DateField(blank=True, null=True)),
+                ('end_date', models.DateField(blank=True, null=True)),
+                ('weekdays', models.CharField(blank=True, max_length=7)),
+                ('min_nights', models.PositiveIntegerField(default=1)),
+                ('min_occupancy', models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True)),
+                ('multiplier', models.DecimalField(decimal_places=3, max_digits=5)),
+                ('is_active', models.BooleanField(default=True)),
+            ],
+        ),
+    ]
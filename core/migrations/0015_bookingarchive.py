@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:50
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+# On PostgreSQL the archive is partitioned by check-in month, one partition per month, created by
+# core.archive.ensure_partition as months are archived. The table is still empty here, so it is swapped for the
+# partitioned one. A partitioned table's primary key has to include the partition key, hence (id, month); ids still
+# come from one sequence, so Django can go on treating id as the key. Dropping the table drops its partitions too.
+def partition_archive(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute("DROP TABLE core_bookingarchive")
+        schema_editor.execute(
+            "CREATE TABLE core_bookingarchive ("
+            "id bigint GENERATED BY DEFAULT AS IDENTITY, "
+            "month date NOT NULL, "
+            "bookings integer NOT NULL, "
+            "revenue numeric(12, 2) NOT NULL, "
+            "last_check_out date NOT NULL, "
+            "data bytea NOT NULL, "
+            "created_at timestamp with time zone NOT NULL, "
+            "PRIMARY KEY (id, month)"
+            ") PARTITION BY RANGE (month)"
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_booking_events'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookingArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('bookings', models.IntegerField()),
+                ('revenue', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('last_check_out', models.DateField()),
+                ('data', models.BinaryField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.RunPython(partition_archive, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:02
+
+import json
+import zlib
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Index the stays archived before this table existed
+def index_archived_stays(apps, schema_editor):
+    BookingArchive = apps.get_model('core', 'BookingArchive')
+    ArchivedStay = apps.get_model('core', 'ArchivedStay')
+    for data in BookingArchive.objects.values_list('data', flat=True).iterator():
+        batch = json.loads(zlib.decompress(data))
+        stays = [dict(zip(batch['fields'], row)) for row in batch['rows']]
+        ArchivedStay.objects.bulk_create([
+            ArchivedStay(guest_id=stay['guest'], room_type=stay['room_type'], check_in_date=stay['check_in_date'],
+                         check_out_date=stay['check_out_date'])
+            for stay in stays if stay['status'] != 'cancelled'
+        ], batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_bookingarchive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedStay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('room_type', models.CharField(choices=[('Q', 'Single Queen'), ('K', 'Single King'), ('QD', 'Double Queen'), ('KD', 'Double King'), ('QS', 'Queen Suite'), ('KS', 'King Suite')], max_length=2)),
+                ('check_in_date', models.DateField()),
+                ('check_out_date', models.DateField()),
+                ('guest', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='core.guest')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['check_out_date', 'check_in_date', 'guest'], name='archivedstay_dates_idx')],
+            },
+        ),
+        migrations.RunPython(index_archived_stays, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_archivedstay'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='bookingevent',
+            name='kind',
+            field=models.CharField(choices=[('created', 'Created'), ('checked_in', 'Checked In'), ('checked_out', 'Checked Out'), ('cancelled', 'Cancelled'), ('invoiced', 'Invoiced'), ('paid', 'Paid'), ('updated', 'Updated'), ('deleted', 'Deleted')], max_length=12),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import Permission, User
 
 # Create your models here.
@@ -9,10 +10,22 @@ class Guest(models.Model):
     phone_number = models.CharField(max_length=15)
     address = models.TextField(blank=True) # Allow blank addresses
     date_of_birth=models.DateField()
+    country = models.CharField(max_length=100, blank=True, db_index=True, editable=False) # Derived from address on save
 
     def __str__(self):
         return f"{self.first_name} {self.last_name}"
 
+    def save(self, *args, **kwargs):
+        self.country = country_from_address(self.address)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'address' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'country'}
+        super().save(*args, **kwargs)
+
+def country_from_address(address):
+    # Addresses are free text; by convention the country is the last comma-separated part
+    return address.split(',')[-1].strip() if address else ''
+
 class Room(models.Model):
     ROOM_TYPES = (
         ('Q', 'Single Queen'),
@@ -30,7 +43,29 @@ class Room(models.Model):
     def __str__(self):
         return f"Room {self.number} ({self.room_type})"
 
+class RatePlan(models.Model):
+    # A pricing rule: the room's base price is multiplied by `multiplier` on every night the rule matches.
+    # Conditions left empty always match; every matching rule applies (see core.pricing).
+    name = models.CharField(max_length=100)
+    room_type = models.CharField(max_length=2, choices=Room.ROOM_TYPES, blank=True) # Blank for every type
+    start_date = models.DateField(null=True, blank=True) # Season, both ends inclusive
+    end_date = models.DateField(null=True, blank=True)
+    weekdays = models.CharField(max_length=7, blank=True) # Nights it applies to, as digits: '45' is Friday and Saturday
+    min_nights = models.PositiveIntegerField(default=1) # Length-of-stay rule when above 1
+    min_occupancy = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True) # Percent of rooms sold
+    multiplier = models.DecimalField(max_digits=5, decimal_places=3)
+    is_active = models.BooleanField(default=True)
+
+    def __str__(self):
+        return f"{self.name} (x{self.multiplier})"
+
 class Booking(models.Model):
+    STATUS_CHOICES = (
+        ('reserved', 'Reserved'),
+        ('checked_in', 'Checked In'),
+        ('checked_out', 'Checked Out'),
+        ('cancelled', 'Cancelled'),
+    )
     guest = models.ForeignKey(Guest, on_delete=models.CASCADE, related_name='bookings')
     room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='bookings')
     check_in_date = models.DateField()
@@ -41,10 +76,50 @@ class Booking(models.Model):
         ('credit_card', 'Credit Card'),
         ('cash', 'Cash'),
     ), null=True, blank=True)
+    status = models.CharField(max_length=12, choices=STATUS_CHOICES, default='reserved')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['check_in_date', 'id'], name='booking_checkin_id_idx'), # Keyset pagination order
+            # Stays overlapping a date window (reports); covers guest_id so the guests are read from the index alone.
+            # On PostgreSQL migration 0013 adds a GiST index over daterange(check_in_date, check_out_date) as well.
+            models.Index(fields=['check_out_date', 'check_in_date', 'guest'], condition=~models.Q(status='cancelled'),
+                         name='booking_stay_dates_idx'),
+        ]
 
     def __str__(self):
         return f"Booking for {self.guest.first_name} in Room {self.room.number}"
     
+class RoomNight(models.Model):
+    # Availability index: one row per room per booked night, kept in sync with Booking by core.signals
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='booked_nights')
+    booking = models.ForeignKey(Booking, on_delete=models.CASCADE, related_name='nights')
+    night = models.DateField()
+    amount = models.DecimalField(max_digits=10, decimal_places=2, default=0) # Booking's total_price spread over its nights
+
+    class Meta:
+        constraints = [
+            # Two bookings can never hold the same room on the same night, even under concurrent writes
+            models.UniqueConstraint(fields=['room', 'night'], name='unique_room_night'),
+        ]
+        indexes = [
+            models.Index(fields=['night', 'room'], name='roomnight_night_room_idx'),
+        ]
+
+    def __str__(self):
+        return f"Room {self.room_id} on {self.night}"
+
+class OccupancyDay(models.Model):
+    # Materialized occupancy timeline, one row per date, maintained from availability index changes (core.occupancy)
+    date = models.DateField(unique=True)
+    rooms_sold = models.IntegerField(default=0)
+    arrivals = models.IntegerField(default=0)
+    departures = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0) # Room revenue on the books for the night
+
+    def __str__(self):
+        return f"Occupancy on {self.date}"
+
 class Invoice(models.Model):
     booking = models.OneToOneField(Booking, on_delete=models.CASCADE)
     amount = models.DecimalField(max_digits=10, decimal_places=2)
@@ -55,7 +130,125 @@ class Invoice(models.Model):
     is_paid = models.BooleanField(default=False)
 
     def __str__(self):
-        return f"Invoice for Booking {self.booking.id}"
+        return f"Invoice for Booking {self.booking_id}"
+
+class DailyRevenue(models.Model):
+    # Paid revenue rollup per night of stay, room type and payment method, kept in sync with Invoice by core.signals
+    date = models.DateField()
+    room_type = models.CharField(max_length=2, choices=Room.ROOM_TYPES)
+    payment_method = models.CharField(max_length=20, choices=(
+        ('credit_card', 'Credit Card'),
+        ('cash', 'Cash'),
+    ))
+    amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'room_type', 'payment_method'], name='unique_daily_revenue'),
+        ]
+
+    def __str__(self):
+        return f"Revenue on {self.date} ({self.room_type}, {self.payment_method})"
+
+class OutboxJob(models.Model):
+    # Background work committed in the same transaction as the change that caused it, drained by process_outbox
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    )
+    kind = models.CharField(max_length=50)
+    idempotency_key = models.CharField(max_length=100, unique=True) # Enqueueing the same work twice is a no-op
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.IntegerField(default=0)
+    available_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'available_at'], name='outbox_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} ({self.idempotency_key})"
+
+class BookingEvent(models.Model):
+    # Append-only log of booking lifecycle changes, each written in the same transaction as the change (see
+    # core.events). The id orders the log; guest stats are maintained by a consumer reading it in that order.
+    KINDS = (
+        ('created', 'Created'),
+        ('checked_in', 'Checked In'),
+        ('checked_out', 'Checked Out'),
+        ('cancelled', 'Cancelled'),
+        ('invoiced', 'Invoiced'),
+        ('paid', 'Paid'),
+        ('updated', 'Updated'), # Any other change to the booking, see core.events.record_changes
+        ('deleted', 'Deleted'),
+    )
+    # No database constraint and no cascade: the history outlives the booking
+    booking = models.ForeignKey(Booking, on_delete=models.DO_NOTHING, db_constraint=False, related_name='events')
+    kind = models.CharField(max_length=12, choices=KINDS)
+    data = models.JSONField(default=dict) # What consumers need, as it was when the event happened
+    created_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.kind} (Booking {self.booking_id})"
+
+class ConsumerOffset(models.Model):
+    # Id of the last event each consumer of the booking event log has applied
+    name = models.CharField(max_length=50, unique=True)
+    position = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} at {self.position}"
+
+class GuestStats(models.Model):
+    # Lifetime figures per guest, maintained from the booking event log (core.events.GuestStatsConsumer)
+    guest = models.OneToOneField(Guest, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    bookings = models.IntegerField(default=0)
+    cancellations = models.IntegerField(default=0)
+    stays = models.IntegerField(default=0)
+    nights = models.IntegerField(default=0) # Nights actually stayed, early check-outs included
+    billed = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    paid = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    last_stay = models.DateField(null=True, blank=True) # Last check-out
+
+    def __str__(self):
+        return f"Stats for Guest {self.guest_id}"
+
+class BookingArchive(models.Model):
+    # Closed stays moved out of Booking, Invoice and RoomNight by archive_bookings (see core.archive): one row per
+    # batch of stays that checked in the same month, holding them as compressed JSON. On PostgreSQL the table is
+    # partitioned by month (migration 0015), so reads bounded by date only touch the months they need.
+    month = models.DateField() # First day of the check-in month
+    bookings = models.IntegerField()
+    revenue = models.DecimalField(max_digits=12, decimal_places=2) # Paid invoices of the batch
+    last_check_out = models.DateField()
+    data = models.BinaryField()
+    created_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"Archived stays of {self.month:%B %Y} ({self.bookings})"
+
+class ArchivedStay(models.Model):
+    # Who stayed when, for each non-cancelled stay in BookingArchive, so reports can select archived guests in SQL
+    # without decompressing the archive. Written by core.archive.archive_month alongside the archive rows.
+    guest = models.ForeignKey(Guest, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    room_type = models.CharField(max_length=2, choices=Room.ROOM_TYPES)
+    check_in_date = models.DateField()
+    check_out_date = models.DateField()
+
+    class Meta:
+        indexes = [
+            # Stays overlapping a date window, guests read from the index alone, like booking_stay_dates_idx
+            models.Index(fields=['check_out_date', 'check_in_date', 'guest'], name='archivedstay_dates_idx'),
+        ]
+
+    def __str__(self):
+        return f"Archived stay of Guest {self.guest_id} from {self.check_in_date}"
 
 class UserRole(models.Model):
     name = models.CharField(max_length=20, unique=True)
@@ -0,0 +1,130 @@
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import Count, F, Max, Min, Sum
+from .archive import all_archived_stays
+from .availability import nightly_amounts
+from .models import Booking, OccupancyDay, RoomNight
+
+def stay_bounds(rows):
+    # Arrival and departure date of a booking's held (room id, night, amount) rows
+    if not rows:
+        return None
+    nights = [night for _, night, _ in rows]
+    return min(nights), max(nights) + timedelta(days=1)
+
+def occupancy_deltas(changes):
+    # changes: (before, after) row sets per booking, as returned by core.availability
+    deltas = defaultdict(lambda: [0, 0, 0, Decimal('0')]) # rooms_sold, arrivals, departures, revenue
+    for before, after in changes:
+        for _, night, amount in before - after:
+            deltas[night][0] -= 1
+            deltas[night][3] -= amount
+        for _, night, amount in after - before:
+            deltas[night][0] += 1
+            deltas[night][3] += amount
+
+        # An early check-out moves the departure, a cancellation removes the arrival and departure
+        before_stay, after_stay = stay_bounds(before), stay_bounds(after)
+        if before_stay != after_stay:
+            if before_stay:
+                deltas[before_stay[0]][1] -= 1
+                deltas[before_stay[1]][2] -= 1
+            if after_stay:
+                deltas[after_stay[0]][1] += 1
+                deltas[after_stay[1]][2] += 1
+
+    return {day: delta for day, delta in deltas.items() if any(delta)}
+
+def apply_occupancy_changes(changes):
+    apply_occupancy_deltas(occupancy_deltas(changes))
+
+def apply_same_day_stay(day):
+    # A guest who checks in and out on the same day holds no nights, so the index has nothing to show for the
+    # stay; its arrival and departure are counted here instead
+    apply_occupancy_deltas({day: [0, 1, 1, Decimal('0')]})
+
+def apply_occupancy_deltas(deltas):
+    if not deltas:
+        return
+
+    with transaction.atomic():
+        OccupancyDay.objects.bulk_create([OccupancyDay(date=day) for day in deltas], ignore_conflicts=True)
+        # In date order, so concurrent writers lock the rows in the same order
+        for day, (rooms_sold, arrivals, departures, revenue) in sorted(deltas.items()):
+            OccupancyDay.objects.filter(date=day).update(
+                rooms_sold=F('rooms_sold') + rooms_sold,
+                arrivals=F('arrivals') + arrivals,
+                departures=F('departures') + departures,
+                revenue=F('revenue') + revenue,
+            )
+
+def rebuild_timeline(batch_size=2000):
+    # Recompute every day from the availability index and the archive
+    days = defaultdict(lambda: [0, 0, 0, Decimal('0')])
+    for night, rooms_sold, revenue in RoomNight.objects.values_list('night').annotate(
+        rooms_sold=Count('id'), revenue=Sum('amount'),
+    ).iterator(chunk_size=batch_size):
+        days[night][0] = rooms_sold
+        days[night][3] = revenue
+
+    for arrival, last_night in RoomNight.objects.values_list('booking_id').annotate(
+        arrival=Min('night'), last_night=Max('night'),
+    ).values_list('arrival', 'last_night').iterator(chunk_size=batch_size):
+        days[arrival][1] += 1
+        days[last_night + timedelta(days=1)][2] += 1
+
+    # Same-day stays, see apply_same_day_stay
+    for day in Booking.objects.filter(status='checked_out', nights__isnull=True).values_list(
+        'check_in_date', flat=True,
+    ).iterator(chunk_size=batch_size):
+        days[day][1] += 1
+        days[day][2] += 1
+
+    # Stays moved to the archive, from the nights they held when they were archived
+    for stay in all_archived_stays():
+        check_in_date = date.fromisoformat(stay['check_in_date'])
+        if not stay['nights']:
+            if stay['status'] == 'checked_out':
+                days[check_in_date][1] += 1
+                days[check_in_date][2] += 1
+            continue
+        nights = nightly_amounts(Decimal(stay['total_price']), check_in_date,
+                                 date.fromisoformat(stay['check_out_date']))[:stay['nights']]
+        for night, amount in nights:
+            days[night][0] += 1
+            days[night][3] += amount
+        days[check_in_date][1] += 1
+        days[nights[-1][0] + timedelta(days=1)][2] += 1
+
+    with transaction.atomic():
+        OccupancyDay.objects.all().delete()
+        OccupancyDay.objects.bulk_create([
+            OccupancyDay(date=day, rooms_sold=rooms_sold, arrivals=arrivals, departures=departures, revenue=revenue)
+            for day, (rooms_sold, arrivals, departures, revenue) in days.items()
+        ], batch_size=batch_size)
+
+    return len(days)
+
+def occupancy_timeline(start_date, end_date, total_rooms):
+    # Every date in the range, including the ones nothing has been booked on yet
+    stored = {day.date: day for day in OccupancyDay.objects.filter(date__range=(start_date, end_date))}
+
+    timeline = []
+    day = start_date
+    while day <= end_date:
+        row = stored.get(day) or OccupancyDay(date=day, revenue=Decimal('0.00'))
+        timeline.append({
+            'date': day,
+            'rooms_sold': row.rooms_sold,
+            'arrivals': row.arrivals,
+            'departures': row.departures,
+            'revenue': row.revenue,
+            'occupancy_rate': occupancy_rate(row.rooms_sold, total_rooms),
+        })
+        day += timedelta(days=1)
+    return timeline
+
+def occupancy_rate(rooms_sold, total_rooms):
+    return (rooms_sold / total_rooms) * 100 if total_rooms > 0 else 0
@@ -0,0 +1,66 @@
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .models import Booking, Invoice, OutboxJob
+
+logger = logging.getLogger(__name__)
+
+# Job kind -> function called with the job's payload as keyword arguments
+HANDLERS = {}
+
+def handler(kind):
+    def register(func):
+        HANDLERS[kind] = func
+        return func
+    return register
+
+def enqueue(kind, idempotency_key, **payload):
+    # Call inside the transaction that makes the change, so the job exists if and only if the change committed.
+    # Returns False if a job with this key was already queued.
+    job, created = OutboxJob.objects.get_or_create(
+        idempotency_key=idempotency_key,
+        defaults={'kind': kind, 'payload': payload},
+    )
+    if created and settings.OUTBOX_INLINE: # No worker (development, benchmarks): run it right away
+        run_job(job)
+    return created
+
+def run_job(job):
+    try:
+        with transaction.atomic():
+            HANDLERS[job.kind](**job.payload)
+    except Exception as exc:
+        job.attempts += 1
+        job.last_error = f"{type(exc).__name__}: {exc}"
+        if job.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+            job.status = 'failed'
+            logger.error("Outbox job %s failed for good: %s", job, job.last_error)
+        else:
+            # Exponential backoff: 2, 4, 8, ... seconds
+            job.available_at = timezone.now() + timedelta(seconds=2 ** job.attempts)
+    else:
+        job.status = 'done'
+    job.save(update_fields=['status', 'attempts', 'available_at', 'last_error'])
+
+def run_pending(batch_size=100):
+    # SKIP LOCKED lets several workers drain the table side by side without taking the same job
+    with transaction.atomic():
+        jobs = list(OutboxJob.objects.select_for_update(skip_locked=True).filter(
+            status='pending',
+            available_at__lte=timezone.now(),
+        ).order_by('id')[:batch_size])
+        for job in jobs:
+            run_job(job)
+    return len(jobs)
+
+# Create Invoice Function
+@handler('create_invoice')
+def create_invoice(booking_id):
+    booking = Booking.objects.get(pk=booking_id)
+    # get_or_create keeps a replayed job from tripping over the one-invoice-per-booking constraint
+    Invoice.objects.get_or_create(booking=booking, defaults={
+        'amount': booking.total_price,
+        'payment_method': booking.payment_method, # Add payment method
+    })
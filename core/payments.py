@@ -0,0 +1,89 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import cache
+import requests
+import stripe
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+CURRENCY = 'usd'
+
+def amount_in_cents(amount):
+    return int(amount * 100)
+
+def payment_intent_key(booking, amount):
+    # The amount is part of the key: Stripe rejects a replayed key with different parameters, so a booking whose
+    # total changed gets a fresh intent while a retried request for the same total gets the original one back
+    return f'payment-intent:{booking.pk}:{amount}'
+
+class StripeGateway:
+    # One Stripe client per process. Requests go over a shared keep-alive connection pool with connect/read
+    # timeouts, and the SDK retries connection errors, 409s and 5xx responses with exponential backoff,
+    # resending the same Idempotency-Key so a retry can never charge twice.
+    def __init__(self, api_key, api_base=None, timeout=(5, 20), max_retries=2, pool_size=20):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+
+        self.async_http_client = async_http_client(timeout[1])
+        # Without an async HTTP library the async methods run the sync client on threads of their own, one per
+        # pooled connection, rather than in the event loop's small default executor
+        self.executor = ThreadPoolExecutor(pool_size, thread_name_prefix='stripe') if self.async_http_client is None \
+            else None
+        self.client = stripe.StripeClient(
+            api_key,
+            base_addresses={'api': api_base} if api_base else None,
+            max_network_retries=max_retries,
+            http_client=stripe.RequestsClient(
+                timeout=timeout,
+                session=session,
+                async_fallback_client=self.async_http_client,
+            ),
+        )
+
+    def create_payment_intent(self, amount, idempotency_key=None, metadata=None):
+        return self.client.v1.payment_intents.create(
+            self.payment_intent_params(amount, metadata),
+            {'idempotency_key': idempotency_key} if idempotency_key else None,
+        )
+
+    async def create_payment_intent_async(self, amount, idempotency_key=None, metadata=None):
+        if self.async_http_client is None:
+            return await sync_to_async(self.create_payment_intent, thread_sensitive=False, executor=self.executor)(
+                amount, idempotency_key, metadata,
+            )
+        return await self.client.v1.payment_intents.create_async(
+            self.payment_intent_params(amount, metadata),
+            {'idempotency_key': idempotency_key} if idempotency_key else None,
+        )
+
+    def payment_intent_params(self, amount, metadata):
+        params = {
+            'amount': amount,
+            'currency': CURRENCY,
+            'automatic_payment_methods': {
+                'enabled': True,
+            },
+        }
+        if metadata:
+            params['metadata'] = metadata
+        return params
+
+def async_http_client(timeout):
+    # httpx is optional; without it the async methods fall back to a thread
+    try:
+        import httpx # noqa: F401
+    except ImportError:
+        return None
+    return stripe.HTTPXClient(timeout=timeout)
+
+@cache
+def get_gateway():
+    return StripeGateway(
+        settings.STRIPE_SECRET_KEY or '',
+        api_base=settings.STRIPE_API_BASE,
+        timeout=(settings.STRIPE_CONNECT_TIMEOUT, settings.STRIPE_READ_TIMEOUT),
+        max_retries=settings.STRIPE_MAX_NETWORK_RETRIES,
+        pool_size=settings.STRIPE_POOL_SIZE,
+    )
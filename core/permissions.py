@@ -1,17 +1,18 @@
 from rest_framework import permissions
+from .roles import request_role_name
 
 class IsGuest(permissions.BasePermission):
     def has_permission(self, request, view):
-        return request.user.userprofile.role.name == 'Guest'
+        return request_role_name(request) == 'Guest'
     
 class IsStaff(permissions.BasePermission):
     def has_permission(self, request, view):
-        return request.user.userprofile.role.name in ['Staff', 'Manager', 'Admin']
+        return request_role_name(request) in ['Staff', 'Manager', 'Admin']
     
 class IsManager(permissions.BasePermission):
     def has_permission(self, request, view):
-        return request.user.userprofile.role.name in ['Manager', 'Admin']
+        return request_role_name(request) in ['Manager', 'Admin']
     
 class IsAdmin(permissions.BasePermission):
     def has_permission(self, request, view):
-        return request.user.userprofile.role.name == 'Admin'
+        return request_role_name(request) == 'Admin'
@@ -0,0 +1,93 @@
+from collections import namedtuple
+from datetime import date, timedelta
+from decimal import Decimal
+from django.conf import settings
+from .availability import CENT, stay_nights
+from .cache import TieredCache
+from .inventory import room_rows
+from .models import OccupancyDay, RatePlan
+from .occupancy import occupancy_rate
+
+# Active rate plans and the rate calendars derived from them; core.signals invalidates both on any RatePlan write
+rate_cache = TieredCache('rates', settings.RATE_CACHE_SIZE, timeout=settings.RATE_CACHE_TIMEOUT)
+
+ONE = Decimal('1')
+
+Rule = namedtuple('Rule', ['room_type', 'start_date', 'end_date', 'weekdays', 'min_nights', 'min_occupancy',
+                           'multiplier'])
+
+def rate_rules():
+    return rate_cache.get_or_load('rules', lambda: [
+        Rule(*values) for values in RatePlan.objects.filter(is_active=True).order_by('pk').values_list(*Rule._fields)
+    ])
+
+def rule_matches(rule, room_type, night):
+    return (
+        (not rule.room_type or rule.room_type == room_type)
+        and (rule.start_date is None or rule.start_date <= night)
+        and (rule.end_date is None or night <= rule.end_date)
+        and (not rule.weekdays or str(night.weekday()) in rule.weekdays)
+    )
+
+def is_static(rule):
+    # Depends only on the room type and the date, so it can be baked into the rate calendar
+    return rule.min_nights <= 1 and rule.min_occupancy is None
+
+def rate_calendar(room_type, year):
+    # Product of the static rules' multipliers for every night of the year, for one room type
+    def build():
+        rules = [rule for rule in rate_rules() if is_static(rule)]
+        factors = []
+        night = date(year, 1, 1)
+        while night.year == year:
+            factor = ONE
+            for rule in rules:
+                if rule_matches(rule, room_type, night):
+                    factor *= rule.multiplier
+            factors.append(factor)
+            night += timedelta(days=1)
+        return factors
+    return rate_cache.get_or_load(f'calendar:{room_type}:{year}', build)
+
+class Pricer:
+    # Prices stays whose nights fall in [start_date, end_date). Occupancy for the whole window is read in one
+    # query, the static part of every night's rate comes from the precomputed calendars, and the per-night
+    # factors are worked out once per room type, so pricing many rooms costs one multiplication per room.
+    def __init__(self, start_date, end_date):
+        total_rooms = len(room_rows())
+        self.occupancy = {
+            day: occupancy_rate(rooms_sold, total_rooms)
+            for day, rooms_sold in OccupancyDay.objects.filter(
+                date__gte=start_date, date__lt=end_date,
+            ).values_list('date', 'rooms_sold')
+        }
+        self.dynamic_rules = [rule for rule in rate_rules() if not is_static(rule)]
+        self.factor_sums = {}
+
+    def night_factors(self, room_type, check_in_date, check_out_date):
+        nights = stay_nights(check_in_date, check_out_date)
+        calendars = {}
+        factors = []
+        for night in nights:
+            if night.year not in calendars:
+                calendars[night.year] = rate_calendar(room_type, night.year)
+            factor = calendars[night.year][night.timetuple().tm_yday - 1]
+            for rule in self.dynamic_rules:
+                if (len(nights) >= rule.min_nights
+                        and (rule.min_occupancy is None or self.occupancy.get(night, 0) >= rule.min_occupancy)
+                        and rule_matches(rule, room_type, night)):
+                    factor *= rule.multiplier
+            factors.append(factor)
+        return factors
+
+    def stay_price(self, room, check_in_date, check_out_date):
+        key = (room.room_type, check_in_date, check_out_date)
+        if key not in self.factor_sums:
+            self.factor_sums[key] = sum(self.night_factors(*key), Decimal('0'))
+        return (room.price * self.factor_sums[key]).quantize(CENT)
+
+    def stay_prices(self, rooms, check_in_date, check_out_date):
+        return {room.pk: self.stay_price(room, check_in_date, check_out_date) for room in rooms}
+
+def price_stay(room, check_in_date, check_out_date):
+    return Pricer(check_in_date, check_out_date).stay_price(room, check_in_date, check_out_date)
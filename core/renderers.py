@@ -0,0 +1,30 @@
+import json
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError: # orjson is optional; without it the standard library encodes, still with compact output
+    orjson = None
+
+drf_encoder = JSONEncoder()
+
+def encode_json(data):
+    # Byte for byte what DRF's JSONRenderer writes with the default settings (compact, UTF-8, \u2028 and \u2029
+    # escaped); types JSON has no form for are converted by DRF's own encoder
+    if orjson is not None:
+        content = orjson.dumps(data, default=drf_encoder.default, option=orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS)
+    else:
+        content = json.dumps(data, cls=JSONEncoder, ensure_ascii=False, allow_nan=False,
+                             separators=(',', ':')).encode()
+    return content.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+
+class FastJSONRenderer(JSONRenderer):
+    # Drop-in for JSONRenderer on hot endpoints; indented output (?format=json with indent, the browsable API)
+    # still goes through the standard implementation
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        return encode_json(data)
@@ -0,0 +1,86 @@
+from datetime import date
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import BooleanField, Count, F, Field, Func, Q, Value
+from .cache import get_version
+from .models import ArchivedStay, Booking, Guest
+
+# Age bands reported alongside the per-age histogram, as (label, lowest age, highest age)
+AGE_BUCKETS = (
+    ('under 18', 0, 17),
+    ('18-24', 18, 24),
+    ('25-34', 25, 34),
+    ('35-44', 35, 44),
+    ('45-54', 45, 54),
+    ('55-64', 55, 64),
+    ('65+', 65, None),
+)
+
+def stay_overlaps(start_date, end_date):
+    # PostgreSQL only: the stay [check_in_date, check_out_date) overlaps [start_date, end_date]; None is unbounded
+    return Func(
+        Func(F('check_in_date'), F('check_out_date'), function='daterange', output_field=Field()),
+        Func(Value(start_date), Value(end_date), Value('[]'), function='daterange', output_field=Field()),
+        template='(%(expressions)s)', arg_joiner=' && ', output_field=BooleanField(),
+    )
+
+def guest_demographics(start_date=None, end_date=None, room_type=None, include_archive=False):
+    filtered = bool(start_date or end_date or room_type)
+    # Filtered reports also depend on bookings, so they are invalidated by booking writes as well, and by
+    # archiving when archived stays are counted
+    key = 'demographics:{}:{}:{}:{}:{}:{}'.format(
+        get_version('guests'), get_version('bookings') if filtered else 0,
+        get_version('archive') if filtered and include_archive else '-', start_date, end_date, room_type,
+    )
+    report = cache.get(key)
+    if report is None:
+        report = build_guest_demographics(start_date, end_date, room_type, include_archive)
+        cache.set(key, report, settings.GUEST_DEMOGRAPHICS_CACHE_TIMEOUT)
+    return report
+
+def build_guest_demographics(start_date=None, end_date=None, room_type=None, include_archive=False):
+    guests = Guest.objects.all()
+    if start_date or end_date or room_type:
+        stays = Booking.objects.exclude(status='cancelled')
+        if start_date:
+            stays = stays.filter(check_out_date__gt=start_date)
+        if end_date:
+            stays = stays.filter(check_in_date__lte=end_date)
+        if room_type:
+            stays = stays.filter(room__room_type=room_type)
+        if connection.vendor == 'postgresql':
+            # Same rows as the date filters above, stated so the planner can use the booking_stay_gist index
+            stays = stays.filter(stay_overlaps(start_date, end_date))
+        staying = Q(pk__in=stays.values('guest_id'))
+        if include_archive:
+            # Stays moved out of Booking by archive_bookings, from their index (see ArchivedStay)
+            archived = ArchivedStay.objects.all()
+            if start_date:
+                archived = archived.filter(check_out_date__gt=start_date)
+            if end_date:
+                archived = archived.filter(check_in_date__lte=end_date)
+            if room_type:
+                archived = archived.filter(room_type=room_type)
+            staying |= Q(pk__in=archived.values('guest_id'))
+        guests = guests.filter(staying)
+
+    # Both histograms are GROUP BY queries, so only one row per country or birth year leaves the database
+    countries = dict(guests.exclude(country='').values_list('country').annotate(count=Count('id')))
+    birth_years = guests.values_list('date_of_birth__year').annotate(count=Count('id'))
+
+    this_year = date.today().year
+    ages = {this_year - birth_year: count for birth_year, count in birth_years}
+
+    age_buckets = dict.fromkeys((label for label, _, _ in AGE_BUCKETS), 0)
+    for age, count in ages.items():
+        for label, lowest, highest in AGE_BUCKETS:
+            if age >= lowest and (highest is None or age <= highest):
+                age_buckets[label] += count
+                break
+
+    return {
+        'countries': countries,
+        'ages': dict(sorted(ages.items())),
+        'age_buckets': age_buckets,
+    }
@@ -0,0 +1,66 @@
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import F
+from .archive import all_archived_stays
+from .availability import nightly_amounts
+from .models import DailyRevenue, Invoice
+
+def invoice_rollup_rows(amount, payment_method, check_in_date, check_out_date, room_type):
+    return {
+        (night, room_type, payment_method): part
+        for night, part in nightly_amounts(amount, check_in_date, check_out_date)
+    }
+
+# Add (sign=1) or remove (sign=-1) a paid invoice from the daily revenue rollup. The revenue sits on the nights and
+# room type of the booking's stay, or of stay, a (check_in_date, check_out_date, room_type) it had before.
+def apply_invoice(invoice, sign=1, stay=None):
+    booking = invoice.booking
+    if stay is None:
+        stay = (booking.check_in_date, booking.check_out_date, booking.room.room_type)
+    rows = invoice_rollup_rows(invoice.amount, invoice.payment_method, *stay)
+
+    with transaction.atomic():
+        # Make sure every row exists, then bump each one in place so concurrent payments never lose an update
+        DailyRevenue.objects.bulk_create([
+            DailyRevenue(date=night, room_type=room_type, payment_method=payment_method)
+            for night, room_type, payment_method in rows
+        ], ignore_conflicts=True)
+        for (night, room_type, payment_method), part in rows.items():
+            DailyRevenue.objects.filter(
+                date=night, room_type=room_type, payment_method=payment_method,
+            ).update(amount=F('amount') + sign * part)
+
+def move_invoice(invoice, stay):
+    # The booking was moved from stay: its paid invoice's revenue goes with it
+    with transaction.atomic():
+        apply_invoice(invoice, sign=-1, stay=stay)
+        apply_invoice(invoice)
+
+def rebuild_rollup(batch_size=2000):
+    totals = defaultdict(Decimal)
+    for row in Invoice.objects.filter(is_paid=True).values_list(
+        'amount', 'payment_method', 'booking__check_in_date', 'booking__check_out_date', 'booking__room__room_type',
+    ).iterator(chunk_size=batch_size):
+        for key, part in invoice_rollup_rows(*row).items():
+            totals[key] += part
+
+    # Paid invoices of stays moved to the archive
+    for stay in all_archived_stays():
+        if stay['invoice_amount'] is not None:
+            for key, part in invoice_rollup_rows(
+                Decimal(stay['invoice_amount']), stay['invoice_payment_method'],
+                date.fromisoformat(stay['check_in_date']), date.fromisoformat(stay['check_out_date']),
+                stay['room_type'],
+            ).items():
+                totals[key] += part
+
+    with transaction.atomic():
+        DailyRevenue.objects.all().delete()
+        DailyRevenue.objects.bulk_create([
+            DailyRevenue(date=night, room_type=room_type, payment_method=payment_method, amount=amount)
+            for (night, room_type, payment_method), amount in totals.items()
+        ], batch_size=batch_size)
+
+    return len(totals)
@@ -0,0 +1,60 @@
+from collections import namedtuple
+from django.conf import settings
+from rest_framework_simplejwt.tokens import Token
+from .cache import LRUCache
+from .models import UserRole
+
+# A user's role as the permission classes need it: its name and its permissions as 'app_label.codename'
+ResolvedRole = namedtuple('ResolvedRole', ['name', 'permissions'])
+NO_ROLE = ResolvedRole(None, frozenset())
+
+# Given to every user who registers
+DEFAULT_ROLE = 'Guest'
+
+# Keyed by user id, cleared by core.signals whenever a profile, role or role permission changes.
+# The timeout bounds staleness in other worker processes, which never see those signals.
+role_cache = LRUCache(settings.ROLE_CACHE_SIZE, ttl=settings.ROLE_CACHE_TIMEOUT)
+
+def resolve_role(user_id):
+    role = role_cache.get(user_id)
+    if role is None:
+        user_role = UserRole.objects.filter(userprofile__user_id=user_id).first()
+        if user_role is None:
+            role = NO_ROLE
+        else:
+            role = ResolvedRole(user_role.name, frozenset(
+                f'{app_label}.{codename}'
+                for app_label, codename in user_role.permissions.values_list('content_type__app_label', 'codename')
+            ))
+        role_cache.set(user_id, role)
+    return role
+
+def role_id(name):
+    # Cached next to the users' roles, under a key no user id can take, so role changes clear both
+    key = ('id', name)
+    pk = role_cache.get(key)
+    if pk is None:
+        pk = UserRole.objects.values_list('pk', flat=True).get(name=name)
+        role_cache.set(key, pk)
+    return pk
+
+def get_user_role(user):
+    if user is None or not user.is_authenticated:
+        return NO_ROLE
+
+    # The user object lives for exactly one request, so pinning the role on it resolves it once per request
+    role = getattr(user, '_resolved_role', None)
+    if role is None:
+        role = user._resolved_role = resolve_role(user.pk)
+    return role
+
+def request_role_name(request):
+    # Tokens minted by us carry the role, which saves the lookup altogether
+    token = getattr(request, 'auth', None)
+    if isinstance(token, Token) and 'role' in token:
+        return token['role']
+    return get_user_role(request.user).name
+
+def add_role_claim(token, user_id):
+    token['role'] = resolve_role(user_id).name
+    return token
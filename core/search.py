@@ -0,0 +1,52 @@
+from hashlib import md5
+from django.conf import settings
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+from .availability import booked_rooms, stay_nights
+from .cache import TieredCache, bump_versions, get_versions
+from .inventory import all_rooms, room_cache
+from .pricing import Pricer, rate_cache
+from .serializers import RoomSerializer
+
+# Room search responses, stored as the JSON bytes sent to the client. A response depends on the room inventory,
+# the rate plans, and the availability and occupancy of each night of the stay, so its key carries the version of
+# each: a booking only makes the searches that include one of its nights miss.
+search_cache = TieredCache('search', settings.SEARCH_CACHE_SIZE, timeout=settings.SEARCH_CACHE_TIMEOUT)
+
+# Longest stay a search may ask about. Searches are open to anonymous clients and cost a version lookup per night
+# and a rate calendar per year, so the range is bounded.
+SEARCH_MAX_NIGHTS = 60
+
+def night_namespace(night):
+    return f'night:{night.isoformat()}'
+
+def search_results(check_in_date, check_out_date, room_type=None):
+    # Available rooms: free for every night of the stay according to the availability index; the rooms
+    # themselves come from the cached inventory
+    booked = set(booked_rooms(check_in_date, check_out_date).distinct())
+    rooms = [
+        room for room in all_rooms()
+        if room.pk not in booked and (not room_type or room.room_type == room_type)
+    ]
+
+    # Price of the whole stay for every room found, in one pass
+    prices = Pricer(check_in_date, check_out_date).stay_prices(rooms, check_in_date, check_out_date)
+    return [{**room, 'total_price': str(prices[room['id']])} for room in RoomSerializer(rooms, many=True).data]
+
+def search_response(check_in_date, check_out_date, room_type=None):
+    namespaces = [room_cache.namespace, rate_cache.namespace] + [
+        night_namespace(night) for night in stay_nights(check_in_date, check_out_date)
+    ]
+    versions = get_versions(namespaces)
+    generation = md5(','.join(str(versions[namespace]) for namespace in namespaces).encode()).hexdigest()
+    key = f'{check_in_date}:{check_out_date}:{room_type or ""}:{generation}'
+    return search_cache.get_or_load(
+        key, lambda: JSONRenderer().render(search_results(check_in_date, check_out_date, room_type)),
+    )
+
+def invalidate_searches(changes):
+    # changes: (before, after) availability index rows per booking, as returned by core.availability. Every night
+    # that gained or lost a booked room gets a new version once the transaction commits.
+    nights = {night for before, after in changes for _, night, _ in before ^ after}
+    if nights:
+        transaction.on_commit(lambda: bump_versions(night_namespace(night) for night in sorted(nights)))
@@ -1,31 +1,151 @@
+from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import User
+from django.db import transaction
 from django.utils import timezone
-from rest_framework import serializers
-from .models import Booking, Guest, Invoice, Room
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings as drf_settings
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+from .authentication import hashing_pool, is_revoked
+from .models import Booking, Guest, GuestStats, Invoice, Room, UserProfile
+from .roles import DEFAULT_ROLE, add_role_claim, role_id
+
+class PreloadedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    # Looks related objects up in context['preloaded'][Model] when a caller has fetched them in bulk,
+    # so validating a batch of rows does not cost one SELECT per row
+    def to_internal_value(self, data):
+        preloaded = self.context.get('preloaded', {}).get(self.get_queryset().model)
+        if preloaded is None:
+            return super().to_internal_value(data)
+
+        try:
+            if isinstance(data, bool):
+                raise TypeError
+            return preloaded[int(data)]
+        except KeyError:
+            self.fail('does_not_exist', pk_value=data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+class DynamicFieldsModelSerializer(serializers.ModelSerializer):
+    # Takes an optional `fields` argument naming the subset of fields to keep
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+
+        if fields is not None:
+            for field_name in set(self.fields) - set(fields):
+                self.fields.pop(field_name)
+
+# to_representation implementations that return a column value from values() unchanged
+PLAIN_REPRESENTATIONS = {
+    serializers.BooleanField.to_representation,
+    serializers.CharField.to_representation,
+    serializers.ChoiceField.to_representation,
+    serializers.IntegerField.to_representation,
+}
+
+# Fields whose to_representation takes the column value itself, but changes it
+VALUE_FIELDS = (
+    serializers.DateField, serializers.DateTimeField, serializers.DecimalField, serializers.DurationField,
+    serializers.FloatField, serializers.TimeField, serializers.UUIDField,
+)
+
+def decimal_string(field):
+    # DecimalField's output for values already at the field's scale, as the database returns them: str() is exact
+    # then, and much cheaper than quantizing again. Anything else goes through the field.
+    places = field.decimal_places
+
+    def convert(value):
+        text = str(value)
+        _, point, fraction = text.partition('.')
+        if 'E' not in text and len(fraction) == places and bool(point) == bool(places):
+            return text
+        return field.to_representation(value)
+    return convert
+
+def values_row_builder(serializer):
+    # Read-only fast path for list endpoints: returns the columns to pass to values() and a function turning those
+    # rows into the serializer's output, or None when some field needs a model instance (a method, a nested or
+    # related serializer, a dotted or non-column source). Only conversions that change a value, like decimals to
+    # strings, are left to the field.
+    model = serializer.Meta.model
+    columns = {field.attname: field.name for field in model._meta.concrete_fields}
+    columns.update({name: name for name in columns.values()})
+    plan = []
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        if field.source not in columns:
+            return None
+        column = columns[field.source]
+        method = type(field).to_representation
+        if isinstance(field, serializers.PrimaryKeyRelatedField):
+            if method is not serializers.PrimaryKeyRelatedField.to_representation or field.pk_field is not None:
+                return None
+            convert = None # values() already holds the related primary key
+        elif model._meta.get_field(column).is_relation:
+            return None # Any other field would be handed the related object
+        elif method in PLAIN_REPRESENTATIONS:
+            convert = None
+        elif method is serializers.BigIntegerField.to_representation:
+            if getattr(field, 'coerce_to_string', drf_settings.COERCE_BIGINT_TO_STRING):
+                return None
+            convert = None # BigAutoField primary keys
+        elif method is serializers.DateField.to_representation and \
+                getattr(field, 'format', drf_settings.DATE_FORMAT) == ISO_8601:
+            convert = None # Left to the JSON encoder (core.renderers), which writes dates in ISO 8601 as well
+        elif method is serializers.DecimalField.to_representation and field.decimal_places is not None and \
+                getattr(field, 'coerce_to_string', drf_settings.COERCE_DECIMAL_TO_STRING) and \
+                not field.localize and not field.normalize_output:
+            convert = decimal_string(field)
+        elif isinstance(field, VALUE_FIELDS):
+            convert = field.to_representation
+        else:
+            return None
+        plan.append((name, column, convert))
+
+    def build(rows):
+        return [
+            {name: row[column] if convert is None or row[column] is None else convert(row[column])
+             for name, column, convert in plan}
+            for row in rows
+        ]
+    return [column for _, column, _ in plan], build
+
+class BookingSerializer(DynamicFieldsModelSerializer):
+    guest = PreloadedPrimaryKeyRelatedField(queryset=Guest.objects.all())
+    room = PreloadedPrimaryKeyRelatedField(queryset=Room.objects.all())
 
-class BookingSerializer(serializers.ModelSerializer):
     class Meta:
         model = Booking        
         exclude = ['total_price'] # Still exclude total_price
+        read_only_fields = ['status'] # Changed through the check-in/check-out/cancel actions only
     
     def validate(self, data):
+        # A PATCH may leave the dates out; check the ones the booking will end up with
+        check_in_date = data.get('check_in_date', getattr(self.instance, 'check_in_date', None))
+        check_out_date = data.get('check_out_date', getattr(self.instance, 'check_out_date', None))
+
         # Check that check-out is after check-in
-        if data['check_in_date'] >= data['check_out_date']:
+        if check_in_date >= check_out_date:
             raise serializers.ValidationError("Check-out date must be after \
                                               check-in date.")
 
         # Check that check-in is not in the past
-        if data['check_in_date'] < timezone.now().date():
+        if 'check_in_date' in data and check_in_date < timezone.now().date():
             raise serializers.ValidationError("Check-in date cannot be in the \
                                               past.")
         
         # Check that payment_method is not None
-        if not data['payment_method']:
+        if not data.get('payment_method', getattr(self.instance, 'payment_method', None)):
             raise serializers.ValidationError("Payment method is required.")
 
         return data
 
-class GuestSerializer(serializers.ModelSerializer):
+class GuestSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = Guest
         fields = '__all__'
@@ -50,12 +170,21 @@ class GuestSerializer(serializers.ModelSerializer):
         
         return value
 
-class InvoiceSerializer(serializers.ModelSerializer):
+class InvoiceSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = Invoice
         fields = '__all__'
+        extra_kwargs = {
+            # The browsable API lists bookings as choices, and Booking.__str__ follows guest and room
+            'booking': {'queryset': Booking.objects.select_related('guest', 'room')},
+        }
+
+class GuestStatsSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = GuestStats
+        exclude = ('guest',)
 
-class RoomSerializer(serializers.ModelSerializer):
+class RoomSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = Room
         fields = '__all__'
@@ -63,18 +192,39 @@ class RoomSerializer(serializers.ModelSerializer):
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
-        fields = ('username', 'assword', 'email')
+        fields = ('username', 'password', 'email')
 
-        write_only_fields = ('password',)
+        extra_kwargs = {'password': {'write_only': True}}
         read_only_fields = ('id',)
 
     def create(self, validated_data):
-        user = User.objects.create(
-            username=validated_data['username'],
-            email=validated_data['email'],
-        )
-
-        user.set_password(validated_data['password'])
-        user.save()
+        # The password is hashed before the transaction opens, then the user and their profile are saved together
+        password = hashing_pool.run(make_password, validated_data['password'])
+        with transaction.atomic():
+            user = User.objects.create(
+                username=validated_data['username'],
+                email=validated_data.get('email', ''),
+                password=password,
+            )
+            UserProfile.objects.create(user=user, role_id=role_id(DEFAULT_ROLE))
 
         return user
+
+class RoleTokenObtainPairSerializer(TokenObtainPairSerializer):
+    # Tokens carry the user's name and role, so neither authentication (core.authentication) nor permission
+    # checks need a database lookup
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        token['username'] = user.get_username()
+        return add_role_claim(token, user.pk)
+
+class RoleTokenRefreshSerializer(TokenRefreshSerializer):
+    # A refreshed access token picks up the user's current role rather than the one at login
+    def validate(self, attrs):
+        if is_revoked(RefreshToken(attrs['refresh'])): # Logged out
+            raise InvalidToken('Token has been revoked')
+        data = super().validate(attrs)
+        access = AccessToken(data['access'])
+        data['access'] = str(add_role_claim(access, access[api_settings.USER_ID_CLAIM]))
+        return data
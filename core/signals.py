@@ -0,0 +1,153 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from .authentication import revoke_user_tokens
+from .availability import sync_booking_nights
+from .cache import bump_version
+from .events import TRACKED_FIELDS, record, record_changes
+from .inventory import room_cache
+from .live import live_feed, publish_changes
+from .models import Booking, Guest, Invoice, RatePlan, Room, RoomNight, UserProfile, UserRole
+from .occupancy import apply_occupancy_changes, apply_same_day_stay
+from .pricing import rate_cache
+from .revenue import apply_invoice, move_invoice
+from .roles import role_cache
+from .search import invalidate_searches
+
+# Keep the availability index, and the occupancy timeline, search responses and live dashboard built on it,
+# current whenever a booking is created or changes state
+@receiver(post_save, sender=Booking)
+def update_availability_index(sender, instance, raw=False, **kwargs):
+    if raw: # Fixtures are loaded as-is, run backfill_room_nights afterwards
+        return
+    changes = [sync_booking_nights(instance)]
+    apply_occupancy_changes(changes)
+    held, wanted = changes[0]
+    if instance.status == 'checked_out' and held and not wanted: # Checked out on the day of arrival
+        apply_same_day_stay(instance.check_in_date)
+    invalidate_searches(changes)
+    publish_changes(changes)
+
+# Remember the booking as stored before it is saved, so its events can say what changed
+@receiver(pre_save, sender=Booking)
+def remember_booking(sender, instance, raw=False, **kwargs):
+    instance._stored = None
+    if not raw and instance.pk:
+        instance._stored = Booking.objects.filter(pk=instance.pk).values(*TRACKED_FIELDS).first()
+
+# Bookings are changed from several places (API, admin, shell), so their booking events are recorded here, in the
+# transaction of the save. bulk_create skips this, the bulk view records its events itself.
+@receiver(post_save, sender=Booking)
+def record_booking_events(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    record_changes(instance, getattr(instance, '_stored', None))
+
+# A paid invoice's revenue sits on its booking's nights and room type, so it follows the booking when that moves
+@receiver(post_save, sender=Booking)
+def move_booking_revenue(sender, instance, raw=False, **kwargs):
+    stored = getattr(instance, '_stored', None)
+    if raw or not stored:
+        return
+    stay = (stored['check_in_date'], stored['check_out_date'])
+    if (stored['room_id'], *stay) == (instance.room_id, instance.check_in_date, instance.check_out_date):
+        return
+    invoice = Invoice.objects.select_related('booking__room').filter(booking=instance, is_paid=True).first()
+    if invoice:
+        room_type = Room.objects.values_list('room_type', flat=True).get(pk=stored['room_id'])
+        move_invoice(invoice, (*stay, room_type))
+
+@receiver(post_delete, sender=Booking)
+def record_deleted_booking(sender, instance, **kwargs):
+    record('deleted', instance)
+
+@receiver(pre_delete, sender=Booking)
+def release_deleted_booking(sender, instance, **kwargs):
+    # The index rows go with the booking (CASCADE); take them off the timeline first
+    held = set(RoomNight.objects.filter(booking=instance).values_list('room_id', 'night', 'amount'))
+    apply_occupancy_changes([(held, set())])
+    invalidate_searches([(held, set())])
+    publish_changes([(held, set())])
+
+# Invalidate cached reports built from guests or bookings
+@receiver(post_save, sender=Guest)
+@receiver(post_delete, sender=Guest)
+def invalidate_guest_reports(sender, **kwargs):
+    bump_version('guests')
+
+@receiver(post_save, sender=Booking)
+@receiver(post_delete, sender=Booking)
+def invalidate_booking_reports(sender, **kwargs):
+    bump_version('bookings')
+
+# Drop the cached room inventory when a room changes. After commit, so a concurrent request cannot cache the
+# old row again between the invalidation and the commit.
+@receiver(post_save, sender=Room)
+@receiver(post_delete, sender=Room)
+def invalidate_room_inventory(sender, **kwargs):
+    transaction.on_commit(room_cache.invalidate)
+    transaction.on_commit(live_feed.publish) # The occupancy rate is over the whole inventory
+
+@receiver(post_save, sender=RatePlan)
+@receiver(post_delete, sender=RatePlan)
+def invalidate_rate_calendars(sender, **kwargs):
+    transaction.on_commit(rate_cache.invalidate)
+
+# Remember what the invoice looked like before it is saved, so the rollup can be corrected on change
+@receiver(pre_save, sender=Invoice)
+def remember_paid_invoice(sender, instance, raw=False, **kwargs):
+    instance._paid_before = None
+    if not raw and instance.pk:
+        instance._paid_before = Invoice.objects.filter(pk=instance.pk, is_paid=True).first()
+
+@receiver(post_save, sender=Invoice)
+def update_revenue_rollup(sender, instance, raw=False, **kwargs):
+    if raw: # Fixtures are loaded as-is, run rebuild_revenue_rollup afterwards
+        return
+
+    before = getattr(instance, '_paid_before', None)
+    if before and instance.is_paid and (before.amount, before.payment_method) == (instance.amount, instance.payment_method):
+        return # Still paid, nothing that affects revenue changed
+    if before:
+        apply_invoice(before, sign=-1)
+    if instance.is_paid:
+        apply_invoice(instance)
+
+@receiver(post_delete, sender=Invoice)
+def remove_from_revenue_rollup(sender, instance, **kwargs):
+    if instance.is_paid:
+        apply_invoice(instance, sign=-1)
+
+# Invoices are created and paid from several places (outbox, API, admin), so their booking events are recorded here
+@receiver(post_save, sender=Invoice)
+def record_invoice_events(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        record('invoiced', instance.booking, amount=str(instance.amount))
+    if instance.is_paid and not getattr(instance, '_paid_before', None):
+        record('paid', instance.booking, amount=str(instance.amount))
+
+# Drop cached role resolutions as soon as a profile, role or role's permission set changes
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def invalidate_user_role(sender, instance, **kwargs):
+    role_cache.delete(instance.user_id)
+
+@receiver(post_save, sender=UserRole)
+@receiver(post_delete, sender=UserRole)
+@receiver(m2m_changed, sender=UserRole.permissions.through)
+def invalidate_all_roles(sender, **kwargs):
+    role_cache.clear()
+
+# Tokens are checked without loading the user, so deactivating or deleting one revokes the tokens already issued
+# to them
+@receiver(post_save, sender=User)
+def revoke_inactive_user_tokens(sender, instance, raw=False, **kwargs):
+    if not raw and not instance.is_active:
+        revoke_user_tokens(instance.pk)
+
+@receiver(post_delete, sender=User)
+def revoke_deleted_user_tokens(sender, instance, **kwargs):
+    revoke_user_tokens(instance.pk)
@@ -1,3 +1,904 @@
-from django.test import TestCase
+import io
+import json
+import re
+import threading
+import time
+from datetime import date, timedelta
+from importlib import import_module
+from decimal import Decimal
+from unittest import mock
+from asgiref.sync import async_to_sync
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import AsyncClient, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from .archive import archived_stays
+from .authentication import CachedJWTAuthentication, hashing_pool, revoke_user_tokens, token_cache
+from .events import catch_up
+from .instrumentation import metrics
+from .inventory import room_cache
+from .models import ArchivedStay, Booking, BookingEvent, DailyRevenue, Guest, GuestStats, Invoice, OccupancyDay, \
+    OutboxJob, RatePlan, Room, RoomNight, UserProfile, UserRole
+from .occupancy import rebuild_timeline
+from .outbox import run_pending
+from .pricing import price_stay, rate_cache
+from .renderers import FastJSONRenderer
+from .revenue import rebuild_rollup
+from .roles import role_cache
+from .search import search_cache
+from .serializers import RoleTokenObtainPairSerializer, values_row_builder
+from .throttling import auth_buckets
+from .views import BookingViewSet, GuestViewSet, InvoiceViewSet, RoomViewSet, regular_path
 
-# Create your tests here.
+class APITestCase(TestCase):
+    # The process-local caches outlive each test's rollback, and SQLite hands the rolled back ids out again, so
+    # every test starts from empty caches
+    def setUp(self):
+        cache.clear()
+        for lru in (role_cache, token_cache, auth_buckets.buckets):
+            lru.clear()
+        for tiered in (room_cache, rate_cache, search_cache):
+            tiered.invalidate()
+
+    def make_client(self, role_name, **user_fields):
+        role, _ = UserRole.objects.get_or_create(name=role_name)
+        user = User.objects.create(username=f'{role_name.lower()}-{User.objects.count()}', **user_fields)
+        UserProfile.objects.create(user=user, role=role)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {RoleTokenObtainPairSerializer.get_token(user).access_token}')
+        return client
+
+    def add_guests(self, count):
+        start = Guest.objects.count()
+        return Guest.objects.bulk_create([
+            Guest(first_name='Test', last_name=str(n), email=f'test{n}@example.com', phone_number='0',
+                  address='1 Main St, Springfield, USA', date_of_birth=date(1980, 1, 1))
+            for n in range(start, start + count)
+        ])
+
+    def add_rows(self, count):
+        # count guests, rooms, bookings and invoices, one of each per stay, without going through the API
+        guests = self.add_guests(count)
+        start = Room.objects.count()
+        rooms = Room.objects.bulk_create([
+            Room(number=f'T{n:04d}', room_type='Q', price=Decimal('100.00')) for n in range(start, start + count)
+        ])
+        room_cache.invalidate() # bulk_create sends no signals
+        today = date.today()
+        bookings = Booking.objects.bulk_create([
+            Booking(guest=guest, room=room, check_in_date=today + timedelta(days=1),
+                    check_out_date=today + timedelta(days=2), total_price=Decimal('100.00'), payment_method='cash')
+            for guest, room in zip(guests, rooms)
+        ])
+        Invoice.objects.bulk_create([
+            Invoice(booking=booking, amount=booking.total_price, payment_method='cash') for booking in bookings
+        ])
+        return bookings
+
+def today_is(day):
+    # Stands in for datetime.date in a module whose date.today() a test moves
+    class FixedDate(date):
+        @classmethod
+        def today(cls):
+            return day
+    return FixedDate
+
+def timeline_rows():
+    # The occupancy timeline without its empty days, which upkeep leaves behind and a rebuild does not
+    return sorted(row for row in OccupancyDay.objects.values_list(
+        'date', 'rooms_sold', 'arrivals', 'departures', 'revenue',
+    ) if any(row[1:]))
+
+def revenue_rows():
+    return sorted(DailyRevenue.objects.exclude(amount=0).values_list('date', 'room_type', 'payment_method', 'amount'))
+
+##### Authentication ##################################################################
+
+class TokenRevocationTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        role, _ = UserRole.objects.get_or_create(name='Staff')
+        self.user = User.objects.create_user('frontdesk', password='correct horse')
+        UserProfile.objects.create(user=self.user, role=role)
+
+    def login(self):
+        response = APIClient().post('/api/login/', {'username': 'frontdesk', 'password': 'correct horse'},
+                                    format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def get(self, tokens):
+        return APIClient().get('/api/bookings/', HTTP_AUTHORIZATION=f"Bearer {tokens['access']}")
+
+    def refresh(self, tokens):
+        return APIClient().post('/api/token/refresh/', {'refresh': tokens['refresh']}, format='json')
+
+    def later(self):
+        # Revoke in the second after the tokens were issued; issue times are whole seconds
+        return mock.patch('core.authentication.time.time', return_value=time.time() + 1)
+
+    def test_logout_revokes_both_tokens(self):
+        tokens = self.login()
+        self.assertEqual(self.get(tokens).status_code, 200)
+        response = APIClient().post('/api/logout/', {'refresh': tokens['refresh']}, format='json',
+                                    HTTP_AUTHORIZATION=f"Bearer {tokens['access']}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get(tokens).status_code, 401)
+        self.assertEqual(self.refresh(tokens).status_code, 401)
+
+    def test_sign_in_right_after_revocation(self):
+        self.login()
+        revoke_user_tokens(self.user.pk)
+        tokens = self.login() # Same second
+        self.assertEqual(self.get(tokens).status_code, 200)
+        self.assertEqual(self.refresh(tokens).status_code, 200)
+
+    def test_deactivation_revokes_tokens(self):
+        tokens = self.login()
+        self.assertEqual(self.get(tokens).status_code, 200) # Now in the verified token cache too
+        with self.later():
+            self.user.is_active = False
+            self.user.save()
+        self.assertEqual(self.get(tokens).status_code, 401)
+        self.assertEqual(self.refresh(tokens).status_code, 401)
+
+    def test_deletion_revokes_tokens(self):
+        tokens = self.login()
+        with self.later():
+            self.user.delete()
+        self.assertEqual(self.get(tokens).status_code, 401)
+
+    def test_user_comes_from_the_claims(self):
+        raw = self.login()['access']
+        request = RequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {raw}')
+        authentication = CachedJWTAuthentication()
+        with self.assertNumQueries(0):
+            user, token = authentication.authenticate(request)
+            self.assertEqual((user.pk, user.username, token['role']), (str(self.user.pk), 'frontdesk', 'Staff'))
+            # Verified once, then served from the cache
+            self.assertIs(authentication.authenticate(request)[1], token)
+
+class SignInLimitTests(APITestCase):
+    def test_sign_ins_beyond_the_burst_are_throttled(self):
+        client = APIClient()
+        for _ in range(settings.AUTH_THROTTLE_BURST):
+            response = client.post('/api/login/', {'username': 'nobody', 'password': 'wrong'}, format='json')
+            self.assertEqual(response.status_code, 401)
+        response = client.post('/api/login/', {'username': 'nobody', 'password': 'wrong'}, format='json')
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+
+    def test_full_hashing_pool_answers_503(self):
+        requests = [
+            ('/api/login/', {'username': 'nobody', 'password': 'wrong'}),
+            ('/api/token/', {'username': 'nobody', 'password': 'wrong'}),
+            ('/api/register/', {'username': 'new', 'email': 'new@example.com', 'password': 'correct horse'}),
+        ]
+        with mock.patch.object(hashing_pool, 'slots', threading.Semaphore(0)): # No room in the queue
+            for url, data in requests:
+                with self.subTest(url):
+                    response = APIClient().post(url, data, format='json')
+                    self.assertEqual(response.status_code, 503)
+                    self.assertEqual(response['Retry-After'], '1')
+        self.assertFalse(User.objects.filter(username='new').exists())
+
+##### Instrumentation ###################################################################
+
+@override_settings(INSTRUMENTATION_ENABLED=True, INSTRUMENTATION_PROFILE_RATE=0, INSTRUMENTATION_METRICS_TOKEN='scrape')
+class InstrumentationTests(APITestCase):
+    # Clients are made inside the test, so their handlers load the middleware with instrumentation on
+    def setUp(self):
+        super().setUp()
+        metrics.views.clear()
+
+    def scrape(self):
+        self.assertEqual(APIClient().get('/api/metrics/').status_code, 401)
+        response = APIClient().get('/api/metrics/', HTTP_AUTHORIZATION='Bearer scrape')
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode().splitlines()
+
+    def test_sync_and_async_requests_are_scraped(self):
+        room = Room.objects.create(number='100', room_type='Q', price=Decimal('100.00'))
+        client = self.make_client('Staff')
+        for _ in range(2):
+            self.assertEqual(client.get('/api/rooms/').status_code, 200)
+
+        # Under ASGI the middleware stays async; the async ORM's query is still counted
+        user = User.objects.get(username__startswith='staff')
+        token = RoleTokenObtainPairSerializer.get_token(user).access_token
+        response = async_to_sync(AsyncClient().get)(f'/api/async/rooms/{room.pk}/',
+                                                    headers={'Authorization': f'Bearer {token}'})
+        self.assertEqual(response.status_code, 200)
+
+        lines = self.scrape()
+        async_view = 'api/async/rooms/<int:pk>/'
+        self.assertIn(f'jollyhms_requests_total{{view="{async_view}",method="GET",status="200"}} 1', lines)
+        self.assertIn(f'jollyhms_db_queries_total{{view="{async_view}"}} 1', lines)
+        self.assertIn(f'jollyhms_request_duration_seconds_count{{view="{async_view}"}} 1', lines)
+        sync_view = [line for line in lines if line.startswith('jollyhms_requests_total') and 'rooms' in line
+                     and 'async' not in line]
+        self.assertEqual(len(sync_view), 1)
+        self.assertTrue(sync_view[0].endswith('status="200"} 2'))
+
+##### Query budget ######################################################################
+
+class ListQueryBudgetTests(APITestCase):
+    # A list endpoint's query count must not grow with the number of rows (N+1)
+    max_queries = 10
+
+    # Endpoint and the role allowed to list it
+    endpoints = [
+        ('/api/guests/', 'Guest'),
+        ('/api/rooms/', 'Staff'),
+        ('/api/bookings/', 'Staff'),
+        ('/api/invoices/', 'Guest'),
+    ]
+
+    def get(self, client, url, fmt):
+        room_cache.invalidate() # Measure the uncached room list
+        response = client.get(url, {'format': fmt})
+        if fmt == 'api':
+            response.render() # The browsable API renders forms, and their choices, lazily
+        self.assertEqual(response.status_code, 200)
+
+    def test_queries_do_not_grow_with_rows(self):
+        clients = {role_name: self.make_client(role_name) for role_name in {role for _, role in self.endpoints}}
+        self.add_rows(5)
+        counts = {}
+        for url, role_name in self.endpoints:
+            for fmt in ('json', 'api'):
+                with CaptureQueriesContext(connection) as queries:
+                    self.get(clients[role_name], url, fmt)
+                counts[url, fmt] = len(queries)
+
+        self.add_rows(45)
+        for url, role_name in self.endpoints:
+            for fmt in ('json', 'api'):
+                with self.subTest(url=url, format=fmt):
+                    self.assertLessEqual(counts[url, fmt], self.max_queries)
+                    with self.assertNumQueries(counts[url, fmt]):
+                        self.get(clients[role_name], url, fmt)
+
+##### Query plans #######################################################################
+
+class HotQueryPlanTests(APITestCase):
+    # The queries behind the hot views must reach the large tables through an index. The tables are tiny here, so
+    # PostgreSQL is told to avoid sequential scans: one in the plan means no index can serve the query.
+
+    def scenarios(self):
+        # (name, URL, tables that must be reached through an index); narrow windows, like the front desk asks for
+        today = date.today()
+        month_ago = today - timedelta(days=30)
+        next_week = today + timedelta(days=7)
+        return [
+            ('search_rooms', f'/api/search-rooms/?check_in_date={next_week}&check_out_date={next_week + timedelta(days=3)}',
+             ['core_roomnight', 'core_occupancyday']),
+            ('occupancy_rate', f'/api/occupancy-rate-report/?date={today}', ['core_occupancyday']),
+            ('occupancy_timeline', f'/api/occupancy-timeline/?start_date={month_ago}&end_date={today}',
+             ['core_occupancyday']),
+            ('calculate_revenue', f'/api/calculate-revenue/?start_date={month_ago}&end_date={today}',
+             ['core_dailyrevenue']),
+            ('guest_demographics', f'/api/guest-demographics-report/?start_date={month_ago}&end_date={today}',
+             ['core_booking']),
+            ('list_bookings', '/api/bookings/', ['core_booking']),
+            ('availability_calendar', f'/api/availability-calendar/?start_date={today}', ['core_roomnight']),
+            ('dashboard_overview', '/dashboard/', ['core_occupancyday']),
+        ]
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('EXPLAIN (FORMAT JSON) ' + sql)
+                plan = cursor.fetchone()[0]
+                return plan if isinstance(plan, list) else json.loads(plan)
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def full_scans(self, plan):
+        if connection.vendor == 'postgresql':
+            tables = set()
+            nodes = [plan[0]['Plan']]
+            while nodes:
+                node = nodes.pop()
+                if node['Node Type'] == 'Seq Scan':
+                    tables.add(node['Relation Name'])
+                nodes.extend(node.get('Plans', []))
+            return tables
+        # SQLite says SEARCH for index lookups and SCAN for walking a table; a walk along an index (SCAN t USING
+        # INDEX) is how it serves ORDER BY ... LIMIT, like an Index Scan on PostgreSQL, so only bare scans count
+        return {match.group(1) for detail in plan if (match := re.fullmatch(r'SCAN (\w+)', detail))}
+
+    def test_hot_queries_use_indexes(self):
+        if connection.vendor not in ('postgresql', 'sqlite'):
+            self.skipTest(f"Reading {connection.vendor} plans is not supported.")
+        client = self.make_client('Staff', is_staff=True, is_superuser=True)
+        client.force_login(User.objects.get(is_superuser=True)) # The dashboard uses the session
+        for booking in self.add_rows(20):
+            booking.save() # Through the signals, so the availability index and the timeline have rows
+            Invoice.objects.filter(booking=booking).update(is_paid=True)
+            booking.invoice.save()
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+
+        for name, url, tables in self.scenarios():
+            with self.subTest(name):
+                with CaptureQueriesContext(connection) as captured:
+                    response = client.get(url)
+                self.assertEqual(response.status_code, 200)
+                scanned = set()
+                for query in captured.captured_queries:
+                    sql = query['sql']
+                    if sql.lstrip().upper().startswith('SELECT') and any(table in sql for table in tables):
+                        scanned |= self.full_scans(self.explain(sql)) & set(tables)
+                self.assertFalse(scanned, f"{url} scans {', '.join(sorted(scanned))}")
+
+##### Fast list path ####################################################################
+
+class FastListTests(APITestCase):
+    # List responses built from values() rows (FastListMixin) must match the serializers byte for byte
+
+    # Requests compared, and the role allowed to make them; page_size=7 walks the keyset cursors
+    requests = [
+        ('/api/guests/', {}, 'Guest'),
+        ('/api/guests/', {'page_size': 7}, 'Guest'),
+        ('/api/guests/', {'fields': 'id,first_name,date_of_birth'}, 'Guest'),
+        ('/api/rooms/', {}, 'Staff'),
+        ('/api/rooms/', {'fields': 'number,price,is_available'}, 'Staff'),
+        ('/api/bookings/', {}, 'Staff'),
+        ('/api/bookings/', {'page_size': 7}, 'Staff'),
+        ('/api/bookings/', {'fields': 'guest,check_in_date,payment_method', 'page_size': 7}, 'Staff'),
+        ('/api/invoices/', {}, 'Guest'),
+        ('/api/invoices/', {'fields': 'booking,amount', 'page_size': 7}, 'Guest'),
+    ]
+
+    def setUp(self):
+        super().setUp()
+        # Values that tend to come out differently between encoders: non-ASCII and escaped characters, line
+        # separators, empty strings, nulls, zero and unrounded decimals, booleans both ways, old dates
+        names = ['Zoë', 'Łukasz', '李', 'O\'Brien "Bob"', 'line\u2028sep', 'tab\there', '😀', '', 'back\\slash']
+        today = date.today()
+        guests = Guest.objects.bulk_create([
+            Guest(first_name=name, last_name=names[-n - 1], email=f'fast{n}@example.com', phone_number='+1 555',
+                  address='' if n % 3 else 'Rue de l\'Église 1, Genève, Suisse',
+                  date_of_birth=date(1900 + n * 11, n % 12 + 1, n % 28 + 1))
+            for n, name in enumerate(names)
+        ])
+        prices = [Decimal('0.00'), Decimal('0.5'), Decimal('99.99'), Decimal('100'), Decimal('123456.78')]
+        rooms = Room.objects.bulk_create([
+            Room(number=f'F{n:03d}', room_type=('Q', 'KS', 'QD')[n % 3], price=prices[n % len(prices)],
+                 is_available=bool(n % 2))
+            for n in range(len(names))
+        ])
+        bookings = Booking.objects.bulk_create([
+            Booking(guest=guest, room=room, check_in_date=today + timedelta(days=n % 4),
+                    check_out_date=today + timedelta(days=n % 4 + 1 + n), total_price=prices[n % len(prices)],
+                    payment_method=(None, 'cash', 'credit_card')[n % 3], is_active=bool(n % 2),
+                    status=('reserved', 'checked_in', 'cancelled')[n % 3])
+            for n, (guest, room) in enumerate(zip(guests, rooms))
+        ])
+        Invoice.objects.bulk_create([
+            Invoice(booking=booking, amount=prices[-n % len(prices)], payment_method=('cash', 'credit_card')[n % 2],
+                    is_paid=bool(n % 2))
+            for n, booking in enumerate(bookings)
+        ])
+
+    def pages(self, client, url, params):
+        # Response bodies of every page, following the next links
+        bodies = []
+        while url:
+            room_cache.invalidate() # The room list is cached per URL; each path must build its own response
+            response = client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            bodies.append(response.content)
+            url, params = response.json().get('next'), {}
+        return bodies
+
+    def test_rows_match_serializer(self):
+        for viewset in (GuestViewSet, RoomViewSet, BookingViewSet, InvoiceViewSet):
+            with self.subTest(viewset.__name__):
+                plan = values_row_builder(viewset.serializer_class())
+                self.assertIsNotNone(plan, "not on the fast path")
+                columns, build = plan
+                queryset = viewset.queryset.order_by('pk')
+                self.assertEqual(
+                    json.loads(FastJSONRenderer().render(build(queryset.values(*columns)))),
+                    json.loads(JSONRenderer().render(viewset.serializer_class(queryset, many=True).data)),
+                )
+
+    def test_responses_match_serializer(self):
+        clients = {role_name: self.make_client(role_name) for role_name in {role for _, _, role in self.requests}}
+        for url, params, role_name in self.requests:
+            with self.subTest(url=url, params=params):
+                viewset = resolve(url).func.cls
+                fast = self.pages(clients[role_name], url, params)
+                with regular_path(viewset):
+                    regular = self.pages(clients[role_name], url, params)
+                self.assertEqual(fast, regular)
+
+##### Pricing ###########################################################################
+
+class PricingTests(APITestCase):
+    # Base price 100 a night. Rate plans are written before the first stay is priced: the rate cache is
+    # invalidated on commit, which never comes inside a test.
+    def setUp(self):
+        super().setUp()
+        self.rooms = {room_type: Room.objects.create(number=f'10{n}', room_type=room_type, price=Decimal('100.00'))
+                      for n, room_type in enumerate(('Q', 'K'))}
+        base = date.today() + timedelta(days=14)
+        self.friday = base + timedelta(days=(4 - base.weekday()) % 7)
+
+    def plan(self, multiplier, **conditions):
+        return RatePlan.objects.create(name='Test', multiplier=Decimal(multiplier), **conditions)
+
+    def price(self, nights, room_type='Q', start=0):
+        check_in_date = self.friday + timedelta(days=start)
+        return price_stay(self.rooms[room_type], check_in_date, check_in_date + timedelta(days=nights))
+
+    def test_no_plans(self):
+        self.assertEqual(self.price(3), Decimal('300.00'))
+
+    def test_weekday(self):
+        self.plan('2', weekdays='5') # Saturday nights
+        self.assertEqual(self.price(3), Decimal('400.00')) # Friday, Saturday, Sunday
+
+    def test_season(self):
+        self.plan('1.5', start_date=self.friday + timedelta(days=1), end_date=self.friday + timedelta(days=1))
+        self.assertEqual(self.price(3), Decimal('350.00'))
+
+    def test_room_type(self):
+        self.plan('2', room_type='K')
+        self.assertEqual(self.price(1, 'Q'), Decimal('100.00'))
+        self.assertEqual(self.price(1, 'K'), Decimal('200.00'))
+
+    def test_min_nights(self):
+        self.plan('0.5', min_nights=3)
+        self.assertEqual(self.price(2), Decimal('200.00'))
+        self.assertEqual(self.price(3), Decimal('150.00'))
+
+    def test_min_occupancy(self):
+        self.plan('1.2', min_occupancy=Decimal('50'))
+        OccupancyDay.objects.create(date=self.friday, rooms_sold=1) # One of the two rooms: 50%
+        OccupancyDay.objects.create(date=self.friday + timedelta(days=1), rooms_sold=0)
+        self.assertEqual(self.price(2), Decimal('220.00'))
+
+    def test_inactive_plan(self):
+        self.plan('2', is_active=False)
+        self.assertEqual(self.price(1), Decimal('100.00'))
+
+    def test_plans_stack(self):
+        self.plan('2', weekdays='5')
+        self.plan('0.5', min_nights=3)
+        self.assertEqual(self.price(3), Decimal('200.00')) # 50 + 100 + 50
+        self.assertEqual(self.price(2, start=1), Decimal('300.00')) # Too short for the discount
+
+    def test_moved_stay_is_repriced(self):
+        self.plan('1.5', room_type='K')
+        self.plan('2', weekdays='5')
+        client = self.make_client('Staff')
+        guest = self.add_guests(1)[0]
+        booking = client.post('/api/bookings/', {
+            'guest': guest.pk, 'room': self.rooms['Q'].pk, 'payment_method': 'cash',
+            'check_in_date': self.friday, 'check_out_date': self.friday + timedelta(days=1),
+        }, format='json').json()['id']
+        total_price = lambda: Booking.objects.get(pk=booking).total_price # Not in the API's responses
+        self.assertEqual(total_price(), Decimal('100.00'))
+
+        # Another room type, then over the Saturday
+        client.patch(f'/api/bookings/{booking}/', {'room': self.rooms['K'].pk}, format='json')
+        self.assertEqual(total_price(), Decimal('150.00'))
+        client.patch(f'/api/bookings/{booking}/', {'check_out_date': self.friday + timedelta(days=2)}, format='json')
+        self.assertEqual(total_price(), Decimal('450.00'))
+        # Spread over the nights it holds, for the timeline and the revenue rollup
+        self.assertEqual(sorted(RoomNight.objects.filter(booking_id=booking).values_list('amount', flat=True)),
+                         [Decimal('225.00'), Decimal('225.00')])
+
+##### Search cache ######################################################################
+
+class SearchCacheTests(APITestCase):
+    # Cached search responses must never show stale availability or prices. Invalidation happens on commit, which
+    # the tests run by hand.
+    def setUp(self):
+        super().setUp()
+        self.client = self.make_client('Staff')
+        self.guest = self.add_guests(1)[0]
+        self.rooms = [Room.objects.create(number=f'{100 + n}', room_type='Q', price=Decimal('100.00'))
+                      for n in range(2)]
+        self.check_in_date = date.today() + timedelta(days=7)
+
+    def search(self):
+        response = self.client.get('/api/search-rooms/', {
+            'check_in_date': self.check_in_date, 'check_out_date': self.check_in_date + timedelta(days=2),
+        })
+        self.assertEqual(response.status_code, 200)
+        return {room['number']: room['total_price'] for room in response.json()}
+
+    def book(self, room, start, nights):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/bookings/', {
+                'guest': self.guest.pk, 'room': room.pk, 'payment_method': 'cash',
+                'check_in_date': self.check_in_date + timedelta(days=start),
+                'check_out_date': self.check_in_date + timedelta(days=start + nights),
+            }, format='json')
+        self.assertEqual(response.status_code, 201)
+        return response.json()['id']
+
+    def test_changes_reach_cached_searches(self):
+        self.assertEqual(self.search(), {'100': '200.00', '101': '200.00'})
+
+        booking = self.book(self.rooms[0], 1, 3) # Takes the second night only
+        self.assertEqual(self.search(), {'101': '200.00'})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/bookings/{booking}/cancel/')
+        self.assertEqual(self.search(), {'100': '200.00', '101': '200.00'})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.rooms[1].price = Decimal('150.00')
+            self.rooms[1].save()
+        self.assertEqual(self.search(), {'100': '200.00', '101': '300.00'})
+
+    def test_other_nights_leave_the_cached_search(self):
+        self.search()
+        self.book(self.rooms[0], 2, 2) # From the check-out day on
+        hits = search_cache.local.hits
+        self.assertEqual(self.search(), {'100': '200.00', '101': '200.00'})
+        self.assertEqual(search_cache.local.hits, hits + 1)
+
+##### Bookings ##########################################################################
+
+class BookingOverlapTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = self.make_client('Staff')
+        self.guest = self.add_guests(1)[0]
+        self.rooms = [Room.objects.create(number=f'{100 + n}', room_type='Q', price=Decimal('100.00')) for n in range(2)]
+
+    def book(self, room, check_in, check_out):
+        today = date.today()
+        return self.client.post('/api/bookings/', {
+            'guest': self.guest.pk, 'room': room.pk, 'payment_method': 'cash',
+            'check_in_date': today + timedelta(days=check_in), 'check_out_date': today + timedelta(days=check_out),
+        }, format='json')
+
+    def test_overlapping_create_is_rejected(self):
+        self.assertEqual(self.book(self.rooms[0], 5, 8).status_code, 201)
+        self.assertEqual(self.book(self.rooms[0], 7, 10).status_code, 400)
+        self.assertEqual(self.book(self.rooms[0], 8, 10).status_code, 201) # Check-out day is free again
+        self.assertEqual(self.book(self.rooms[1], 5, 8).status_code, 201)
+        self.assertEqual(Booking.objects.count(), 3)
+
+    def test_update_onto_booked_nights_is_rejected(self):
+        self.book(self.rooms[0], 5, 8)
+        moved = self.book(self.rooms[1], 5, 8).json()
+        response = self.client.put(f"/api/bookings/{moved['id']}/", {**moved, 'room': self.rooms[0].pk},
+                                   format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Booking.objects.get(pk=moved['id']).room_id, self.rooms[1].pk)
+
+        # Its own nights do not get in its way
+        response = self.client.patch(f"/api/bookings/{moved['id']}/",
+                                     {'check_out_date': date.today() + timedelta(days=10)}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+@override_settings(BOOKING_EVENT_SETTLE_SECONDS=0)
+class BookingEventTests(APITestCase):
+    # Every change to a booking reaches the event log, whichever way it is made
+    def setUp(self):
+        super().setUp()
+        self.client = self.make_client('Staff')
+        self.guests = self.add_guests(2)
+        self.room = Room.objects.create(number='100', room_type='Q', price=Decimal('100.00'))
+
+    def kinds(self, booking_id):
+        return list(BookingEvent.objects.filter(booking_id=booking_id).order_by('pk').values_list('kind', flat=True))
+
+    def test_every_change_is_recorded(self):
+        today = date.today()
+        booking = self.client.post('/api/bookings/', {
+            'guest': self.guests[0].pk, 'room': self.room.pk, 'payment_method': 'cash',
+            'check_in_date': today + timedelta(days=1), 'check_out_date': today + timedelta(days=3),
+        }, format='json').json()
+        self.client.patch(f"/api/bookings/{booking['id']}/", {'check_out_date': today + timedelta(days=4)},
+                          format='json')
+        self.client.post(f"/api/bookings/{booking['id']}/cancel/")
+        # Outside the API, as the admin does it
+        stored = Booking.objects.get(pk=booking['id'])
+        stored.status = 'reserved'
+        stored.guest = self.guests[1]
+        stored.save()
+        stored.save() # Nothing changed, nothing recorded
+        stored.delete()
+
+        self.assertEqual(self.kinds(booking['id']), ['created', 'updated', 'cancelled', 'updated', 'deleted'])
+        moved = BookingEvent.objects.filter(booking_id=booking['id'], kind='updated').last()
+        self.assertEqual(moved.data['previous'], {'guest': self.guests[0].pk, 'status': 'cancelled'})
+
+        # The booking count moved with the booking, the cancellation stays with the first guest
+        catch_up('guest_stats')
+        stats = {row.guest_id: (row.bookings, row.cancellations) for row in GuestStats.objects.all()}
+        self.assertEqual(stats, {self.guests[0].pk: (0, 1), self.guests[1].pk: (1, 0)})
+
+##### Availability calendar #############################################################
+
+class AvailabilityCalendarTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = self.make_client('Staff')
+        self.guest = self.add_guests(1)[0]
+        self.rooms = [Room.objects.create(number=f'{100 + n}', room_type=room_type, price=Decimal('100.00'))
+                      for n, room_type in enumerate(('Q', 'K'))]
+
+    def book(self, room, check_in, check_out):
+        today = date.today()
+        return self.client.post('/api/bookings/', {
+            'guest': self.guest.pk, 'room': room.pk, 'payment_method': 'cash',
+            'check_in_date': today + timedelta(days=check_in), 'check_out_date': today + timedelta(days=check_out),
+        }, format='json').json()['id']
+
+    def calendar(self, start, end, **params):
+        today = date.today()
+        return self.client.get('/api/availability-calendar/', {
+            'start_date': today + timedelta(days=start), 'end_date': today + timedelta(days=end), **params,
+        })
+
+    def runs(self, start, end, **params):
+        return {room['number']: room['runs'] for room in self.calendar(start, end, **params).json()['rooms']}
+
+    def test_stays_are_run_length_encoded(self):
+        first = self.book(self.rooms[0], 2, 5)
+        second = self.book(self.rooms[0], 5, 6) # Back to back, still its own run
+        self.assertEqual(self.runs(0, 9), {'100': [2, 3, first, 5, 1, second], '101': []})
+        self.assertEqual(self.runs(3, 9)['100'], [0, 2, first, 2, 1, second]) # Clipped to the window
+
+    def test_room_type_filter(self):
+        booking = self.book(self.rooms[1], 1, 3)
+        self.assertEqual(self.runs(0, 9, room_type='K'), {'101': [1, 2, booking]})
+        self.assertEqual(self.calendar(0, 9, room_type='XX').status_code, 400)
+
+    def test_early_check_out_frees_the_remaining_nights(self):
+        early = self.book(self.rooms[0], 0, 3)
+        self.client.post(f'/api/bookings/{early}/check_in/')
+        self.client.post(f'/api/bookings/{early}/check_out/')
+        # Same nights as the search and booking creation see: free again
+        later = self.book(self.rooms[0], 0, 2)
+        self.assertEqual(self.runs(0, 9)['100'], [0, 2, later])
+
+##### Keyset pagination #################################################################
+
+class KeysetPaginationTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = self.make_client('Staff')
+        self.bookings = self.add_rows(20)
+        # Several bookings per check-in date, so pages break inside a run of equal dates
+        for n, booking in enumerate(self.bookings):
+            booking.check_in_date = date.today() + timedelta(days=n % 3 + 1)
+            booking.check_out_date = booking.check_in_date + timedelta(days=1)
+        Booking.objects.bulk_update(self.bookings, ['check_in_date', 'check_out_date'])
+
+    def walk(self, url, params):
+        ids = []
+        while url:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            ids.extend(row['id'] for row in response.json()['results'])
+            url, params = response.json()['next'], {}
+        return ids
+
+    def test_pages_cover_every_row_once_in_order(self):
+        expected = [booking.pk for booking in sorted(self.bookings, key=lambda b: (b.check_in_date, b.pk))]
+        self.assertEqual(self.walk('/api/bookings/', {'page_size': 7}), expected)
+
+    def test_rows_added_while_paging_do_not_shift_pages(self):
+        # With OFFSET, rows inserted ahead of the next page would push rows already served onto it
+        first = self.client.get('/api/bookings/', {'page_size': 7}).json()
+        self.add_rows(3)
+        served = [row['id'] for row in first['results']]
+        rest = self.walk(first['next'], {})
+        self.assertFalse(set(served) & set(rest))
+        self.assertLessEqual({booking.pk for booking in self.bookings}, set(served) | set(rest))
+
+    def test_projection_and_bad_cursor(self):
+        response = self.client.get('/api/bookings/', {'fields': 'id,check_in_date', 'page_size': 5})
+        self.assertEqual(set(response.json()['results'][0]), {'id', 'check_in_date'})
+        self.assertEqual(self.client.get('/api/bookings/', {'cursor': 'not-a-cursor'}).status_code, 404)
+
+##### Outbox ############################################################################
+
+@override_settings(OUTBOX_INLINE=False)
+class OutboxIdempotencyTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = self.make_client('Staff')
+        self.booking = self.add_rows(1)[0]
+        Invoice.objects.filter(booking=self.booking).delete()
+        Booking.objects.filter(pk=self.booking.pk).update(check_in_date=date.today(), status='checked_in')
+
+    def check_out(self):
+        response = self.client.post(f'/api/bookings/{self.booking.pk}/check_out/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_retried_check_out_queues_one_job(self):
+        self.check_out()
+        self.check_out()
+        self.assertEqual(OutboxJob.objects.filter(idempotency_key=f'invoice:{self.booking.pk}').count(), 1)
+        self.assertFalse(Invoice.objects.filter(booking=self.booking).exists()) # Not until the worker runs
+
+        self.assertEqual(run_pending(), 1)
+        self.assertEqual(run_pending(), 0)
+        self.assertEqual(Invoice.objects.filter(booking=self.booking).count(), 1)
+
+    def test_replayed_job_creates_one_invoice(self):
+        self.check_out()
+        run_pending()
+        # A worker that dies after the handler but before marking the job done runs it again
+        OutboxJob.objects.update(status='pending')
+        run_pending()
+        self.assertEqual(Invoice.objects.filter(booking=self.booking).count(), 1)
+        self.assertEqual(OutboxJob.objects.get().status, 'done')
+
+##### Rollups ###########################################################################
+
+class RollupTests(APITestCase):
+    # The occupancy timeline and the daily revenue rollup are kept up by the signals, change by change; the
+    # rebuilds recompute them from scratch and must come to the same rows
+    def setUp(self):
+        super().setUp()
+        self.client = self.make_client('Staff')
+        self.guest = self.add_guests(1)[0]
+        self.rooms = [Room.objects.create(number=f'{100 + n}', room_type=room_type, price=Decimal('100.00'))
+                      for n, room_type in enumerate(('Q', 'K', 'QD'))]
+        self.today = date.today()
+
+    def book(self, room, start, nights):
+        response = self.client.post('/api/bookings/', {
+            'guest': self.guest.pk, 'room': room.pk, 'payment_method': 'cash',
+            'check_in_date': self.today + timedelta(days=start),
+            'check_out_date': self.today + timedelta(days=start + nights),
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        return Booking.objects.get(pk=response.json()['id'])
+
+    def move(self, booking, room, start, nights):
+        response = self.client.patch(f'/api/bookings/{booking.pk}/', {
+            'room': room.pk, 'check_in_date': self.today + timedelta(days=start),
+            'check_out_date': self.today + timedelta(days=start + nights),
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        booking.refresh_from_db()
+
+    def stay_today(self, room, nights):
+        # Arrives today and leaves today, nights before the booked check-out
+        booking = self.book(room, 0, nights)
+        self.client.post(f'/api/bookings/{booking.pk}/check_in/')
+        self.client.post(f'/api/bookings/{booking.pk}/check_out/')
+        return booking
+
+    def test_timeline_matches_rebuild(self):
+        self.book(self.rooms[0], 1, 3)
+        moved = self.book(self.rooms[1], 2, 2)
+        self.move(moved, self.rooms[0], 5, 3)
+        self.move(moved, self.rooms[2], 4, 2) # Again, to another room and fewer nights
+        cancelled = self.book(self.rooms[1], 3, 2)
+        self.client.post(f'/api/bookings/{cancelled.pk}/cancel/')
+        self.stay_today(self.rooms[1], 3) # Early check-out
+        self.assertTrue(timeline_rows())
+
+        upkept = timeline_rows(), sorted(RoomNight.objects.values_list('room_id', 'booking_id', 'night', 'amount'))
+        call_command('backfill_room_nights', stdout=io.StringIO())
+        rebuilt = timeline_rows(), sorted(RoomNight.objects.values_list('room_id', 'booking_id', 'night', 'amount'))
+        self.assertEqual(upkept, rebuilt)
+
+    def test_revenue_rollup_matches_rebuild(self):
+        paid = self.book(self.rooms[0], 1, 3)
+        Invoice.objects.create(booking=paid, amount=Decimal('300.00'), payment_method='cash', is_paid=True)
+
+        paid_later = self.book(self.rooms[1], 2, 2)
+        invoice = Invoice.objects.create(booking=paid_later, amount=Decimal('200.00'), payment_method='credit_card')
+        self.assertEqual(len(revenue_rows()), 3) # The first stay's nights; unpaid invoices are not revenue
+        invoice.is_paid = True
+        invoice.save()
+        invoice.amount = Decimal('180.00') # Corrected after payment
+        invoice.save()
+
+        moved = self.book(self.rooms[2], 1, 2)
+        Invoice.objects.create(booking=moved, amount=Decimal('200.00'), payment_method='cash', is_paid=True)
+        self.move(moved, self.rooms[1], 6, 3)
+
+        cancelled = self.book(self.rooms[1], 9, 2)
+        Invoice.objects.create(booking=cancelled, amount=Decimal('50.00'), payment_method='cash', is_paid=True)
+        self.client.post(f'/api/bookings/{cancelled.pk}/cancel/') # A paid cancellation fee
+        refunded = self.book(self.rooms[0], 10, 2)
+        Invoice.objects.create(booking=refunded, amount=Decimal('200.00'), payment_method='cash', is_paid=True)
+        refunded.invoice.delete()
+
+        early = self.stay_today(self.rooms[2], 3)
+        Invoice.objects.update_or_create(booking=early, defaults={
+            'amount': Decimal('100.00'), 'payment_method': 'cash', 'is_paid': True,
+        })
+        self.assertTrue(revenue_rows())
+
+        upkept = revenue_rows()
+        call_command('rebuild_revenue_rollup', stdout=io.StringIO())
+        self.assertEqual(upkept, revenue_rows())
+
+##### Archive ###########################################################################
+
+class ArchiveTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.guest = self.add_guests(1)[0]
+        self.rooms = [Room.objects.create(number=f'{100 + n}', room_type=room_type, price=Decimal('100.00'))
+                      for n, room_type in enumerate(('Q', 'K'))]
+        self.old = date.today() - timedelta(days=settings.BOOKING_RETENTION_DAYS + 40)
+
+    def stay(self, room, start, nights, status='checked_out', paid=True, left=None):
+        # A past stay through the signals, like one that happened: booked, then closed on the day it left
+        check_in_date = self.old + timedelta(days=start)
+        booking = Booking.objects.create(
+            guest=self.guest, room=room, check_in_date=check_in_date,
+            check_out_date=check_in_date + timedelta(days=nights), total_price=Decimal(100 * nights),
+            payment_method='cash',
+        )
+        booking.status = status
+        booking.is_active = False
+        left = booking.check_out_date if left is None else check_in_date + timedelta(days=left)
+        with mock.patch('core.availability.date', today_is(left)):
+            booking.save()
+        if paid:
+            Invoice.objects.create(booking=booking, amount=booking.total_price, payment_method='cash', is_paid=True)
+        return booking
+
+    def archive(self):
+        call_command('archive_bookings', stdout=io.StringIO())
+
+    def test_rebuilds_count_archived_stays(self):
+        stays = [
+            self.stay(self.rooms[0], 0, 3),
+            self.stay(self.rooms[0], 5, 4, left=1), # Early check-out
+            self.stay(self.rooms[1], 0, 2, left=0), # Left on the day of arrival
+            self.stay(self.rooms[1], 3, 2, status='cancelled', paid=False),
+        ]
+        recent = Booking.objects.create(
+            guest=self.guest, room=self.rooms[1], check_in_date=date.today() - timedelta(days=10),
+            check_out_date=date.today() - timedelta(days=8), total_price=Decimal('200.00'), payment_method='cash',
+        )
+        before = timeline_rows(), revenue_rows()
+
+        self.archive()
+        self.assertEqual(list(Booking.objects.values_list('pk', flat=True)), [recent.pk])
+        self.assertFalse(Invoice.objects.exists())
+        self.assertEqual(set(RoomNight.objects.values_list('booking_id', flat=True)), {recent.pk})
+        self.assertEqual((timeline_rows(), revenue_rows()), before) # Archiving leaves them alone
+
+        rebuild_timeline()
+        rebuild_rollup()
+        self.assertEqual((timeline_rows(), revenue_rows()), before)
+
+        archived = {stay['id']: stay for stay in archived_stays(self.old, self.old + timedelta(days=30))}
+        self.assertEqual({pk: stay['nights'] for pk, stay in archived.items()},
+                         {stays[0].pk: 3, stays[1].pk: 1, stays[2].pk: 0, stays[3].pk: 0})
+        self.assertEqual(archived[stays[0].pk]['invoice_amount'], '300.00')
+        self.assertEqual([stay['id'] for stay in archived_stays(self.old, self.old + timedelta(days=30), 'K')],
+                         [stays[2].pk, stays[3].pk])
+
+    def test_migration_indexes_earlier_archives(self):
+        for start in range(3):
+            self.stay(self.rooms[0], start * 3, 2)
+        self.stay(self.rooms[1], 0, 2, status='cancelled', paid=False) # Not a stay
+        self.archive()
+        fields = ('guest_id', 'room_type', 'check_in_date', 'check_out_date')
+        indexed = sorted(ArchivedStay.objects.values_list(*fields))
+        self.assertEqual(len(indexed), 3)
+
+        ArchivedStay.objects.all().delete()
+        import_module('core.migrations.0016_archivedstay').index_archived_stays(django_apps, None)
+        self.assertEqual(sorted(ArchivedStay.objects.values_list(*fields)), indexed)
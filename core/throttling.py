@@ -0,0 +1,40 @@
+import threading
+import time
+from django.conf import settings
+from rest_framework.throttling import BaseThrottle
+from .cache import LRUCache
+
+class TokenBuckets:
+    # One bucket per client, holding up to burst requests and refilled at rate per minute: a burst goes through at
+    # once, a steady stream is held to the rate. Buckets live in the process, so with several worker processes a
+    # client may get up to that many times the rate; clients not seen for a while are forgotten.
+    def __init__(self, rate, burst, maxsize):
+        self.rate = rate / 60
+        self.burst = burst
+        self.buckets = LRUCache(maxsize)
+        self._lock = threading.Lock()
+
+    def take(self, key):
+        # 0 when the request may go ahead, otherwise the seconds until it may
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self.buckets.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            if tokens >= 1:
+                self.buckets.set(key, (tokens - 1, now))
+                return 0
+            self.buckets.set(key, (tokens, now))
+        return (1 - tokens) / self.rate
+
+auth_buckets = TokenBuckets(settings.AUTH_THROTTLE_RATE, settings.AUTH_THROTTLE_BURST, settings.AUTH_THROTTLE_CLIENTS)
+
+class AuthRateThrottle(BaseThrottle):
+    # Login and registration, per client address; DRF answers 429 with Retry-After
+    buckets = auth_buckets
+
+    def allow_request(self, request, view):
+        self.delay = self.buckets.take(self.get_ident(request))
+        return not self.delay
+
+    def wait(self):
+        return self.delay
@@ -1,8 +1,11 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
+from . import async_views
+from .instrumentation import metrics_view
 from .views import BookingViewSet, GuestViewSet, InvoiceViewSet, RoomViewSet, UserCreate, \
-    RegisterView, calculate_revenue, create_payment_intent, guest_demographics_report, login_view, \
-    occupancy_rate_report, search_available_rooms
+    RegisterView, archived_stays_report, availability_calendar, cache_metrics, calculate_revenue, create_payment_intent, \
+    guest_demographics_report, login_view, logout_view, occupancy_rate_report, occupancy_timeline_report, \
+    search_available_rooms
 
 router = DefaultRouter()
 router.register(r'guests', GuestViewSet)
@@ -12,12 +15,25 @@ router.register(r'invoices', InvoiceViewSet)
 
 urlpatterns = [
     path('', include(router.urls)),
+    path('archived-stays/', archived_stays_report, name='archived_stays'),
+    path('availability-calendar/', availability_calendar, name='availability_calendar'),
+    path('cache-metrics/', cache_metrics, name='cache_metrics'),
     path('calculate-revenue/', calculate_revenue, name='calculate_revenue'),
     path('create-payment-intent/', create_payment_intent),
     path('guest-demographics-report/', guest_demographics_report, name='guest_demographics_report'),
     path('login/', login_view, name='login'),
+    path('logout/', logout_view, name='logout'),
+    path('metrics/', metrics_view, name='metrics'),
     path('occupancy-rate-report/', occupancy_rate_report, name='occupancy_rate_report'),
+    path('occupancy-timeline/', occupancy_timeline_report, name='occupancy_timeline'),
     # path('register/', UserCreate.as_view(), name='user_create'),
     path('register/', RegisterView.as_view(), name='register'),
     path('search-rooms/', search_available_rooms, name='search_available_rooms'),
+
+    # Coroutine versions of the hot read paths, for the ASGI deployment
+    path('async/bookings/<int:pk>/', async_views.booking_detail, name='async_booking_detail'),
+    path('async/create-payment-intent/', async_views.create_payment_intent, name='async_create_payment_intent'),
+    path('async/occupancy-rate-report/', async_views.occupancy_rate_report, name='async_occupancy_rate_report'),
+    path('async/rooms/<int:pk>/', async_views.room_detail, name='async_room_detail'),
+    path('async/search-rooms/', async_views.search_available_rooms, name='async_search_available_rooms'),
 ]
@@ -1,22 +1,52 @@
-from collections import Counter
+from contextlib import contextmanager
 from datetime import date, datetime, timedelta
 from decimal import Decimal
-from django.conf import settings
+from hashlib import md5
 from django.contrib.auth import authenticate
 from django.contrib.auth.models import User
-from django.db import IntegrityError
-from django.db.models import Count, Q
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.db.models.functions import TruncMonth, TruncWeek
+from django.http import HttpResponse
 from django.shortcuts import render
+from django.views.decorators.gzip import gzip_page
+from django.utils.http import parse_etags
 from .permissions import IsGuest, IsStaff, IsAdmin, IsManager
 from rest_framework import status, generics, permissions, viewsets
-from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.decorators import action, api_view, permission_classes, renderer_classes, throttle_classes
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import JSONParser
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import BrowsableAPIRenderer
+from rest_framework.settings import api_settings
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt import views as jwt_views
 from rest_framework_simplejwt.tokens import RefreshToken
 import stripe
-from .models import Booking, Guest, Invoice, Room, UserRole, UserProfile
-from .serializers import BookingSerializer, GuestSerializer, \
-    InvoiceSerializer, RoomSerializer, UserSerializer
+from .authentication import HashingBusy, revoke_token, token_cache
+from .archive import archived_stays
+from .availability import hold_booking_nights, lock_rooms, room_is_free, stay_nights
+from .cache import bump_version
+from .events import record_many
+from .inventory import RoomLookup, room_cache
+from .live import publish_changes
+from .models import Booking, DailyRevenue, Guest, GuestStats, Invoice, OccupancyDay, Room, RoomNight
+from .occupancy import apply_occupancy_changes, occupancy_rate, occupancy_timeline
+from .outbox import enqueue
+from .pagination import BookingKeysetPagination
+from .parsers import CSVParser
+from .payments import amount_in_cents, get_gateway, payment_intent_key
+from .pricing import Pricer, price_stay, rate_cache
+from .renderers import FastJSONRenderer
+from .reports import guest_demographics
+from .room_calendar import room_calendar
+from .roles import role_cache
+from .search import SEARCH_MAX_NIGHTS, invalidate_searches, search_cache, search_response
+from .serializers import BookingSerializer, GuestSerializer, GuestStatsSerializer, \
+    InvoiceSerializer, RoleTokenObtainPairSerializer, RoomSerializer, UserSerializer, values_row_builder
+from .throttling import AuthRateThrottle
 
 # Create your views here.
 ###############################################################################################################
@@ -25,26 +55,145 @@ from .serializers import BookingSerializer, GuestSerializer, \
 ###############################################################################################################
 ###############################################################################################################
 
-class GuestViewSet(viewsets.ModelViewSet):
+# Supported ?group_by= values for calculate_revenue and how each one buckets rollup rows
+REVENUE_GROUPINGS = {
+    'day': F('date'),
+    'week': TruncWeek('date'),
+    'month': TruncMonth('date'),
+    'room_type': F('room_type'),
+}
+
+# Longest range served by occupancy_timeline_report
+OCCUPANCY_TIMELINE_MAX_DAYS = 366
+
+# Longest range served by availability_calendar, and the range it shows when none is given
+CALENDAR_MAX_DAYS = 366
+CALENDAR_DEFAULT_DAYS = 90
+
+# Longest range served by archived_stays_report
+ARCHIVED_STAYS_MAX_DAYS = 366
+
+# Largest batch accepted by POST /api/bookings/bulk/
+BULK_BOOKING_MAX_ROWS = 1000
+
+class FieldProjectionMixin:
+    # ?fields=id,check_in_date narrows the serializer output and loads only those columns (plus the
+    # primary key and the pagination key) with only(), so lean clients skip full model hydration
+    fields_query_param = 'fields'
+
+    def get_requested_fields(self):
+        if self.request is None or self.request.method not in permissions.SAFE_METHODS:
+            return None
+        fields = self.request.query_params.get(self.fields_query_param)
+        if not fields:
+            return None
+
+        fields = {name.strip() for name in fields.split(',') if name.strip()}
+        unknown = fields - set(self.get_serializer_class()().fields)
+        if unknown:
+            raise ValidationError({self.fields_query_param: f"Unknown field(s): {', '.join(sorted(unknown))}."})
+        return fields
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        fields = self.get_requested_fields()
+        if fields:
+            model = queryset.model
+            columns = {field.name for field in model._meta.concrete_fields} & fields
+            columns |= {model._meta.pk.name, *getattr(self.paginator, 'ordering', ())}
+            queryset = queryset.select_related(None).only(*columns) # Related rows are never needed for a projection
+        return queryset
+
+    def get_serializer(self, *args, **kwargs):
+        fields = self.get_requested_fields()
+        if fields:
+            kwargs.setdefault('fields', fields)
+        return super().get_serializer(*args, **kwargs)
+
+class FastListMixin:
+    # JSON list responses are built from values() rows instead of model instances and serializers (see
+    # core.serializers.values_row_builder) and encoded by FastJSONRenderer; the output is the same, which
+    # core.tests.FastListTests verifies. The browsable API, and serializers the fast path cannot follow, use the
+    # regular list. Set fast_list = False on a ViewSet to turn it off.
+    fast_list = True
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+
+    def list(self, request, *args, **kwargs):
+        plan = None
+        if self.fast_list and request.accepted_renderer.format == 'json':
+            plan = values_row_builder(self.get_serializer())
+        if plan is None:
+            return super().list(request, *args, **kwargs)
+
+        columns, build = plan
+        ordering = getattr(self.paginator, 'ordering', ())
+        queryset = self.filter_queryset(self.get_queryset()).values(*dict.fromkeys([*columns, *ordering]))
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(build(page))
+        return Response(build(queryset))
+
+@contextmanager
+def regular_path(viewset):
+    # The ViewSet as it would be without FastListMixin: serializers and DRF's own renderers. For comparing the two.
+    saved = viewset.__dict__.get('fast_list'), viewset.__dict__.get('renderer_classes')
+    viewset.fast_list, viewset.renderer_classes = False, api_settings.DEFAULT_RENDERER_CLASSES
+    try:
+        yield
+    finally:
+        for name, value in zip(('fast_list', 'renderer_classes'), saved):
+            if value is None:
+                delattr(viewset, name)
+            else:
+                setattr(viewset, name, value)
+
+class GuestViewSet(FastListMixin, FieldProjectionMixin, viewsets.ModelViewSet):
     queryset = Guest.objects.all()
     serializer_class = GuestSerializer
 
     permission_classes = [IsGuest]
 
-class RoomViewSet(viewsets.ModelViewSet):
+    @action(detail=True, methods=['GET'], permission_classes=[IsStaff])
+    def stats(self, request, pk=None):
+        # Lifetime figures kept from the booking event log (core.events), a few seconds behind it
+        guest = self.get_object()
+        stats = GuestStats.objects.filter(guest=guest).first() or GuestStats(guest=guest)
+        return Response(GuestStatsSerializer(stats).data)
+
+class RoomViewSet(FastListMixin, FieldProjectionMixin, viewsets.ModelViewSet):
     queryset = Room.objects.all()
     serializer_class = RoomSerializer
 
     permission_classes = [IsStaff]
 
-class BookingViewSet(viewsets.ModelViewSet):
-    queryset = Booking.objects.all()
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(request, super().retrieve, *args, **kwargs)
+
+    def cached_response(self, request, view, *args, **kwargs):
+        # The inventory version changes on every room write, so it doubles as the ETag of every room response
+        etag = f'W/"rooms-{room_cache.version()}"'
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+        key = 'response:' + md5(request.build_absolute_uri().encode()).hexdigest()
+        data = room_cache.get_or_load(key, lambda: view(request, *args, **kwargs).data)
+        return Response(data, headers={'ETag': etag})
+
+class BookingViewSet(FastListMixin, FieldProjectionMixin, viewsets.ModelViewSet):
+    queryset = Booking.objects.select_related('guest', 'room') # Booking.__str__ follows both
     serializer_class = BookingSerializer
+    pagination_class = BookingKeysetPagination
 
     permission_classes = [IsAuthenticated]
 
     def create(self, request, *args, **kwargs):
-        serializer = self.get_serializer(data=request.data)
+        # The room, and so the price, comes from the cached inventory
+        context = self.get_serializer_context()
+        context['preloaded'] = {Room: RoomLookup()}
+        serializer = self.get_serializer(data=request.data, context=context)
         serializer.is_valid(raise_exception=True)
 
         # Get data from the validated serializer
@@ -59,43 +208,63 @@ class BookingViewSet(viewsets.ModelViewSet):
         if check_in_date < date.today():
             return Response({"error": "Check-in date cannot be in the past."}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Overlapping bookings check (Revised Logic)
-        overlapping_bookings = Booking.objects.filter(
-            room=room,
-            is_active=True,
-        ).filter(
-            Q(check_in_date__range=(check_in_date, check_out_date)) |  # New booking starts within an existing booking
-            Q(check_out_date__range=(check_in_date, check_out_date)) |  # New booking ends within an existing booking
-            Q(check_in_date__lte=check_in_date, check_out_date__gte=check_out_date)  # New booking encompasses an existing booking
-        )
-
-        if overlapping_bookings.exists():
-            return Response({"error": "Room is already booked for this period."}, status=status.HTTP_400_BAD_REQUEST)
+        # Calculate total price from the room's base price and the rate plans in force
+        serializer.validated_data["total_price"] = price_stay(room, check_in_date, check_out_date)
 
-        # Calculate total price
-        num_nights = (check_out_date - check_in_date).days
-        total_price = num_nights * room.price
-        serializer.validated_data["total_price"] = total_price
+        try:
+            with transaction.atomic():
+                # Concurrent creates for this room wait here until we commit; other rooms never block
+                lock_rooms([room.pk])
+
+                # Overlapping bookings check against the availability index
+                if not room_is_free(room, check_in_date, check_out_date):
+                    return Response({"error": "Room is already booked for this period."}, status=status.HTTP_400_BAD_REQUEST)
 
-        self.perform_create(serializer)
+                self.perform_create(serializer) # Booking, its index rows and its event are written together
+        except IntegrityError: # Unique (room, night) index is the last line of defence
+            return Response({"error": "Room is already booked for this period."}, status=status.HTTP_400_BAD_REQUEST)
         headers = self.get_success_headers(serializer.data)
         return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
 
+    def perform_update(self, serializer):
+        booking = serializer.instance
+        room = serializer.validated_data.get('room', booking.room)
+        check_in_date = serializer.validated_data.get('check_in_date', booking.check_in_date)
+        check_out_date = serializer.validated_data.get('check_out_date', booking.check_out_date)
+
+        # A different room or stay is priced afresh, or the timeline would spread the old total over the new nights
+        if (room.pk, check_in_date, check_out_date) != (booking.room_id, booking.check_in_date, booking.check_out_date):
+            serializer.validated_data['total_price'] = price_stay(room, check_in_date, check_out_date)
+
+        try:
+            with transaction.atomic():
+                # Same room locks as create, the booking's current room too, so a move cannot race a create
+                lock_rooms({booking.room_id, room.pk})
+
+                # Moving a stay is checked like a new one, leaving out the nights the booking already holds
+                if not room_is_free(room, check_in_date, check_out_date, booking=booking):
+                    raise ValidationError({"error": "Room is already booked for this period."})
+                serializer.save()
+        except IntegrityError: # Unique (room, night) index, as in create
+            raise ValidationError({"error": "Room is already booked for this period."})
+
     @action(detail=True, methods=['POST'])
     def check_in(self, request, pk=None):
         booking = self.get_object()
 
-        if not booking.is_active:  # Check if booking is active
+        if booking.status != 'reserved':  # Check if booking is still waiting for arrival
             return Response({"error": "Booking is not active."},
             status=status.HTTP_400_BAD_REQUEST)
         if booking.check_in_date != date.today(): # Verify they are checking in today
             return Response({"error": "Cannot check in on a different date."},
             status=status.HTTP_400_BAD_REQUEST)
         
-        booking.is_active = False
+        # The booking stays active while the guest is in house so the room keeps its nights
+        booking.status = 'checked_in'
         booking.room.is_available = False
-        booking.save()
-        booking.room.save()
+        with transaction.atomic():
+            booking.save()
+            booking.room.save()
 
         return Response({"message": "Check-in successful"})
     
@@ -103,28 +272,144 @@ class BookingViewSet(viewsets.ModelViewSet):
     def check_out(self, request, pk=None):
         booking = self.get_object()
 
-        if not booking.is_active:  # Check if booking is active
-            return Response({"error": "Booking is not active."},
-            status=status.HTTP_400_BAD_REQUEST)
-        
-        booking.room.is_available = True
-        booking.room.save()
+        with transaction.atomic():
+            # Re-read under a row lock so two check-outs of the same booking cannot both go through
+            booking = Booking.objects.select_for_update().select_related('room').get(pk=booking.pk)
 
-        # Create an invoice
-        create_invoice(booking)
+            if booking.status == 'checked_out':  # A retried check-out is answered like the first one
+                return Response({"message": "Check-out successful"})
+            if booking.status != 'checked_in':  # Check if guest is in house
+                return Response({"error": "Booking is not checked in."},
+                status=status.HTTP_400_BAD_REQUEST)
+
+            # Deactivating the booking frees the room's remaining nights in the availability index
+            booking.status = 'checked_out'
+            booking.is_active = False
+            booking.room.is_available = True
+            booking.save() # Records the checked_out event (core.signals)
+            booking.room.save()
+
+            # Invoice is created by the outbox worker once this commits, see core.outbox
+            enqueue('create_invoice', f'invoice:{booking.pk}', booking_id=booking.pk)
 
         return Response({"message": "Check-out successful"})
 
-class InvoiceViewSet(viewsets.ModelViewSet):
-    queryset = Invoice.objects.all()
+    @action(detail=True, methods=['POST'])
+    def cancel(self, request, pk=None):
+        booking = self.get_object()
+
+        if booking.status != 'reserved':  # Only bookings that have not started can be cancelled
+            return Response({"error": "Only reserved bookings can be cancelled."},
+            status=status.HTTP_400_BAD_REQUEST)
+
+        booking.status = 'cancelled'
+        booking.is_active = False
+        with transaction.atomic(): # With its index rows and event (core.signals)
+            booking.save()
+
+        return Response({"message": "Booking cancelled"})
+
+    @action(detail=False, methods=['POST'], parser_classes=[JSONParser, CSVParser])
+    def bulk(self, request):
+        rows = request.data
+        mode = request.query_params.get('mode', 'all_or_nothing')
+
+        # Basic validations
+        if mode not in ('all_or_nothing', 'best_effort'):
+            return Response({"error": "mode must be 'all_or_nothing' or 'best_effort'."}, status=status.HTTP_400_BAD_REQUEST)
+        if not isinstance(rows, list) or not rows:
+            return Response({"error": "Expected a non-empty list of bookings."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(rows) > BULK_BOOKING_MAX_ROWS:
+            return Response({"error": f"A batch can hold at most {BULK_BOOKING_MAX_ROWS} bookings."}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Resolve every guest the batch refers to in one query, rooms come from the cached inventory
+        context = self.get_serializer_context()
+        context['preloaded'] = {
+            Guest: Guest.objects.in_bulk(referenced_ids(rows, 'guest')),
+            Room: RoomLookup(),
+        }
+
+        errors = []
+        valid_rows = []
+        for index, row in enumerate(rows):
+            serializer = self.get_serializer(data=row, context=context)
+            if serializer.is_valid():
+                valid_rows.append((index, serializer.validated_data))
+            else:
+                errors.append({"row": index, "errors": serializer.errors})
+
+        with transaction.atomic():
+            room_ids = {data['room'].pk for _, data in valid_rows}
+            lock_rooms(room_ids)
+
+            # One range query finds every night already taken in any room of the batch, and one pricer
+            # covers every stay in it
+            taken = {}
+            if valid_rows:
+                first_night = min(data['check_in_date'] for _, data in valid_rows)
+                last_check_out = max(data['check_out_date'] for _, data in valid_rows)
+                taken = dict.fromkeys(RoomNight.objects.filter(
+                    room_id__in=room_ids,
+                    night__gte=first_night,
+                    night__lt=last_check_out,
+                ).values_list('room_id', 'night'))
+                pricer = Pricer(first_night, last_check_out)
+
+            bookings = []
+            for index, data in valid_rows:
+                room = data['room']
+                nights = [(room.pk, night) for night in stay_nights(data['check_in_date'], data['check_out_date'])]
+                clashes = {taken[night] for night in nights if night in taken}
+                if clashes:
+                    # Rows earlier in the batch that got these nights are named, existing bookings are not
+                    clashing_rows = sorted(row for row in clashes if row is not None)
+                    message = f"Room is already booked for this period by row {clashing_rows[0]}." if clashing_rows \
+                        else "Room is already booked for this period."
+                    errors.append({"row": index, "errors": {"non_field_errors": [message]}})
+                    continue
+
+                taken.update(dict.fromkeys(nights, index))
+                total_price = pricer.stay_price(room, data['check_in_date'], data['check_out_date'])
+                bookings.append(Booking(**data, total_price=total_price))
+
+            errors.sort(key=lambda error: error["row"])
+            if not bookings or (errors and mode == 'all_or_nothing'):
+                return Response({"created": [], "errors": errors}, status=status.HTTP_400_BAD_REQUEST)
+
+            Booking.objects.bulk_create(bookings)
+            record_many('created', bookings)
+            changes = hold_booking_nights(bookings)
+            apply_occupancy_changes(changes)
+            invalidate_searches(changes)
+            publish_changes(changes)
+            # bulk_create skips the post_save receivers; report caches are invalidated once the import commits
+            transaction.on_commit(lambda: bump_version('bookings'))
+
+        return Response({
+            "created": self.get_serializer(bookings, many=True).data,
+            "errors": errors,
+        }, status=status.HTTP_201_CREATED)
+
+class InvoiceViewSet(FastListMixin, FieldProjectionMixin, viewsets.ModelViewSet):
+    queryset = Invoice.objects.select_related('booking')
     serializer_class = InvoiceSerializer
 
     permission_classes = [IsGuest]
 
+    # The invoice, its revenue rollup rows and its booking events (core.signals) commit together
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            serializer.save()
+
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            serializer.save()
+
 # Registration View Function
 class RegisterView(generics.CreateAPIView):
     queryset = User.objects.all()
     permission_classes = (permissions.AllowAny,)
+    throttle_classes = (AuthRateThrottle,)
     serializer_class = UserSerializer
 
     def post(self, request, *args, **kwargs):
@@ -132,11 +417,9 @@ class RegisterView(generics.CreateAPIView):
         serializer.is_valid(raise_exception=True)
         
         try:
-            user = serializer.save()
-            role = UserRole.objects.get(name='Guest')
-            UserProfile.objects.create(user=user, role=role)
+            user = serializer.save() # With a UserProfile holding the default role 'Guest'
 
-            refresh = RefreshToken.for_user(user)
+            refresh = RoleTokenObtainPairSerializer.get_token(user)
             return Response({
                 'refresh': str(refresh),
                 'access': str(refresh.access_token),
@@ -144,6 +427,23 @@ class RegisterView(generics.CreateAPIView):
         
         except IntegrityError as e: # Catch potential integrity errors (e.g. duplicate usernames)
             return Response({'error': 'Username or email already exists.'}, status=status.HTTP_400_BAD_REQUEST)
+        except HashingBusy as exc:
+            return hashing_busy_response(exc)
+
+class TokenObtainPairView(jwt_views.TokenObtainPairView):
+    # simplejwt's sign-in, throttled and answering a full hashing pool like login_view
+    throttle_classes = (AuthRateThrottle,)
+
+    def post(self, request, *args, **kwargs):
+        try:
+            return super().post(request, *args, **kwargs)
+        except HashingBusy as exc:
+            return hashing_busy_response(exc)
+
+def hashing_busy_response(exc):
+    # Password hashing pool full (see core.authentication): come back shortly rather than fail
+    return Response({'error': 'Too many sign-ins at once, try again shortly.'},
+                    status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': str(exc.wait)})
 
 ###############################################################################################################
 ###############################################################################################################
@@ -151,14 +451,15 @@ class RegisterView(generics.CreateAPIView):
 ###############################################################################################################
 ###############################################################################################################
 
-# Create Invoice Function
-def create_invoice(booking):
-    total_price = booking.total_price
-    Invoice.objects.create(
-        booking=booking,
-        amount=total_price,
-        payment_method=booking.payment_method, # Add payment method
-    )
+# Collect the integer ids a batch of rows refers to in one column
+def referenced_ids(rows, field):
+    ids = set()
+    for row in rows:
+        try:
+            ids.add(int(row.get(field)))
+        except (AttributeError, TypeError, ValueError): # Left for the serializer to report
+            pass
+    return ids
 
 # Calculate Revenue Function
 @api_view(['GET'])
@@ -166,55 +467,72 @@ def calculate_revenue(request):
     # Get start and end dates from query parameters
     start_date_str = request.query_params.get('start_date')
     end_date_str = request.query_params.get('end_date')
+    group_by = request.query_params.get('group_by')
 
     # Validate dates
     try:
         start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
         end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
-    except ValueError:
+    except (ValueError, TypeError):
         return Response({'error': 'Invalid date format. Please use YYYY-MM-DD format.'}, 
                         status=status.HTTP_400_BAD_REQUEST )
-    
-    # Calculate revenue
-    bookings = Booking.objects.filter(
-        check_in_date__lte=end_date,
-        check_out_date__gte=start_date,
-        invoice__is_paid=True, # Ensure only paid bookings are included
-    )
+    if group_by and group_by not in REVENUE_GROUPINGS:
+        return Response({'error': f"group_by must be one of: {', '.join(REVENUE_GROUPINGS)}."},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    # Calculate revenue from the daily rollup: paid invoices, spread over the nights that fall in the range
+    revenue = DailyRevenue.objects.filter(date__range=(start_date, end_date))
+    total_revenue = revenue.aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
 
-    total_revenue = sum(booking.total_price for booking in bookings)
+    if not group_by:
+        return Response({'total_revenue': total_revenue})
 
-    return Response({'total_revenue': total_revenue})
+    key = 'room_type' if group_by == 'room_type' else 'period'
+    if key == 'period':
+        revenue = revenue.annotate(period=REVENUE_GROUPINGS[group_by])
+    breakdown = revenue.values(key).annotate(revenue=Sum('amount')).order_by(key)
+
+    return Response({'total_revenue': total_revenue, 'group_by': group_by, 'breakdown': list(breakdown)})
 
 # Guest Demographics Report Function
 @api_view(['GET'])
 @permission_classes([IsStaff])
 def guest_demographics_report(request):
-    # Get all guests
-    guests = Guest.objects.all()
-
-    # Calculate demographics
-    countries = Counter(guest.address.split(',')[-1].strip() for guest in guests
-                        if guest.address) # Extract country from address (assume last part of address is country)
-    ages = Counter((date.today().year - guest.date_of_birth.year) for guest in guests 
-                   if guest.date_of_birth) #Assuming you have date_of_birth field
-    
-    return Response({
-        'countries': countries,
-        'ages': ages
-    })
+    # Optional filters: guests staying between start_date and end_date, and/or in a room type; archive=1 counts
+    # archived stays as well
+    start_date_str = request.query_params.get('start_date')
+    end_date_str = request.query_params.get('end_date')
+    room_type = request.query_params.get('room_type')
+    include_archive = request.query_params.get('archive') in ('1', 'true')
+
+    # Validate filters
+    try:
+        start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date() if start_date_str else None
+        end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date() if end_date_str else None
+    except ValueError:
+        return Response({'error': 'Invalid date format. Use YYYY-MM-DD.'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    if room_type and room_type not in dict(Room.ROOM_TYPES):
+        return Response({'error': 'Invalid room type.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    # Calculate demographics (cached, see core.reports)
+    return Response(guest_demographics(start_date, end_date, room_type, include_archive))
 
 # Login View Function
 @api_view(['POST'])
 @permission_classes([permissions.AllowAny])
+@throttle_classes([AuthRateThrottle])
 def login_view(request):
     username = request.data.get('username')
     password = request.data.get('password')
 
-    # Check user credentials against built in user model
-    user = authenticate(request, username=username, password=password)
+    # Check user credentials against built in user model (hashing in the pool, see core.authentication)
+    try:
+        user = authenticate(request, username=username, password=password)
+    except HashingBusy as exc:
+        return hashing_busy_response(exc)
     if user is not None:
-        refresh = RefreshToken.for_user(user)
+        refresh = RoleTokenObtainPairSerializer.get_token(user)
         return Response({
             'refresh': str(refresh),
             'access': str(refresh.access_token),
@@ -222,6 +540,24 @@ def login_view(request):
     else:
         return Response({'error': 'Invalid credentials'}, status=status.HTTP_401_UNAUTHORIZED)
 
+# Logout View Function
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def logout_view(request):
+    # Tokens are not stored, so logging out puts the access token, and the refresh token if sent, on the blocklist
+    refresh = request.data.get('refresh')
+    try:
+        refresh = refresh and RefreshToken(refresh)
+    except TokenError:
+        return Response({'error': 'Invalid refresh token.'}, status=status.HTTP_400_BAD_REQUEST)
+    if refresh and refresh[jwt_settings.USER_ID_CLAIM] != request.auth[jwt_settings.USER_ID_CLAIM]:
+        return Response({'error': 'Invalid refresh token.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    revoke_token(request.auth)
+    if refresh:
+        revoke_token(refresh)
+    return Response({'message': 'Logged out'})
+
 # Occupancy Rate Report Function
 @api_view(['GET'])
 @permission_classes([IsStaff])
@@ -235,18 +571,95 @@ def occupancy_rate_report(request):
         return Response({'error': 'Invalid date format. Use YYYY-MM-DD.'},
                         status=status.HTTP_400_BAD_REQUEST)
 
-    # Get total rooms and occupied rooms for the given date
+    # Get total rooms and rooms sold for the given date from the occupancy timeline
     total_rooms = Room.objects.count()
-    occupied_rooms = Booking.objects.filter(
-        check_in_date__lte=report_date,
-        check_out_date__gt=report_date,
-        is_active=True
-    ).count()
+    occupied_rooms = OccupancyDay.objects.filter(date=report_date).values_list('rooms_sold', flat=True).first() or 0
 
     # Calculate occupancy rate
-    occupancy_rate = (occupied_rooms / total_rooms) * 100 if total_rooms > 0 else 0
+    return Response({'date': report_date, 'occupancy_rate': occupancy_rate(occupied_rooms, total_rooms)})
 
-    return Response({'date': report_date, 'occupancy_rate': occupancy_rate})
+# Occupancy Timeline Function
+@api_view(['GET'])
+@permission_classes([IsStaff])
+def occupancy_timeline_report(request):
+    start_date_str = request.query_params.get('start_date')
+    end_date_str = request.query_params.get('end_date')
+
+    # Validate dates
+    try:
+        start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
+        end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
+    except (ValueError, TypeError):
+        return Response({'error': 'Invalid date format. Use YYYY-MM-DD.'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    if start_date > end_date:
+        return Response({'error': 'start_date must not be after end_date.'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    if (end_date - start_date).days >= OCCUPANCY_TIMELINE_MAX_DAYS:
+        return Response({'error': f'A timeline can span at most {OCCUPANCY_TIMELINE_MAX_DAYS} days.'},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    # Rooms sold, arrivals, departures and revenue per date, read from the materialized timeline
+    total_rooms = Room.objects.count()
+    return Response({
+        'total_rooms': total_rooms,
+        'timeline': occupancy_timeline(start_date, end_date, total_rooms),
+    })
+
+# Availability Calendar Function
+@gzip_page # A year of a large hotel is around a megabyte of JSON; runs of small numbers compress well
+@api_view(['GET'])
+@permission_classes([IsStaff])
+@renderer_classes([FastJSONRenderer, BrowsableAPIRenderer])
+def availability_calendar(request):
+    room_type = request.query_params.get('room_type')
+
+    # Validate dates; the next CALENDAR_DEFAULT_DAYS nights when none are given
+    try:
+        start_date = date.fromisoformat(request.query_params.get('start_date', date.today().isoformat()))
+        end_date = request.query_params.get('end_date')
+        end_date = date.fromisoformat(end_date) if end_date else start_date + timedelta(days=CALENDAR_DEFAULT_DAYS - 1)
+    except ValueError:
+        return Response({'error': 'Invalid date format. Use YYYY-MM-DD.'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    if start_date > end_date:
+        return Response({'error': 'start_date must not be after end_date.'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    if (end_date - start_date).days >= CALENDAR_MAX_DAYS:
+        return Response({'error': f'A calendar can span at most {CALENDAR_MAX_DAYS} days.'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    if room_type and room_type not in dict(Room.ROOM_TYPES):
+        return Response({'error': 'Invalid room type.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    # Every room with its booked runs: [first night, nights, booking id, ...], nights counted from start_date
+    return Response(room_calendar(start_date, end_date, room_type))
+
+# Archived Stays Function
+@gzip_page # Archived stays come back as JSON rows, a month of a large hotel is several megabytes of it
+@api_view(['GET'])
+@permission_classes([IsStaff])
+@renderer_classes([FastJSONRenderer, BrowsableAPIRenderer])
+def archived_stays_report(request):
+    room_type = request.query_params.get('room_type')
+
+    # Validate filters
+    try:
+        start_date = date.fromisoformat(request.query_params.get('start_date', ''))
+        end_date = date.fromisoformat(request.query_params.get('end_date', ''))
+    except ValueError:
+        return Response({'error': 'Invalid date format. Use YYYY-MM-DD.'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    if start_date > end_date:
+        return Response({'error': 'start_date must not be after end_date.'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    if (end_date - start_date).days >= ARCHIVED_STAYS_MAX_DAYS:
+        return Response({'error': f'At most {ARCHIVED_STAYS_MAX_DAYS} days of archived stays can be read at once.'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    if room_type and room_type not in dict(Room.ROOM_TYPES):
+        return Response({'error': 'Invalid room type.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    # Stays moved out of the booking tables by archive_bookings, overlapping the range (see core.archive)
+    return Response(list(archived_stays(start_date, end_date, room_type or None)))
 
 # Search Available Rooms Function
 @api_view(['GET'])
@@ -267,39 +680,60 @@ def search_available_rooms(request):
         return Response({"error": "Invalid date format. Please use YYYY-MM-DD format."}, 
                         status=status.HTTP_400_BAD_REQUEST)
     
-    # Query for available rooms
-    available_rooms = Room.objects.filter(is_available=True).exclude(
-        bookings__check_in_date__lte=check_out_date, 
-        bookings__check_out_date__gte=check_in_date
-    )
+    if check_in_date >= check_out_date:
+        return Response({"error": "Check-out date must be after check-in date."},
+                        status=status.HTTP_400_BAD_REQUEST)
+    if (check_out_date - check_in_date).days > SEARCH_MAX_NIGHTS:
+        return Response({"error": f"A search can cover at most {SEARCH_MAX_NIGHTS} nights."},
+                        status=status.HTTP_400_BAD_REQUEST)
 
-    if room_type:
-        available_rooms = available_rooms.filter(room_type=room_type)
+    # Cached JSON bytes, sent as they are: hits skip the queries, the serializer and DRF's renderer
+    return HttpResponse(search_response(check_in_date, check_out_date, room_type), content_type='application/json')
 
-    serializer = RoomSerializer(available_rooms, many=True)
-    return Response(serializer.data)
+# Cache Metrics Function
+@api_view(['GET'])
+@permission_classes([IsStaff])
+def cache_metrics(request):
+    # Counters of the process answering the request; each worker process keeps its own
+    return Response({
+        'rates': rate_cache.stats(),
+        'rooms': room_cache.stats(),
+        'roles': role_cache.stats(),
+        'search': search_cache.stats(),
+        'tokens': token_cache.stats(),
+    })
 
 ##### Stripe ############################################################################
-stripe.api_key = settings.STRIPE_SECRET_KEY
-
 ##### Create Payment Intent  #####
 @api_view(['POST'])
 def create_payment_intent(request):
+    # Pay for a booking ({"booking": id}), or an ad-hoc {"amount": cents}; for bookings the idempotency key comes
+    # from the booking, so a client retrying the request gets the same intent back instead of a second one
     try:
-        amount = int(request.data['amount'])
-
-        payment_intent = stripe.PaymentIntent.create(
-            amount=amount,
-            currency='usd',
-            automatic_payment_methods={
-                'enabled': True,
-            },
-        )
-
-        return Response({'clientSecret': payment_intent['client_secret']})
+        if 'booking' in request.data:
+            booking = Booking.objects.get(pk=request.data['booking'])
+            amount = amount_in_cents(booking.total_price)
+            idempotency_key = payment_intent_key(booking, amount)
+            metadata = {'booking_id': booking.pk}
+        else:
+            amount = int(request.data['amount'])
+            idempotency_key = request.headers.get('Idempotency-Key')
+            metadata = None
+    except Booking.DoesNotExist:
+        return Response({'error': 'Booking not found'}, status=status.HTTP_404_NOT_FOUND)
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
+    try:
+        payment_intent = get_gateway().create_payment_intent(amount, idempotency_key, metadata)
+    except stripe.APIConnectionError as e:
+        # Stripe could not be reached even after retries; the same request can safely be sent again
+        return Response({'error': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    except stripe.StripeError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response({'clientSecret': payment_intent['client_secret']})
+
 ##### Create User #######################################################################
 class UserCreate(generics.CreateAPIView):
     queryset = User.objects.all()
@@ -307,8 +741,5 @@ class UserCreate(generics.CreateAPIView):
     permission_classes = [permissions.AllowAny]
 
     def perform_create(self, serializer):
-        user = serializer.save()
-
-        # Create a UserProfile for the new user and assign the default role 'Guest'
-        role = UserRole.objects.get(name='Guest')
-        UserProfile.objects.create(user=user, role=role)
\ No newline at end of file
+        # The serializer also creates a UserProfile for the new user with the default role 'Guest'
+        serializer.save()
\ No newline at end of file
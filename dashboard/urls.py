@@ -6,4 +6,6 @@ app_name = 'dashboard'
 urlpatterns = [
     path('', views.overview, name='overview'),
     path('bookings/', views.bookings, name='bookings'),
+    path('live/', views.live_snapshot, name='live_snapshot'),
+    path('live/stream/', views.live_stream, name='live_stream'),
 ]
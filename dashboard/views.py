@@ -1,7 +1,17 @@
+import asyncio
+import json
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required, permission_required
-from core.models import Booking, Room
-from datetime import date
+from django.contrib.auth.views import redirect_to_login
+from django.views.decorators.http import condition
+from core.live import live_feed
+
+# Seconds between comment lines on an idle stream, so proxies do not close it
+HEARTBEAT_SECONDS = 15
 
 # Create your views here.
 @login_required
@@ -13,17 +23,52 @@ def bookings(request):
 @login_required
 @permission_required('core.view_booking')
 def overview(request):  # Make sure the function is defined
-    today = date.today()
-    arrivals_today = Booking.objects.filter(check_in_date=today).count()
-    departures_today = Booking.objects.filter(check_out_date=today).count()
-
-    occupied_rooms = Room.objects.filter(is_available=False).count()
-    total_rooms = Room.objects.count()
-    occupancy_rate = (occupied_rooms / total_rooms) * 100 if total_rooms > 0 else 0
-
+    # Figures from the live feed (core.live), recomputed once per change rather than on every page load; the page
+    # keeps them current over live_stream, or by polling live_snapshot
+    _, snapshot = live_feed.current()
     context = {
-        'arrivals_today': arrivals_today,
-        'departures_today': departures_today,
-        'occupancy_rate': occupancy_rate,
+        **snapshot,
+        'poll_seconds': settings.DASHBOARD_POLL_SECONDS,
     }
     return render(request, 'dashboard/overview.html', context)
+
+@login_required
+@permission_required('core.view_booking')
+@condition(etag_func=lambda request: live_feed.current()[0])
+def live_snapshot(request):
+    # Polling fallback: the current figures, and 304 Not Modified until they change
+    response = JsonResponse(live_feed.current()[1])
+    response['Cache-Control'] = f'private, max-age={settings.DASHBOARD_POLL_SECONDS}'
+    return response
+
+async def live_stream(request):
+    # Server-sent events: the figures now and after every change. Needs the ASGI deployment (jolly_hms.asgi); a
+    # WSGI worker would be tied up for the length of the stream, so it answers 204 and the page polls instead.
+    # login_required and permission_required only take coroutine views from Django 5.1 on, so the same check
+    # (redirect to the login page) is made here.
+    user = await request.auser()
+    if not await sync_to_async(user.has_perm)('core.view_booking'):
+        return redirect_to_login(request.get_full_path())
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no' # Stops nginx from buffering the stream
+    return response
+
+async def events():
+    # Ends after DASHBOARD_STREAM_SECONDS; the browser reconnects on its own, which also re-checks the session
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.DASHBOARD_STREAM_SECONDS
+    last_version, last_sent = None, loop.time()
+    yield f'retry: {settings.DASHBOARD_POLL_SECONDS * 1000}\n\n'
+    while loop.time() < deadline:
+        version, snapshot = await sync_to_async(live_feed.current)()
+        if version != last_version:
+            yield f'id: {version}\nevent: overview\ndata: {json.dumps(snapshot)}\n\n'
+            last_version, last_sent = version, loop.time()
+        elif loop.time() - last_sent >= HEARTBEAT_SECONDS:
+            yield ': keep-alive\n\n'
+            last_sent = loop.time()
+        await live_feed.wait(settings.DASHBOARD_FEED_INTERVAL)
@@ -48,6 +48,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.instrumentation.InstrumentationMiddleware', # Removes itself unless INSTRUMENTATION_ENABLED is set
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -93,6 +94,20 @@ DATABASES = {
     }
 }
 
+# Cache shared by all worker processes (cached reports, room inventory, versions of cached data).
+# Without REDIS_URL each process falls back to its own in-memory cache.
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+
+
+# Django's ModelBackend, with password hashing moved to a bounded pool (see core.authentication)
+AUTHENTICATION_BACKENDS = ['core.authentication.PooledHashingBackend']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -139,9 +154,115 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 REST_FRAMEWORK = {
     'EXCEPTION_HANDLER': 'core.exceptions.custom_exception_handler',
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'core.authentication.CachedJWTAuthentication',
     ),
+    'DEFAULT_PAGINATION_CLASS': 'core.pagination.KeysetPagination',
+    'PAGE_SIZE': 100,
+}
+
+SIMPLE_JWT = {
+    'TOKEN_OBTAIN_SERIALIZER': 'core.serializers.RoleTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'core.serializers.RoleTokenRefreshSerializer',
 }
 
 STRIPE_SECRET_KEY = os.getenv('STRIPE_SECRET_KEY')
 STRIPE_PUBLISHABLE_KEY = os.getenv('STRIPE_PUBLISHABLE_KEY')
+# Payment gateway (core.payments): API base override (a local fake server for benchmarks), connect and read
+# timeouts in seconds, retries of failed calls, and keep-alive connections kept open to Stripe per process
+STRIPE_API_BASE = os.getenv('STRIPE_API_BASE')
+STRIPE_CONNECT_TIMEOUT = float(os.getenv('STRIPE_CONNECT_TIMEOUT', 5))
+STRIPE_READ_TIMEOUT = float(os.getenv('STRIPE_READ_TIMEOUT', 20))
+STRIPE_MAX_NETWORK_RETRIES = int(os.getenv('STRIPE_MAX_NETWORK_RETRIES', 2))
+STRIPE_POOL_SIZE = int(os.getenv('STRIPE_POOL_SIZE', 20))
+
+# Seconds a guest demographics report stays cached; guest and booking writes invalidate it sooner
+GUEST_DEMOGRAPHICS_CACHE_TIMEOUT = int(os.getenv('GUEST_DEMOGRAPHICS_CACHE_TIMEOUT', 300))
+
+# Process-local cache of resolved user roles (see core.roles): number of users kept, and seconds an entry may live
+ROLE_CACHE_SIZE = int(os.getenv('ROLE_CACHE_SIZE', 10000))
+ROLE_CACHE_TIMEOUT = int(os.getenv('ROLE_CACHE_TIMEOUT', 60))
+
+# Verified access tokens (see core.authentication): tokens kept per process, and seconds before one is verified
+# again, which is also how long a revoked token may still be accepted by other processes
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv('AUTH_TOKEN_CACHE_SIZE', 10000))
+AUTH_TOKEN_CACHE_TIMEOUT = int(os.getenv('AUTH_TOKEN_CACHE_TIMEOUT', 30))
+
+# Password hashing pool (see core.authentication): threads hashing at once, one per core by default, and how many
+# more sign-ins may wait for one before the rest are answered 503
+PASSWORD_HASHING_WORKERS = int(os.getenv('PASSWORD_HASHING_WORKERS', os.cpu_count() or 1))
+PASSWORD_HASHING_QUEUE = int(os.getenv('PASSWORD_HASHING_QUEUE', 64))
+
+# Login and registration rate limit per client (see core.throttling): sustained requests per minute, requests
+# allowed in a burst, and clients remembered per process
+AUTH_THROTTLE_RATE = int(os.getenv('AUTH_THROTTLE_RATE', 10))
+AUTH_THROTTLE_BURST = int(os.getenv('AUTH_THROTTLE_BURST', 5))
+AUTH_THROTTLE_CLIENTS = int(os.getenv('AUTH_THROTTLE_CLIENTS', 10000))
+
+# Room inventory cache (see core.inventory): entries kept per process, and seconds an entry may live in the
+# shared cache; room writes invalidate it sooner
+ROOM_CACHE_SIZE = int(os.getenv('ROOM_CACHE_SIZE', 1000))
+ROOM_CACHE_TIMEOUT = int(os.getenv('ROOM_CACHE_TIMEOUT', 3600))
+
+# Rate plans and rate calendars (see core.pricing): entries kept per process, and seconds they may live in the
+# shared cache; rate plan writes invalidate them sooner
+RATE_CACHE_SIZE = int(os.getenv('RATE_CACHE_SIZE', 100))
+RATE_CACHE_TIMEOUT = int(os.getenv('RATE_CACHE_TIMEOUT', 86400))
+
+# Room search responses (see core.search): entries kept per process, and seconds they may live in the shared
+# cache; bookings, room and rate plan writes invalidate the affected ones sooner
+SEARCH_CACHE_SIZE = int(os.getenv('SEARCH_CACHE_SIZE', 1000))
+SEARCH_CACHE_TIMEOUT = int(os.getenv('SEARCH_CACHE_TIMEOUT', 300))
+
+# Live dashboard feed (see core.live): seconds between checks for changes made by other processes, seconds the
+# figures may live in the shared cache (writes replace them sooner), seconds a server-sent event stream stays
+# open before the browser reconnects, and seconds between polls of dashboards that cannot stream
+DASHBOARD_FEED_INTERVAL = float(os.getenv('DASHBOARD_FEED_INTERVAL', 1))
+DASHBOARD_SNAPSHOT_TIMEOUT = int(os.getenv('DASHBOARD_SNAPSHOT_TIMEOUT', 300))
+DASHBOARD_STREAM_SECONDS = int(os.getenv('DASHBOARD_STREAM_SECONDS', 300))
+DASHBOARD_POLL_SECONDS = int(os.getenv('DASHBOARD_POLL_SECONDS', 10))
+
+# Background jobs (core.outbox): run them inside the request instead of by `manage.py process_outbox`, and
+# how many times a failing job is retried before it is marked failed
+OUTBOX_INLINE = os.getenv('OUTBOX_INLINE', '') == '1'
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', 5))
+
+# Booking event log (see core.events): seconds an event is left alone before consumers read it, which must be
+# longer than any transaction writing booking events
+BOOKING_EVENT_SETTLE_SECONDS = float(os.getenv('BOOKING_EVENT_SETTLE_SECONDS', 5))
+
+# Archival (core.archive): closed stays that checked out more than this many days ago are moved to the compressed,
+# month-partitioned archive by archive_bookings
+BOOKING_RETENTION_DAYS = int(os.getenv('BOOKING_RETENTION_DAYS', 730))
+
+# Request instrumentation (core.instrumentation): per-view timing, SQL and serializer counters, logged as JSON and
+# served at /api/metrics/ for Prometheus. Off unless enabled. Requests slower than INSTRUMENTATION_SLOW_MS are
+# logged as warnings, and a random INSTRUMENTATION_PROFILE_RATE share of requests (0 to 1) runs under cProfile,
+# keeping the profiles of slow ones (written to INSTRUMENTATION_PROFILE_DIR, if set). A query shape repeated
+# INSTRUMENTATION_DUPLICATE_THRESHOLD times in one request is reported as a likely N+1.
+INSTRUMENTATION_ENABLED = os.getenv('INSTRUMENTATION_ENABLED', '') == '1'
+INSTRUMENTATION_SLOW_MS = float(os.getenv('INSTRUMENTATION_SLOW_MS', 500))
+INSTRUMENTATION_PROFILE_RATE = float(os.getenv('INSTRUMENTATION_PROFILE_RATE', 0.01))
+INSTRUMENTATION_PROFILE_DIR = os.getenv('INSTRUMENTATION_PROFILE_DIR')
+INSTRUMENTATION_DUPLICATE_THRESHOLD = int(os.getenv('INSTRUMENTATION_DUPLICATE_THRESHOLD', 5))
+# Bearer token Prometheus must send to scrape /api/metrics/; leave unset to restrict access at the proxy instead
+INSTRUMENTATION_METRICS_TOKEN = os.getenv('INSTRUMENTATION_METRICS_TOKEN')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'message': {'format': '%(message)s'},
+    },
+    'handlers': {
+        'instrumentation': {'class': 'logging.StreamHandler', 'formatter': 'message'},
+    },
+    'loggers': {
+        # One JSON object per line, for the log shipper. At WARNING only slow requests and likely N+1 queries are
+        # logged; INFO logs every request, at a cost of tens of microseconds each
+        'core.instrumentation': {
+            'handlers': ['instrumentation'],
+            'level': os.getenv('INSTRUMENTATION_LOG_LEVEL', 'WARNING'),
+            'propagate': False,
+        },
+    },
+}